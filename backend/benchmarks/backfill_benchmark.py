@@ -0,0 +1,59 @@
+"""
+Benchmark for the historical backfill run when a ticker is first added.
+Times StockDataGenerator.initialize_stock_data (365 bars per instrument)
+against a throwaway SQLite database.
+
+Usage (from the backend directory):
+    python benchmarks/backfill_benchmark.py --instruments 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Point the app at a throwaway database before any app module is imported
+_db_dir = tempfile.mkdtemp(prefix="marketpulse-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from database import SessionLocal, engine, Base
+from models import Instrument
+from services.data_generator import data_generator
+
+async def run(instrument_count: int):
+    Base.metadata.create_all(bind=engine)
+    
+    db = SessionLocal()
+    try:
+        db.execute(insert(Instrument), [
+            {"ticker": f"B{i:05d}", "company_name": f"Backfill {i}"}
+            for i in range(instrument_count)
+        ])
+        db.commit()
+        instrument_ids = [row.id for row in db.query(Instrument.id).all()]
+    finally:
+        db.close()
+    
+    latencies = []
+    for instrument_id in instrument_ids:
+        started = time.perf_counter()
+        await data_generator.initialize_stock_data(instrument_id)
+        latencies.append((time.perf_counter() - started) * 1000)
+    
+    latencies.sort()
+    print(f"instruments: {instrument_count}")
+    print(f"mean ms:     {sum(latencies) / len(latencies):.2f}")
+    print(f"p50 ms:      {latencies[len(latencies) // 2]:.2f}")
+    print(f"max ms:      {latencies[-1]:.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the per-ticker historical backfill")
+    parser.add_argument("--instruments", type=int, default=50, help="Number of tickers to backfill")
+    args = parser.parse_args()
+    
+    import logging
+    logging.getLogger("services.data_generator").setLevel(logging.WARNING)
+    asyncio.run(run(args.instruments))
@@ -0,0 +1,86 @@
+"""
+Benchmark for the vectorized backtesting engine.
+Seeds a year of bars for a universe of tickers in a throwaway SQLite database, then times
+each strategy both cold (history read from the bar store in one query) and warm (history
+already in the price cache).
+
+Usage (from the backend directory):
+    python benchmarks/backtest_benchmark.py --tickers 500 --days 365
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Point the app at a throwaway database before any app module is imported
+_db_dir = tempfile.mkdtemp(prefix="marketpulse-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import insert
+from database import SessionLocal, engine, Base
+from models import Instrument
+from schemas import BacktestRequest
+from services.bar_store import bar_store
+from services.data_generator import simulate_history
+from services.price_cache import price_cache
+from services.backtest_service import backtest_service, STRATEGIES
+
+def run(ticker_count: int, days: int, repeats: int):
+    Base.metadata.create_all(bind=engine)
+    
+    rng = np.random.default_rng(42)
+    start_date = datetime.now() - timedelta(days=days)
+    dates = [start_date + timedelta(days=i) for i in range(days)]
+    tickers = [f"T{i:05d}" for i in range(ticker_count)]
+    
+    db = SessionLocal()
+    try:
+        db.execute(insert(Instrument), [
+            {"ticker": ticker, "company_name": f"Backtest {ticker}"}
+            for ticker in tickers
+        ])
+        db.commit()
+        for instrument_id, ticker in db.query(Instrument.id, Instrument.ticker).all():
+            bar_store.write_history(db, instrument_id, ticker, dates, simulate_history(rng.uniform(20, 500), days, rng))
+        db.commit()
+        
+        print(f"tickers:     {ticker_count}")
+        print(f"days:        {days}")
+        for strategy in STRATEGIES:
+            request = BacktestRequest(tickers=tickers, strategy=strategy, days=days, commission_bps=5)
+            
+            price_cache.buffers.clear()
+            started = time.perf_counter()
+            result = asyncio.run(backtest_service.run_backtest(request, db))
+            cold_ms = (time.perf_counter() - started) * 1000
+            assert result["success"], result.get("message")
+            
+            price_cache.load_from_db(db)
+            latencies = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                asyncio.run(backtest_service.run_backtest(request, db))
+                latencies.append((time.perf_counter() - started) * 1000)
+            latencies.sort()
+            
+            stats = result["stats"]
+            print(f"{strategy:<14} cold ms {cold_ms:>8.1f}   warm p50 ms {latencies[len(latencies) // 2]:>7.1f}   "
+                  f"trades {stats['trade_count']:>6}   return {stats['total_return_percent']:>7.2f}%")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark vectorized backtests over a ticker universe")
+    parser.add_argument("--tickers", type=int, default=500, help="Number of tickers in the universe")
+    parser.add_argument("--days", type=int, default=365, help="Bars of history per ticker")
+    parser.add_argument("--repeats", type=int, default=5, help="Warm runs per strategy")
+    args = parser.parse_args()
+    
+    import logging
+    logging.getLogger("services.price_cache").setLevel(logging.WARNING)
+    run(args.tickers, args.days, args.repeats)
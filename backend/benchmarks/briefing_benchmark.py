@@ -0,0 +1,100 @@
+"""
+Benchmark for AI briefing refresh storms.
+Fires many concurrent briefing requests for one watchlist against an in-script model
+stand-in with a fixed latency, then advances the bars one day per round and repeats. It reports how many
+model calls each round made; with the briefing cache this is one per data version.
+
+Usage (from the backend directory):
+    python benchmarks/briefing_benchmark.py --requests 200 --rounds 3 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# Point the app at a throwaway database before any app module is imported
+_db_dir = tempfile.mkdtemp(prefix="marketpulse-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import insert
+from database import SessionLocal, engine, Base
+from models import Instrument
+from services.ai_service import ai_service
+from services.bar_store import bar_store
+from services.briefing_cache import briefing_cache
+from services.data_generator import simulate_history, simulate_next_bars
+from services.price_cache import price_cache
+
+class SlowModel:
+    """Stand-in for the Gemini model: blocks for a fixed time and counts calls"""
+    
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        
+    def generate_content(self, prompt: str):
+        self.calls += 1
+        time.sleep(self.latency)
+        return SimpleNamespace(text="- Stand-in briefing line one\n- Stand-in briefing line two")
+
+async def run(request_count: int, rounds: int, latency: float, ticker_count: int):
+    Base.metadata.create_all(bind=engine)
+    
+    rng = np.random.default_rng(7)
+    start_date = datetime.now() - timedelta(days=365)
+    dates = [start_date + timedelta(days=i) for i in range(365)]
+    tickers = [f"BR{i:03d}" for i in range(ticker_count)]
+    
+    db = SessionLocal()
+    try:
+        db.execute(insert(Instrument), [
+            {"ticker": ticker, "company_name": f"Briefing {ticker}"}
+            for ticker in tickers
+        ])
+        db.commit()
+        instrument_ids = []
+        for instrument_id, ticker in db.query(Instrument.id, Instrument.ticker).all():
+            bar_store.write_history(db, instrument_id, ticker, dates, simulate_history(rng.uniform(20, 500), 365, rng))
+            instrument_ids.append(instrument_id)
+        db.commit()
+        price_cache.load_from_db(db)
+        
+        model = ai_service.model = SlowModel(latency)
+        watchlist = SimpleNamespace(id=1, name="Storm", stocks=[SimpleNamespace(ticker=ticker) for ticker in tickers])
+        
+        print(f"requests:    {request_count} concurrent per round, model latency {latency:.2f}s")
+        for round_number in range(1, rounds + 1):
+            calls_before = model.calls
+            started = time.perf_counter()
+            await asyncio.gather(*(ai_service.generate_daily_briefing(watchlist) for _ in range(request_count)))
+            elapsed = time.perf_counter() - started
+            print(f"round {round_number}:     {elapsed:6.2f}s   model calls {model.calls - calls_before:>4}   "
+                  f"hits {briefing_cache.hits:>5}   coalesced {briefing_cache.coalesced:>5}")
+                  
+            # A generator tick: one new bar per ticker, which moves the data version when it starts a new period
+            closes = np.array([price_cache.get_quote(ticker)["current_price"] for ticker in tickers])
+            bars = simulate_next_bars(closes, rng)
+            next_dates = [dates[-1] + timedelta(days=round_number)] * len(tickers)
+            bar_store.append_bars(db, instrument_ids, tickers, next_dates, bars)
+            db.commit()
+            price_cache.append_bars(tickers, next_dates, bars)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count model calls under concurrent AI briefing requests")
+    parser.add_argument("--requests", type=int, default=200, help="Concurrent requests per round")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds, each after a new bar")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds each model call takes")
+    parser.add_argument("--tickers", type=int, default=10, help="Tickers in the watchlist")
+    args = parser.parse_args()
+    
+    import logging
+    logging.getLogger("services.price_cache").setLevel(logging.WARNING)
+    asyncio.run(run(args.requests, args.rounds, args.latency, args.tickers))
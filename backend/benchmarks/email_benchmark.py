@@ -0,0 +1,150 @@
+"""
+Benchmark for outbound alert email delivery.
+Sends a burst of messages to a local SMTP stand-in (started in this script, with
+configurable handshake and per-message latency) two ways: the old inline path,
+which opens a blocking connection per email on the event loop, and the queued
+EmailService worker pool. Reports throughput and the worst event-loop stall.
+
+Usage (from the backend directory):
+    python benchmarks/email_benchmark.py --messages 200 --workers 4 --connect-ms 50 --message-ms 5
+"""
+import argparse
+import asyncio
+import os
+import smtplib
+import sys
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.email_service import email_service
+
+class StandInSmtpServer:
+    """Minimal SMTP server that accepts any login and message, with artificial latency"""
+    
+    def __init__(self, connect_delay: float, message_delay: float):
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.received = 0
+        self.connections = 0
+        self.loop = asyncio.new_event_loop()
+        self.port = None
+        
+    def start(self):
+        """Serve on a random local port from a background thread"""
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0), self.loop
+        ).result()
+        self.port = server.sockets[0].getsockname()[1]
+        
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        # Stands in for TCP + TLS + AUTH round trips to a remote server
+        await asyncio.sleep(self.connect_delay)
+        writer.write(b"220 stand-in ESMTP ready\r\n")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO"):
+                writer.write(b"250-stand-in\r\n250-AUTH PLAIN LOGIN\r\n250 SIZE 10485760\r\n")
+            elif command.startswith("AUTH"):
+                writer.write(b"235 2.7.0 Authentication successful\r\n")
+            elif command.startswith("DATA"):
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                while (await reader.readline()) not in (b".\r\n", b""):
+                    pass
+                await asyncio.sleep(self.message_delay)
+                self.received += 1
+                writer.write(b"250 2.0.0 Queued\r\n")
+            elif command.startswith("QUIT"):
+                writer.write(b"221 2.0.0 Bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        writer.close()
+
+def build_message(index: int) -> MIMEMultipart:
+    message = MIMEMultipart()
+    message['From'] = "alerts@marketpulse.test"
+    message['To'] = f"user{index}@marketpulse.test"
+    message['Subject'] = f"Price Alert: T{index:04d} - High Threshold Reached"
+    message.attach(MIMEText(f"<html><body><p>Alert {index}</p></body></html>", 'html'))
+    return message
+
+async def watch_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Largest delay seen between when the loop should have woken us and when it did"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+async def run_inline(port: int, count: int):
+    """The previous behaviour: one blocking connection per email, on the event loop"""
+    for index in range(count):
+        with smtplib.SMTP("127.0.0.1", port) as server:
+            server.login("bench", "bench")
+            server.send_message(build_message(index))
+        # The tick loop awaited between alerts, so other tasks ran only in these gaps
+        await asyncio.sleep(0)
+
+async def run_queued(count: int):
+    for index in range(count):
+        email_service.enqueue(build_message(index))
+    await email_service.queue.join()
+
+async def measure(label: str, work, server: StandInSmtpServer, count: int):
+    received_before = server.received
+    connections_before = server.connections
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop_lag(stop))
+    await asyncio.sleep(0)
+    
+    started = time.perf_counter()
+    await work
+    elapsed = time.perf_counter() - started
+    
+    stop.set()
+    worst_lag = await watcher
+    print(
+        f"{label:<8} {count:>8} {server.received - received_before:>9} "
+        f"{server.connections - connections_before:>12} {elapsed:>9.2f} "
+        f"{count / elapsed:>10.1f} {worst_lag * 1000:>14.1f}"
+    )
+
+async def main(args):
+    server = StandInSmtpServer(args.connect_ms / 1000, args.message_ms / 1000)
+    server.start()
+    
+    email_service.smtp_server = "127.0.0.1"
+    email_service.smtp_port = server.port
+    email_service.smtp_use_tls = False
+    email_service.email = "bench"
+    email_service.password = "bench"
+    email_service.worker_count = args.workers
+    email_service.batch_size = args.batch_size
+    email_service.queue_size = max(email_service.queue_size, args.messages)
+    
+    print(f"{'path':<8} {'messages':>8} {'delivered':>9} {'connections':>12} {'seconds':>9} {'msgs/sec':>10} {'max stall ms':>14}")
+    await measure("inline", run_inline(server.port, args.messages), server, args.messages)
+    await measure("queued", run_queued(args.messages), server, args.messages)
+    await email_service.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark alert email delivery against a local SMTP stand-in")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--connect-ms", type=float, default=50.0, help="Simulated connection and login latency")
+    parser.add_argument("--message-ms", type=float, default=5.0, help="Simulated per-message latency")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""
+Benchmark for the batch tick engine in StockDataGenerator.
+Seeds a throwaway SQLite database with N instruments (365 data points each)
+and reports per-tick timings for increasing instrument counts.
+
+Usage (from the backend directory):
+    python benchmarks/tick_benchmark.py --sizes 100 1000 5000 --ticks 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+# Point the app at a throwaway database before any app module is imported
+_db_dir = tempfile.mkdtemp(prefix="marketpulse-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from database import SessionLocal, engine, Base
+from models import User, Watchlist, Instrument, Stock, StockDataPoint
+from services.data_generator import data_generator, MAX_DATA_POINTS
+
+def seed(stock_count: int):
+    """Create one watchlist holding stock_count instruments with a full year of data"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    
+    db = SessionLocal()
+    try:
+        user = User(email="bench@example.com", hashed_password="x", full_name="Bench")
+        db.add(user)
+        db.flush()
+        watchlist = Watchlist(name="Bench", user_id=user.id)
+        db.add(watchlist)
+        db.flush()
+        
+        db.execute(insert(Instrument), [
+            {"ticker": f"T{i:05d}", "company_name": f"Ticker {i}"}
+            for i in range(stock_count)
+        ])
+        instruments = db.query(Instrument.id, Instrument.ticker, Instrument.company_name).all()
+        db.execute(insert(Stock), [
+            {
+                "ticker": instrument.ticker,
+                "company_name": instrument.company_name,
+                "watchlist_id": watchlist.id,
+                "instrument_id": instrument.id
+            }
+            for instrument in instruments
+        ])
+        
+        start_date = datetime.now() - timedelta(days=MAX_DATA_POINTS)
+        for instrument in instruments:
+            db.execute(insert(StockDataPoint), [
+                {
+                    "instrument_id": instrument.id,
+                    "date": start_date + timedelta(days=day),
+                    "open": 100.0,
+                    "high": 101.0,
+                    "low": 99.0,
+                    "close": 100.0,
+                    "volume": 1_000_000
+                }
+                for day in range(MAX_DATA_POINTS)
+            ])
+        db.commit()
+    finally:
+        db.close()
+
+async def run(sizes, ticks):
+    print(f"{'stocks':>8} {'tick ms':>10} {'load':>8} {'simulate':>9} {'insert':>8} {'prune':>8} {'commit':>8}")
+    for size in sizes:
+        seed(size)
+        data_generator.last_prices.clear()
+        
+        totals = {}
+        for _ in range(ticks):
+            await data_generator._generate_data_for_all_stocks()
+            for phase, ms in data_generator.last_tick_stats["timings_ms"].items():
+                totals[phase] = totals.get(phase, 0.0) + ms
+        
+        avg = {phase: total / ticks for phase, total in totals.items()}
+        print(
+            f"{size:>8} {avg['total']:>10.1f} {avg['load']:>8.1f} {avg['simulate']:>9.1f} "
+            f"{avg['insert']:>8.1f} {avg['prune']:>8.1f} {avg['commit']:>8.1f}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the batch tick engine")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000], help="Stock counts to benchmark")
+    parser.add_argument("--ticks", type=int, default=5, help="Ticks to average per size")
+    args = parser.parse_args()
+    
+    import logging
+    logging.getLogger("services.data_generator").setLevel(logging.WARNING)
+    asyncio.run(run(args.sizes, args.ticks))
@@ -1,37 +1,142 @@
 """
-Script to initialize historical data for all existing stocks in the database.
-Run this once to populate the database with 365 days of data for each stock.
+Script to initialize historical data for all existing instruments in the database.
+Populates 365 days of data for every ticker that has none yet, splitting the
+work into batches that run in parallel across a process pool.
+
+Each batch commits on its own, and instruments that already have data are
+skipped, so an interrupted run can simply be started again to resume.
+
+SQLite allows only one writer at a time, so with the SQL bar store on SQLite the
+workers only simulate the series and the parent process writes every batch.
+
+Usage:
+    python init_stock_data.py                      # one worker per CPU, 200 per batch
+    python init_stock_data.py --workers 8 --batch-size 500
 """
-import asyncio
-from database import SessionLocal
-from models import Stock
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from database import SessionLocal, engine
+from migrations import run_migrations
+from services.bar_store import bar_store, MAX_DATA_POINTS
 from services.data_generator import data_generator
 
-async def initialize_all_stocks():
-    """Initialize data for all existing stocks"""
+def _init_worker():
+    """Prepare a freshly started worker process"""
+    # Connections pooled by the parent must not be shared across processes
+    engine.dispose(close=False)
+    # Forked workers inherit the parent's generator state; reseed so series differ
+    data_generator.rng = np.random.default_rng()
+
+def backfill_batch(batch: List[Tuple[int, str]]) -> int:
+    """Backfill one batch of instruments in a single transaction; returns how many were written"""
     db = SessionLocal()
     try:
-        # Get all stocks
-        stocks = db.query(Stock).all()
-        print(f"Found {len(stocks)} stocks in database")
-        
-        if not stocks:
-            print("No stocks found. Add stocks to watchlists first.")
-            return
+        written = 0
+        for instrument_id, ticker in batch:
+            if data_generator.backfill_history(db, instrument_id, ticker) is not None:
+                written += 1
+        db.commit()
+        bar_store.flush()
+        return written
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def generate_batch(batch: List[Tuple[int, str]]) -> List[Tuple[int, str, List[datetime], Dict[str, np.ndarray]]]:
+    """Simulate a batch of histories without touching the database; the parent writes them"""
+    generated = []
+    for instrument_id, ticker in batch:
+        dates, bars, _ = data_generator.generate_history()
+        generated.append((instrument_id, ticker, dates, bars))
+    return generated
+
+def write_batch(generated: List[Tuple[int, str, List[datetime], Dict[str, np.ndarray]]]) -> int:
+    """Store a batch simulated by generate_batch in a single transaction; returns how many were written"""
+    db = SessionLocal()
+    try:
+        written = 0
+        for instrument_id, ticker, dates, bars in generated:
+            # Skip anything that gained data since the pending list was read
+            if bar_store.count_bars(db, instrument_id, ticker) == 0:
+                bar_store.write_history(db, instrument_id, ticker, dates, bars)
+                written += 1
+        db.commit()
+        return written
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def initialize_all_stocks(workers: int, batch_size: int):
+    """Initialize data for all instruments that do not have any yet"""
+    # Older databases may predate the instruments table
+    run_migrations(engine)
+    
+    db = SessionLocal()
+    try:
+        # Resume support: anything committed by an earlier run is skipped here
+        pending = bar_store.instruments_without_history(db)
+    finally:
+        db.close()
         
-        for stock in stocks:
-            print(f"Initializing data for {stock.ticker}...")
-            await data_generator.initialize_stock_data(stock.id)
-            print(f"✓ Completed {stock.ticker}")
+    print(f"Found {len(pending)} instruments without data")
+    
+    if not pending:
+        print("Nothing to do. Add stocks to watchlists first, or all data is already initialized.")
+        return
         
-        print(f"\n✓ Successfully initialized data for all {len(stocks)} stocks")
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    single_writer = bar_store.name == "sql" and engine.dialect.name == "sqlite"
+    print(f"Backfilling in {len(batches)} batches of up to {batch_size} using {workers} workers"
+          f"{' (writes from this process only)' if single_writer else ''}\n")
+    
+    started = time.perf_counter()
+    completed = 0
+    written = 0
+    failed_batches = 0
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        task = generate_batch if single_writer else backfill_batch
+        futures = {executor.submit(task, batch): batch for batch in batches}
         
-    except Exception as e:
-        print(f"Error: {e}")
-    finally:
-        db.close()
+        for future in as_completed(futures):
+            batch = futures[future]
+            completed += len(batch)
+            try:
+                written += write_batch(future.result()) if single_writer else future.result()
+            except Exception as e:
+                failed_batches += 1
+                print(f"✗ Batch starting at {batch[0][1]} failed: {e}")
+                
+            elapsed = time.perf_counter() - started
+            rate = completed / elapsed if elapsed > 0 else 0
+            remaining = (len(pending) - completed) / rate if rate > 0 else 0
+            print(
+                f"[{completed}/{len(pending)}] {completed * 100 / len(pending):5.1f}% "
+                f"{rate:8.1f} instruments/s {rate * MAX_DATA_POINTS:10.0f} bars/s "
+                f"ETA {remaining:6.1f}s"
+            )
+            
+    elapsed = time.perf_counter() - started
+    print(f"\n✓ Initialized data for {written} instruments in {elapsed:.1f}s")
+    if failed_batches:
+        print(f"✗ {failed_batches} batches failed; run the script again to retry them")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Initialize historical price data for all instruments")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--batch-size", type=int, default=200, help="Instruments backfilled per transaction")
+    args = parser.parse_args()
+    
     print("=== Stock Data Initialization ===\n")
-    asyncio.run(initialize_all_stocks())
-
+    initialize_all_stocks(max(1, args.workers), max(1, args.batch_size))
@@ -1,12 +1,15 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session, joinedload  # <-- IMPORTED joinedload
-from typing import List  # <-- IMPORTED List
+from typing import List, Optional  # <-- IMPORTED List
 import uvicorn
 import asyncio
+import json
+from datetime import datetime
 
-from database import get_db, engine, Base
+from database import get_db, engine, SessionLocal
+from migrations import run_migrations
 from models import User, Watchlist, Stock, PriceAlert, PaperAccount, PaperPosition, PaperTrade
 from schemas import (  # <-- UPDATED IMPORTS
     UserCreate, 
@@ -19,16 +22,29 @@ from schemas import (  # <-- UPDATED IMPORTS
     PriceAlertUpdate,
     PriceAlert as PriceAlertSchema,
     PaperOrderRequest,
+    PaperBasketOrderRequest,
     PaperPortfolioSummary,
-    PaperTrade as PaperTradeSchema
+    PaperTrade as PaperTradeSchema,
+    PaperOrder as PaperOrderSchema,
+    BacktestRequest
 )
 from auth import create_access_token, verify_token, get_password_hash, verify_password
 from services import stock_service, ai_service
+from services.bar_store import TICKER_PATTERN
 from services.data_generator import data_generator
+from services.price_cache import price_cache
+from services.price_stream import price_stream
+from services.alert_index import alert_index
+from services.order_book import order_book
+from services.email_service import email_service
+from services.notification_dispatcher import notification_dispatcher
 from services.paper_trading_service import paper_trading_service
+from services.backtest_service import backtest_service
+from services.risk_service import risk_service
+from services.equity_curve import equity_curve
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables and upgrade existing ones
+run_migrations(engine)
 
 app = FastAPI(
     title="MarketPulse AI API",
@@ -58,13 +74,25 @@ security = HTTPBearer()
 # Startup and shutdown events for background task
 @app.on_event("startup")
 async def startup_event():
-    """Start the background data generator"""
+    """Warm the in-memory price cache, alert index, order book and paper valuations, then start the data generator and notification dispatcher"""
+    db = SessionLocal()
+    try:
+        price_cache.load_from_db(db)
+        alert_index.load_from_db(db)
+        order_book.load_from_db(db)
+        await paper_trading_service.seed_all_valuations(db)
+    finally:
+        db.close()
+    
     asyncio.create_task(data_generator.start())
+    asyncio.create_task(notification_dispatcher.start())
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Stop the background data generator"""
+    """Stop the background data generator and notification delivery"""
     await data_generator.stop()
+    await notification_dispatcher.stop()
+    await email_service.stop()
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
     """Get current authenticated user"""
@@ -262,6 +290,13 @@ async def add_stock_to_watchlist(watchlist_id: int, stock_data: StockCreate, cur
             detail="Watchlist not found"
         )
     
+    # The ticker names shared price history (and a bar file with the mmap store)
+    if not TICKER_PATTERN.fullmatch(stock_data.ticker.upper()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ticker may only contain letters, digits, '.', '-', '^' and '='"
+        )
+    
     # Check if stock already exists in watchlist
     existing_stock = db.query(Stock).filter(
         Stock.watchlist_id == watchlist_id,
@@ -274,18 +309,26 @@ async def add_stock_to_watchlist(watchlist_id: int, stock_data: StockCreate, cur
             detail="Stock already in watchlist"
         )
     
+    # Resolve the shared instrument that holds this ticker's price history
+    instrument = stock_service.get_or_create_instrument(
+        stock_data.ticker.upper(),
+        stock_data.company_name,
+        db
+    )
+    
     # Create new stock entry
     stock = Stock(
         ticker=stock_data.ticker.upper(),
         company_name=stock_data.company_name,
-        watchlist_id=watchlist_id
+        watchlist_id=watchlist_id,
+        instrument_id=instrument.id
     )
     db.add(stock)
     db.commit()
     db.refresh(stock)
     
-    # Initialize historical data for the newly added stock
-    await data_generator.initialize_stock_data(stock.id)
+    # Initialize historical data the first time a ticker is added anywhere
+    await data_generator.initialize_stock_data(instrument.id)
     
     return stock
 
@@ -319,6 +362,32 @@ async def remove_stock_from_watchlist(watchlist_id: int, stock_id: int, current_
     db.commit()
     return {"message": "Stock removed from watchlist"}
 
+# Upper bound on tickers per batch quote request
+MAX_QUOTE_TICKERS = 200
+
+@app.get("/api/stocks/quotes")
+async def get_stock_quotes(tickers: str, db: Session = Depends(get_db)):
+    """Get current stock data for a comma-separated list of tickers in one request"""
+    requested = [ticker for ticker in tickers.split(",") if ticker.strip()]
+    if not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one ticker is required"
+        )
+    if len(requested) > MAX_QUOTE_TICKERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_QUOTE_TICKERS} tickers can be requested at once"
+        )
+    
+    try:
+        return await stock_service.get_quotes(requested, db)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Error fetching stock quotes: {str(e)}"
+        )
+
 @app.get("/api/stocks/{ticker}/data")
 async def get_stock_data(ticker: str, db: Session = Depends(get_db)):
     """Get current stock data for a ticker from database"""
@@ -332,10 +401,10 @@ async def get_stock_data(ticker: str, db: Session = Depends(get_db)):
         )
 
 @app.get("/api/stocks/{ticker}/chart")
-async def get_stock_chart(ticker: str, period: str = "1M", db: Session = Depends(get_db)):
-    """Get stock chart data for a ticker from database"""
+async def get_stock_chart(ticker: str, period: str = "1M", resolution: str = "day", db: Session = Depends(get_db)):
+    """Get stock chart data for a ticker from database; resolution is day, week or month"""
     try:
-        chart_data = await stock_service.get_stock_chart(ticker.upper(), period, db)
+        chart_data = await stock_service.get_stock_chart(ticker.upper(), period, db, resolution)
         return chart_data
     except Exception as e:
         raise HTTPException(
@@ -343,6 +412,72 @@ async def get_stock_chart(ticker: str, period: str = "1M", db: Session = Depends
             detail=f"Error fetching chart data: {str(e)}"
         )
 
+# Upper bound on tickers one price stream connection can follow
+MAX_STREAM_TICKERS = 200
+
+@app.websocket("/ws/prices")
+async def stream_prices(websocket: WebSocket, token: str, tickers: str = ""):
+    """
+    Stream live quotes for subscribed tickers.
+    Authenticate with ?token=<access token>; optionally subscribe up front with ?tickers=AAPL,MSFT.
+    Then send {"action": "subscribe" | "unsubscribe", "tickers": [...]} to change the set.
+    Each generator tick arrives as {"type": "prices", "data": [quote, ...]}. Bad messages get
+    {"type": "error", "detail": ...} and leave the connection open.
+    """
+    user_id = verify_token(token)
+    db = SessionLocal()
+    try:
+        user_exists = user_id is not None and db.query(User.id).filter(User.id == user_id).first() is not None
+    finally:
+        db.close()
+    if not user_exists:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    subscription = price_stream.connect()
+    
+    async def send_updates():
+        while True:
+            await websocket.send_json(await subscription.next_message())
+    
+    async def subscribe(requested):
+        following = subscription.tickers | {ticker.upper() for ticker in requested}
+        if len(following) > MAX_STREAM_TICKERS:
+            await websocket.send_json({"type": "error", "detail": f"A connection can follow at most {MAX_STREAM_TICKERS} tickers"})
+            return
+        await websocket.send_json({"type": "snapshot", "data": price_stream.subscribe(subscription, requested)})
+    
+    sender = asyncio.create_task(send_updates())
+    try:
+        initial = [ticker.strip() for ticker in tickers.split(",") if ticker.strip()]
+        if initial:
+            await subscribe(initial)
+        
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                message = None
+            if not isinstance(message, dict) or not isinstance(message.get("tickers", []), list):
+                await websocket.send_json({"type": "error", "detail": "expected {\"action\": ..., \"tickers\": [...]}"})
+                continue
+            
+            requested = [str(ticker).strip() for ticker in message.get("tickers", []) if str(ticker).strip()]
+            if message.get("action") == "subscribe":
+                await subscribe(requested)
+            elif message.get("action") == "unsubscribe":
+                price_stream.unsubscribe(subscription, requested)
+            else:
+                await websocket.send_json({"type": "error", "detail": "action must be 'subscribe' or 'unsubscribe'"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        # Collect the sender's outcome (cancelled, or a failed send) so it is never left unretrieved
+        await asyncio.gather(sender, return_exceptions=True)
+        price_stream.disconnect(subscription)
+
 @app.get("/api/ai-briefing")
 async def get_ai_briefing(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Get AI daily briefing for user's primary watchlist"""
@@ -398,6 +533,7 @@ async def create_price_alert(
         db.add(price_alert)
         db.commit()
         db.refresh(price_alert)
+        alert_index.sync(price_alert)
         
         return price_alert
     except Exception as e:
@@ -465,6 +601,7 @@ async def update_price_alert(
         
         db.commit()
         db.refresh(price_alert)
+        alert_index.sync(price_alert)
         
         return price_alert
     except HTTPException:
@@ -497,6 +634,7 @@ async def delete_price_alert(
         
         db.delete(price_alert)
         db.commit()
+        alert_index.remove(alert_id)
         
         return {"message": "Price alert deleted successfully"}
     except HTTPException:
@@ -509,6 +647,14 @@ async def delete_price_alert(
         )
 
 # Paper Trading Endpoints
+
+# Upper bound on trades per history page
+MAX_TRADE_PAGE_SIZE = 200
+# Upper bound on points per equity curve response
+MAX_EQUITY_CURVE_POINTS = 1000
+# Upper bound on accounts per leaderboard page
+MAX_LEADERBOARD_PAGE_SIZE = 100
+
 @app.get("/api/v1/paper/portfolio")
 async def get_paper_portfolio(
     current_user: User = Depends(get_current_user),
@@ -524,6 +670,112 @@ async def get_paper_portfolio(
             detail=f"Error fetching portfolio: {str(e)}"
         )
 
+@app.get("/api/v1/paper/risk")
+async def get_paper_portfolio_risk(
+    confidence: float = 0.95,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get paper portfolio volatility, beta, one-day historical VaR/CVaR and max drawdown"""
+    try:
+        result = await risk_service.get_portfolio_risk(current_user.id, db, confidence)
+        if not result["success"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=result["message"]
+            )
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error computing portfolio risk: {str(e)}"
+        )
+
+@app.get("/api/v1/paper/equity-curve")
+async def get_paper_equity_curve(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = 200,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the paper account's recorded total value over time, downsampled to at most `points` points"""
+    if points < 1 or points > MAX_EQUITY_CURVE_POINTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"points must be between 1 and {MAX_EQUITY_CURVE_POINTS}"
+        )
+    # Snapshot times are stored as naive local time
+    if start is not None and start.tzinfo is not None:
+        start = start.astimezone().replace(tzinfo=None)
+    if end is not None and end.tzinfo is not None:
+        end = end.astimezone().replace(tzinfo=None)
+    
+    try:
+        paper_account = await paper_trading_service.get_or_create_paper_account(current_user.id, db)
+        return {"points": equity_curve.get_curve(db, paper_account.id, start, end, points)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching equity curve: {str(e)}"
+        )
+
+@app.get("/api/v1/paper/leaderboard")
+async def get_paper_leaderboard(
+    limit: int = 10,
+    offset: int = 0,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get paper accounts ranked by return, plus the current user's rank"""
+    if limit < 1 or limit > MAX_LEADERBOARD_PAGE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"limit must be between 1 and {MAX_LEADERBOARD_PAGE_SIZE}"
+        )
+    if offset < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="offset cannot be negative"
+        )
+    
+    try:
+        return await paper_trading_service.get_leaderboard(current_user.id, db, limit, offset)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching leaderboard: {str(e)}"
+        )
+
+@app.get("/api/v1/paper/portfolio/history")
+async def get_paper_portfolio_as_of(
+    as_of: datetime,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the paper trading cash and positions as they were at a past time"""
+    # Ledger times are stored as naive local time
+    if as_of.tzinfo is not None:
+        as_of = as_of.astimezone().replace(tzinfo=None)
+    
+    try:
+        state = await paper_trading_service.get_portfolio_as_of(current_user.id, as_of, db)
+        if state is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No paper trading history recorded at that time"
+            )
+        return state
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error rebuilding portfolio history: {str(e)}"
+        )
+
 @app.post("/api/v1/paper/buy")
 async def execute_paper_buy_order(
     order: PaperOrderRequest,
@@ -573,19 +825,102 @@ async def execute_paper_sell_order(
 @app.get("/api/v1/paper/trades")
 async def get_paper_trade_history(
     limit: int = 50,
+    cursor: Optional[int] = None,
+    ticker: Optional[str] = None,
+    side: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get paper trading trade history"""
+    """Get one page of paper trading trade history; pass next_cursor back as cursor for the next page"""
+    if limit < 1 or limit > MAX_TRADE_PAGE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"limit must be between 1 and {MAX_TRADE_PAGE_SIZE}"
+        )
+    if side is not None and side not in ("buy", "sell"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="side must be buy or sell"
+        )
+    
     try:
-        trades = await paper_trading_service.get_trade_history(current_user.id, db, limit)
-        return {"trades": trades}
+        trades, next_cursor = await paper_trading_service.get_trade_history(current_user.id, db, limit, cursor, ticker, side)
+        return {"trades": trades, "next_cursor": next_cursor}
+    except ValueError as e:
+        # Stale or foreign cursors
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error fetching trade history: {str(e)}"
         )
 
+@app.post("/api/v1/paper/orders/batch")
+async def execute_paper_basket_order(
+    basket: PaperBasketOrderRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Execute many paper trading market orders in one transaction (all_or_nothing or best_effort)"""
+    try:
+        result = await paper_trading_service.execute_basket_order(current_user.id, basket, db)
+        if not result["success"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=result["message"]
+            )
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error executing basket order: {str(e)}"
+        )
+
+@app.get("/api/v1/paper/orders")
+async def get_paper_orders(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    limit: int = 50,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get paper trading orders, e.g. ?status=open for the resting ones"""
+    try:
+        orders = await paper_trading_service.get_orders(current_user.id, db, status_filter, limit)
+        return {"orders": [PaperOrderSchema.model_validate(order) for order in orders]}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching orders: {str(e)}"
+        )
+
+@app.delete("/api/v1/paper/orders/{order_id}")
+async def cancel_paper_order(
+    order_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Cancel a resting paper trading order"""
+    try:
+        result = await paper_trading_service.cancel_order(current_user.id, order_id, db)
+        if not result["success"]:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND if result["message"] == "Order not found" else status.HTTP_400_BAD_REQUEST,
+                detail=result["message"]
+            )
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error cancelling order: {str(e)}"
+        )
+
 @app.post("/api/v1/paper/reset")
 async def reset_paper_account(
     current_user: User = Depends(get_current_user),
@@ -608,5 +943,28 @@ async def reset_paper_account(
             detail=f"Error resetting account: {str(e)}"
         )
 
+@app.post("/api/v1/paper/backtest")
+async def run_backtest(
+    backtest: BacktestRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Backtest a strategy over stored price history (sma_crossover, threshold or rebalance)"""
+    try:
+        result = await backtest_service.run_backtest(backtest, db)
+        if not result["success"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=result["message"]
+            )
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error running backtest: {str(e)}"
+        )
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Schema setup and in-place upgrades for databases created by older versions.
+create_all only creates missing tables, so any change to an existing table
+(new columns, new indexes, moved data) is applied here. Every step checks
+the current schema first, so running this on each startup is safe.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, text
+from database import Base
+import models  # noqa: F401 - registers all tables on Base.metadata
+
+logger = logging.getLogger(__name__)
+
+LEGACY_DATA_POINTS_TABLE = "stock_data_points_legacy"
+
+def run_migrations(engine):
+    """Create missing tables and upgrade an existing database to the current schema"""
+    _detach_per_stock_data_points(engine)
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns(engine)
+    _create_missing_indexes(engine)
+    _migrate_to_instruments(engine)
+    _snapshot_accounts_without_ledger(engine)
+
+def _detach_per_stock_data_points(engine):
+    """
+    Rename the old per-watchlist-stock price table out of the way so
+    create_all can build the per-instrument one under the same name.
+    """
+    inspector = inspect(engine)
+    if "stock_data_points" not in inspector.get_table_names():
+        return
+    columns = {column["name"] for column in inspector.get_columns("stock_data_points")}
+    if "stock_id" not in columns:
+        return
+
+    logger.info("Detaching per-stock price history for migration to instruments")
+    index_names = [index["name"] for index in inspector.get_indexes("stock_data_points")]
+    primary_key_name = inspector.get_pk_constraint("stock_data_points").get("name")
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE stock_data_points RENAME TO {LEGACY_DATA_POINTS_TABLE}"))
+        # Index names are schema-wide, so free them up for the new table
+        for name in index_names:
+            conn.execute(text(f"DROP INDEX {name}"))
+        if primary_key_name and engine.dialect.name != "sqlite":
+            conn.execute(text(f"ALTER INDEX {primary_key_name} RENAME TO {LEGACY_DATA_POINTS_TABLE}_pkey"))
+
+def _add_missing_columns(engine):
+    """Add columns introduced after a table was first created"""
+    inspector = inspect(engine)
+    stock_columns = {column["name"] for column in inspector.get_columns("stocks")}
+    account_columns = {column["name"] for column in inspector.get_columns("paper_accounts")}
+    position_columns = {column["name"] for column in inspector.get_columns("paper_positions")}
+    order_columns = {column["name"] for column in inspector.get_columns("paper_orders")}
+
+    with engine.begin() as conn:
+        if "instrument_id" not in stock_columns:
+            conn.execute(text("ALTER TABLE stocks ADD COLUMN instrument_id INTEGER REFERENCES instruments(id)"))
+        if "version" not in account_columns:
+            conn.execute(text("ALTER TABLE paper_accounts ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+        if "ledger_sequence" not in account_columns:
+            conn.execute(text("ALTER TABLE paper_accounts ADD COLUMN ledger_sequence INTEGER NOT NULL DEFAULT 0"))
+        if "version" not in position_columns:
+            conn.execute(text("ALTER TABLE paper_positions ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+        if "version" not in order_columns:
+            conn.execute(text("ALTER TABLE paper_orders ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+def _create_missing_indexes(engine):
+    """create_all only builds indexes for new tables, so add newer ones to existing tables"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def _migrate_to_instruments(engine):
+    """Give every watchlist stock a shared instrument and move legacy price history onto it"""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO instruments (ticker, company_name)
+            SELECT ticker, MAX(company_name) FROM stocks
+            WHERE ticker NOT IN (SELECT ticker FROM instruments)
+            GROUP BY ticker
+        """))
+        conn.execute(text("""
+            UPDATE stocks
+            SET instrument_id = (SELECT instruments.id FROM instruments WHERE instruments.ticker = stocks.ticker)
+            WHERE instrument_id IS NULL
+        """))
+
+        if LEGACY_DATA_POINTS_TABLE not in inspect(conn).get_table_names():
+            return
+
+        # Several watchlists may hold their own copy of a ticker's series;
+        # keep the longest (then most recent) one as the instrument's history
+        series = conn.execute(text(f"""
+            SELECT stocks.instrument_id, legacy.stock_id, COUNT(*) AS points, MAX(legacy.date) AS latest
+            FROM {LEGACY_DATA_POINTS_TABLE} legacy
+            JOIN stocks ON stocks.id = legacy.stock_id
+            GROUP BY stocks.instrument_id, legacy.stock_id
+        """)).all()
+
+        canonical = {}
+        for instrument_id, stock_id, points, latest in series:
+            best = canonical.get(instrument_id)
+            if best is None or (points, latest, -stock_id) > (best[1], best[2], -best[0]):
+                canonical[instrument_id] = (stock_id, points, latest)
+
+        for instrument_id, (stock_id, _, _) in canonical.items():
+            conn.execute(text(f"""
+                INSERT INTO stock_data_points (instrument_id, date, open, high, low, close, volume)
+                SELECT :instrument_id, date, open, high, low, close, volume
+                FROM {LEGACY_DATA_POINTS_TABLE}
+                WHERE stock_id = :stock_id
+            """), {"instrument_id": instrument_id, "stock_id": stock_id})
+
+        conn.execute(text(f"DROP TABLE {LEGACY_DATA_POINTS_TABLE}"))
+        logger.info(f"Migrated price history for {len(canonical)} instruments")
+
+def _snapshot_accounts_without_ledger(engine):
+    """Give paper accounts opened before the ledger existed an opening snapshot of their current state"""
+    snapshots = Base.metadata.tables["paper_ledger_snapshots"]
+    with engine.begin() as conn:
+        accounts = conn.execute(text("""
+            SELECT id, virtual_cash_balance FROM paper_accounts
+            WHERE id NOT IN (SELECT account_id FROM paper_ledger_snapshots)
+        """)).all()
+        if not accounts:
+            return
+
+        positions = {}
+        for account_id, ticker, quantity, average_buy_price in conn.execute(text("""
+            SELECT account_id, stock_ticker, quantity, average_buy_price FROM paper_positions
+        """)):
+            positions.setdefault(account_id, {})[ticker] = {"quantity": quantity, "average_buy_price": average_buy_price}
+
+        now = datetime.now()
+        conn.execute(snapshots.insert(), [
+            {
+                "account_id": account_id,
+                "sequence": 0,
+                "cash_balance": cash_balance,
+                "positions": positions.get(account_id, {}),
+                "taken_at": now
+            }
+            for account_id, cash_balance in accounts
+        ])
+        logger.info(f"Wrote opening ledger snapshots for {len(accounts)} paper accounts")
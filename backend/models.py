@@ -1,7 +1,7 @@
 # In backend/models.py
 from sqlalchemy import (
     Column, Integer, String, Float, DateTime, ForeignKey, 
-    Boolean, UniqueConstraint
+    Boolean, UniqueConstraint, Index, JSON
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -46,6 +46,25 @@ class Watchlist(Base):
     # This connects the Watchlist back to its User
     owner = relationship("User", back_populates="watchlists")
 
+class Instrument(Base):
+    __tablename__ = "instruments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    ticker = Column(String, unique=True, index=True, nullable=False)
+    company_name = Column(String)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Watchlist entries that reference this instrument
+    stocks = relationship("Stock", back_populates="instrument")
+
+    # The price history is stored once per ticker, shared by every watchlist
+    data_points = relationship(
+        "StockDataPoint", 
+        back_populates="instrument", 
+        cascade="all, delete-orphan"
+    )
+
 class Stock(Base):
     __tablename__ = "stocks"
 
@@ -53,6 +72,7 @@ class Stock(Base):
     ticker = Column(String, index=True, nullable=False)
     company_name = Column(String)
     watchlist_id = Column(Integer, ForeignKey("watchlists.id"), nullable=False)
+    instrument_id = Column(Integer, ForeignKey("instruments.id"), nullable=False, index=True)
     
     added_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -60,13 +80,8 @@ class Stock(Base):
     # This connects the Stock back to its Watchlist
     watchlist = relationship("Watchlist", back_populates="stocks")
 
-    # --- ADD THIS RELATIONSHIP ---
-    # This connects the Stock to its future data points
-    data_points = relationship(
-        "StockDataPoint", 
-        back_populates="stock", 
-        cascade="all, delete-orphan"
-    )
+    # This connects the Stock to the shared instrument holding its price history
+    instrument = relationship("Instrument", back_populates="stocks")
     
     # Ensure a stock ticker is unique *within* a single watchlist
     __table_args__ = (
@@ -81,7 +96,7 @@ class StockDataPoint(Base):
     __tablename__ = "stock_data_points"
 
     id = Column(Integer, primary_key=True, index=True)
-    stock_id = Column(Integer, ForeignKey("stocks.id"), nullable=False, index=True)
+    instrument_id = Column(Integer, ForeignKey("instruments.id"), nullable=False, index=True)
     
     date = Column(DateTime, nullable=False, index=True)
     open = Column(Float, nullable=False)
@@ -90,7 +105,12 @@ class StockDataPoint(Base):
     close = Column(Float, nullable=False)
     volume = Column(Integer, nullable=False)
 
-    stock = relationship("Stock", back_populates="data_points")
+    instrument = relationship("Instrument", back_populates="data_points")
+
+    # Serves "latest point per instrument" lookups and per-instrument retention pruning
+    __table_args__ = (
+        Index('ix_stock_data_points_instrument_date', 'instrument_id', 'date'),
+    )
 
 class PriceAlert(Base):
     __tablename__ = "price_alerts"
@@ -111,6 +131,28 @@ class PriceAlert(Base):
     # Relationship to user
     user = relationship("User")
 
+class NotificationOutbox(Base):
+    """Notifications written in the same transaction as the event that caused them, delivered later"""
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # e.g. 'price_alert'
+    recipient = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, sending, sent or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    available_at = Column(DateTime, nullable=False, default=datetime.datetime.now)  # Next delivery attempt
+    claimed_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+
+    # The dispatcher scans for due rows by status and time
+    __table_args__ = (
+        Index('ix_notification_outbox_status_available', 'status', 'available_at'),
+    )
+
 # Paper Trading Models
 class PaperAccount(Base):
     __tablename__ = "paper_accounts"
@@ -120,11 +162,18 @@ class PaperAccount(Base):
     virtual_cash_balance = Column(Float, default=100000.0)  # Starting with $100,000
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Bumped on every write; updates check it so a stale balance is never written back
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Sequence number of the account's latest ledger event
+    ledger_sequence = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationships
     user = relationship("User")
     positions = relationship("PaperPosition", back_populates="account", cascade="all, delete-orphan")
     trades = relationship("PaperTrade", back_populates="account", cascade="all, delete-orphan")
+    orders = relationship("PaperOrder", back_populates="account", cascade="all, delete-orphan")
+
+    __mapper_args__ = {"version_id_col": version}
 
 class PaperPosition(Base):
     __tablename__ = "paper_positions"
@@ -136,6 +185,7 @@ class PaperPosition(Base):
     average_buy_price = Column(Float, nullable=False)  # Average price paid per share
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationships
     account = relationship("PaperAccount", back_populates="positions")
@@ -144,6 +194,7 @@ class PaperPosition(Base):
     __table_args__ = (
         UniqueConstraint('account_id', 'stock_ticker', name='_account_ticker_uc'),
     )
+    __mapper_args__ = {"version_id_col": version}
 
 class PaperTrade(Base):
     __tablename__ = "paper_trades"
@@ -158,4 +209,87 @@ class PaperTrade(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
-    account = relationship("PaperAccount", back_populates="trades")
\ No newline at end of file
+    account = relationship("PaperAccount", back_populates="trades")
+
+    # Keyset pagination of trade history, newest first, optionally for one ticker
+    __table_args__ = (
+        Index('ix_paper_trades_account_created', 'account_id', 'created_at', 'id'),
+        Index('ix_paper_trades_account_ticker_created', 'account_id', 'stock_ticker', 'created_at', 'id'),
+    )
+
+class PaperOrder(Base):
+    """A limit or stop order resting until a tick price crosses it"""
+    __tablename__ = "paper_orders"
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("paper_accounts.id"), nullable=False, index=True)
+    stock_ticker = Column(String, nullable=False, index=True)
+    side = Column(String, nullable=False)  # 'buy' or 'sell'
+    order_type = Column(String, nullable=False)  # 'limit' or 'stop'
+    quantity = Column(Integer, nullable=False)
+    limit_price = Column(Float, nullable=True)
+    stop_price = Column(Float, nullable=True)
+    status = Column(String, nullable=False, default="open")  # open, filled, cancelled or rejected
+    filled_price = Column(Float, nullable=True)
+    filled_at = Column(DateTime, nullable=True)
+    reject_reason = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Version-checked so a cancel and a fill of the same order cannot both commit
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    # Relationships
+    account = relationship("PaperAccount", back_populates="orders")
+
+    # Open orders are reloaded into the order book on startup
+    __table_args__ = (
+        Index('ix_paper_orders_status_ticker', 'status', 'stock_ticker'),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+class PaperLedgerEvent(Base):
+    """Append-only record of one change to a paper account's cash or positions"""
+    __tablename__ = "paper_ledger_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("paper_accounts.id"), nullable=False)
+    sequence = Column(Integer, nullable=False)  # 1, 2, 3... per account
+    event_type = Column(String, nullable=False)  # 'buy', 'sell' or 'reset'
+    stock_ticker = Column(String, nullable=True)
+    quantity = Column(Integer, nullable=False, default=0)  # Shares bought or sold
+    price = Column(Float, nullable=True)  # Price per share
+    cash_delta = Column(Float, nullable=False)  # Change to the cash balance
+    occurred_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('account_id', 'sequence', name='_ledger_account_sequence_uc'),
+        Index('ix_paper_ledger_events_account_occurred', 'account_id', 'occurred_at'),
+    )
+
+class PaperLedgerSnapshot(Base):
+    """Full cash and position state of a paper account as of one ledger sequence number"""
+    __tablename__ = "paper_ledger_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("paper_accounts.id"), nullable=False)
+    sequence = Column(Integer, nullable=False)  # Last event included (0 for the opening state)
+    cash_balance = Column(Float, nullable=False)
+    positions = Column(JSON, nullable=False)  # {ticker: {"quantity": ..., "average_buy_price": ...}}
+    taken_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('account_id', 'sequence', name='_snapshot_account_sequence_uc'),
+    )
+
+class PaperEquitySnapshot(Base):
+    """Total value of a paper account at one point in time, written in bulk by the generator"""
+    __tablename__ = "paper_equity_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, ForeignKey("paper_accounts.id"), nullable=False)
+    recorded_at = Column(DateTime, nullable=False)
+    total_value = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index('ix_paper_equity_snapshots_account_recorded', 'account_id', 'recorded_at'),
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 # User schemas
@@ -177,8 +177,44 @@ class PaperTrade(PaperTradeBase):
 class PaperOrderRequest(BaseModel):
     stock_ticker: str
     quantity: int
-    order_type: str = "market"  # 'market' or 'limit'
+    order_type: str = "market"  # 'market', 'limit' or 'stop'
     limit_price: Optional[float] = None
+    stop_price: Optional[float] = None
+
+class PaperBasketLeg(BaseModel):
+    stock_ticker: str
+    side: str  # 'buy' or 'sell'
+    quantity: int
+
+class PaperBasketOrderRequest(BaseModel):
+    legs: List[PaperBasketLeg]
+    mode: str = "all_or_nothing"  # 'all_or_nothing' or 'best_effort'
+
+class PaperOrder(BaseModel):
+    id: int
+    account_id: int
+    stock_ticker: str
+    side: str  # 'buy' or 'sell'
+    order_type: str  # 'limit' or 'stop'
+    quantity: int
+    limit_price: Optional[float] = None
+    stop_price: Optional[float] = None
+    status: str
+    filled_price: Optional[float] = None
+    filled_at: Optional[datetime] = None
+    reject_reason: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    model_config = ConfigDict(from_attributes=True)
+
+class BacktestRequest(BaseModel):
+    tickers: List[str]
+    strategy: str  # 'sma_crossover', 'threshold' or 'rebalance'
+    params: Dict[str, float] = {}
+    days: int = 365
+    initial_cash: float = 100000.0
+    commission_bps: float = 0.0
 
 class PaperPortfolioSummary(BaseModel):
     total_value: float
@@ -1,12 +1,14 @@
 import os
+import asyncio
 import google.generativeai as genai
 from typing import List, Dict
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 from database import SessionLocal
-from models import Stock, StockDataPoint
-from sqlalchemy import desc, func
+from services.bar_store import bar_store
+from services.briefing_cache import briefing_cache
+from services.price_cache import price_cache, period_start, from_timestamp
 
 load_dotenv()
 
@@ -20,6 +22,10 @@ class AIService:
             self.model = genai.GenerativeModel('gemini-pro')
         else:
             self.model = None
+            
+        # Bars arrive every generator tick, so briefings are keyed on the day, week or month of the
+        # newest bar rather than the bar itself; a briefing can trail the data by up to one period
+        self.data_resolution = os.getenv("BRIEFING_DATA_RESOLUTION", "week")
         
     async def generate_daily_briefing(self, watchlist) -> Dict:
         """Generate AI daily briefing for a watchlist based on stock data"""
@@ -35,24 +41,43 @@ class AIService:
                     "stocks_analyzed": []
                 }
             
-            # Fetch stock data for analysis
-            stock_data = await self._fetch_stock_data_for_analysis(tickers)
-            
-            # Generate AI summary based on stock data
-            summary = await self._generate_ai_summary_from_stock_data(tickers, stock_data)
+            # A briefing is regenerated when the watchlist's tickers change or their newest bar enters
+            # a new period, so repeat requests (and concurrent ones) share one generation until then
+            key = (watchlist.id, tuple(sorted(ticker.upper() for ticker in tickers)), self._data_version(tickers))
+            briefing = await briefing_cache.get_or_create(key, lambda: self._generate_briefing(tickers))
             
-            return {
-                "date": datetime.now(),
-                "watchlist_name": watchlist.name,
-                "summary": summary,
-                "stocks_analyzed": tickers
-            }
+            return {**briefing, "watchlist_name": watchlist.name}
             
         except Exception as e:
             print(f"Error generating AI briefing: {e}")
             # Return fallback briefing if AI service fails
             return self._get_fallback_briefing(watchlist)
     
+    async def _generate_briefing(self, tickers: List[str]) -> Dict:
+        """Fetch the tickers' stock data and summarize it"""
+        # Fetch stock data for analysis
+        stock_data = await self._fetch_stock_data_for_analysis(tickers)
+        
+        # Generate AI summary based on stock data
+        summary = await self._generate_ai_summary_from_stock_data(tickers, stock_data)
+        
+        return {
+            "date": datetime.now(),
+            "summary": summary,
+            "stocks_analyzed": tickers
+        }
+        
+    def _data_version(self, tickers: List[str]) -> int:
+        """Start of the period holding the newest cached bar among the tickers (0 if none are cached)"""
+        latest = 0
+        for ticker in tickers:
+            buffer = price_cache.buffers.get(ticker.upper())
+            if buffer is not None and len(buffer) > 0:
+                latest = max(latest, int(buffer.window(1)["timestamp"][0]))
+        if latest == 0:
+            return 0
+        return period_start(from_timestamp(latest).date(), self.data_resolution)
+        
     async def _fetch_stock_data_for_analysis(self, tickers: List[str]) -> List[Dict]:
         """Fetch stock data for analysis from database"""
         db = SessionLocal()
@@ -60,36 +85,30 @@ class AIService:
             stock_analysis_data = []
             
             for ticker in tickers:
-                # Find the stock in database
-                stock = db.query(Stock).filter(Stock.ticker == ticker.upper()).first()
+                # Get recent bars (last 30 days) from the configured bar store
+                bars = bar_store.get_bars(db, ticker.upper(), 30)
                 
-                if not stock:
+                if bars is None:
                     continue
                 
-                # Get recent data points (last 30 days)
-                recent_data = db.query(StockDataPoint)\
-                    .filter(StockDataPoint.stock_id == stock.id)\
-                    .order_by(desc(StockDataPoint.date))\
-                    .limit(30)\
-                    .all()
-                
-                if not recent_data:
-                    continue
+                # Newest first, matching the order the analysis below walks the data
+                closes = bars["close"][::-1].tolist()
+                volumes = bars["volume"][::-1].tolist()
                 
                 # Calculate price movements and trends
-                latest_price = recent_data[0].close
-                oldest_price = recent_data[-1].close if len(recent_data) > 1 else latest_price
+                latest_price = closes[0]
+                oldest_price = closes[-1] if len(closes) > 1 else latest_price
                 
                 # Calculate daily changes
                 daily_changes = []
-                for i in range(min(7, len(recent_data) - 1)):  # Last 7 days
-                    if i + 1 < len(recent_data):
-                        change = ((recent_data[i].close - recent_data[i + 1].close) / recent_data[i + 1].close) * 100
+                for i in range(min(7, len(closes) - 1)):  # Last 7 days
+                    if i + 1 < len(closes):
+                        change = ((closes[i] - closes[i + 1]) / closes[i + 1]) * 100
                         daily_changes.append(change)
                 
                 # Calculate volume trends
-                avg_volume = sum(point.volume for point in recent_data) / len(recent_data)
-                latest_volume = recent_data[0].volume
+                avg_volume = sum(volumes) / len(volumes)
+                latest_volume = volumes[0]
                 volume_trend = "high" if latest_volume > avg_volume * 1.2 else "low" if latest_volume < avg_volume * 0.8 else "normal"
                 
                 # Calculate volatility
@@ -106,7 +125,7 @@ class AIService:
                     "avg_daily_change": sum(daily_changes) / len(daily_changes) if daily_changes else 0,
                     "volume_trend": volume_trend,
                     "volatility": volatility,
-                    "data_points_count": len(recent_data)
+                    "data_points_count": len(closes)
                 })
             
             return stock_analysis_data
@@ -150,8 +169,8 @@ class AIService:
             Format as bullet points, each starting with a dash (-). Be specific about the numbers and trends.
             """
             
-            # Generate content using Gemini
-            response = self.model.generate_content(prompt)
+            # Generate content using Gemini, off the event loop so waiting requests are not blocked
+            response = await asyncio.to_thread(self.model.generate_content, prompt)
             summary_text = response.text
             
             # Parse bullet points
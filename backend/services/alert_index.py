@@ -0,0 +1,97 @@
+import logging
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from models import PriceAlert
+
+logger = logging.getLogger(__name__)
+
+class AlertIndex:
+    """
+    In-memory book of armed price alerts (active and not yet triggered).
+    Each ticker keeps its high and low thresholds as sorted (threshold, alert id) lists,
+    so the alerts a new price crosses are one bisect away and quiet ticks need no query.
+    """
+    
+    def __init__(self):
+        self.highs: Dict[str, List[Tuple[float, int]]] = {}
+        self.lows: Dict[str, List[Tuple[float, int]]] = {}
+        # alert id -> (ticker, high threshold, low threshold) for removal and updates
+        self.entries: Dict[int, Tuple[str, Optional[float], Optional[float]]] = {}
+        
+    def __len__(self) -> int:
+        return len(self.entries)
+        
+    def load_from_db(self, db: Session):
+        """Rebuild the index from every armed alert in the database"""
+        self.highs.clear()
+        self.lows.clear()
+        self.entries.clear()
+        
+        alerts = db.query(PriceAlert.id, PriceAlert.stock_ticker, PriceAlert.high_price, PriceAlert.low_price).filter(
+            PriceAlert.is_active == True,
+            PriceAlert.triggered_at.is_(None)
+        ).all()
+        for alert_id, ticker, high_price, low_price in alerts:
+            self._add(alert_id, ticker, high_price, low_price)
+            
+        logger.info(f"Alert index loaded {len(self.entries)} armed alerts")
+        
+    def sync(self, alert: PriceAlert):
+        """Bring the index in line with an alert after it was created or updated"""
+        self.remove(alert.id)
+        if alert.is_active and alert.triggered_at is None:
+            self._add(alert.id, alert.stock_ticker, alert.high_price, alert.low_price)
+            
+    def remove(self, alert_id: int):
+        """Drop an alert from the index if present"""
+        entry = self.entries.pop(alert_id, None)
+        if entry is None:
+            return
+            
+        ticker, high_price, low_price = entry
+        if high_price:
+            self._discard(self.highs, ticker, (high_price, alert_id))
+        if low_price:
+            self._discard(self.lows, ticker, (low_price, alert_id))
+            
+    def match(self, ticker: str, price: float) -> List[Tuple[int, str]]:
+        """(alert id, trigger type) of every armed alert the price crosses"""
+        triggered = {}
+        
+        # High alerts fire at or above their threshold: the prefix up to the price
+        highs = self.highs.get(ticker)
+        if highs:
+            for _, alert_id in highs[:bisect_right(highs, (price, float("inf")))]:
+                triggered[alert_id] = "high"
+                
+        # Low alerts fire at or below their threshold: the suffix from the price
+        lows = self.lows.get(ticker)
+        if lows:
+            for _, alert_id in lows[bisect_left(lows, (price, float("-inf"))):]:
+                triggered[alert_id] = "low"
+                
+        return list(triggered.items())
+        
+    def _add(self, alert_id: int, ticker: str, high_price: Optional[float], low_price: Optional[float]):
+        ticker = ticker.upper()
+        self.entries[alert_id] = (ticker, high_price, low_price)
+        # A zero or missing threshold counts as unset and never fires
+        if high_price:
+            insort(self.highs.setdefault(ticker, []), (high_price, alert_id))
+        if low_price:
+            insort(self.lows.setdefault(ticker, []), (low_price, alert_id))
+            
+    def _discard(self, book: Dict[str, List[Tuple[float, int]]], ticker: str, entry: Tuple[float, int]):
+        thresholds = book.get(ticker)
+        if not thresholds:
+            return
+            
+        position = bisect_left(thresholds, entry)
+        if position < len(thresholds) and thresholds[position] == entry:
+            del thresholds[position]
+        if not thresholds:
+            del book[ticker]
+
+# Global instance
+alert_index = AlertIndex()
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from schemas import BacktestRequest
+from services.bar_store import bar_store
+from services.price_cache import price_cache, from_timestamp
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("sma_crossover", "threshold", "rebalance")
+# Parameters each strategy accepts, with their defaults
+STRATEGY_DEFAULTS = {
+    "sma_crossover": {"fast": 20, "slow": 50},
+    "threshold": {"lookback": 20, "entry": -0.05, "exit": 0.05},
+    "rebalance": {"period": 21}
+}
+# Generated history has one bar per calendar day
+BARS_PER_YEAR = 365
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over `window` bars of each column; NaN until a full window of data exists"""
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.where(valid, values, 0.0), axis=0)
+    counts = np.cumsum(valid, axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts == window, sums / window, np.nan)
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """Carry the last non-NaN value of each column forward in time"""
+    rows = np.where(~np.isnan(values), np.arange(len(values))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return values[rows, np.arange(values.shape[1])]
+
+class BacktestService:
+    """
+    Vectorized backtests over stored price history.
+    A universe's closes are loaded into one (bars x tickers) matrix and every strategy is
+    evaluated as whole-matrix NumPy operations, so the cost grows with the data and not
+    with a per-bar, per-ticker Python loop.
+    """
+    
+    def __init__(self):
+        self.max_tickers = 500
+        self.max_days = price_cache.capacity  # Only as much history as the generator retains
+        self.max_trades = 5000  # Trades listed in a response; the stats count all of them
+        
+    async def run_backtest(self, request: BacktestRequest, db: Session) -> Dict:
+        """Run a strategy over the newest `days` bars of the requested tickers"""
+        tickers = list(dict.fromkeys(ticker.strip().upper() for ticker in request.tickers if ticker.strip()))
+        if not tickers:
+            return {"success": False, "message": "At least one ticker is required"}
+        if len(tickers) > self.max_tickers:
+            return {"success": False, "message": f"At most {self.max_tickers} tickers can be backtested at once"}
+        if request.strategy not in STRATEGIES:
+            return {"success": False, "message": f"Unknown strategy '{request.strategy}', expected one of {', '.join(STRATEGIES)}"}
+        if not 2 <= request.days <= self.max_days:
+            return {"success": False, "message": f"days must be between 2 and {self.max_days}"}
+        if request.initial_cash <= 0:
+            return {"success": False, "message": "initial_cash must be positive"}
+        if request.commission_bps < 0:
+            return {"success": False, "message": "commission_bps cannot be negative"}
+            
+        unknown = set(request.params) - set(STRATEGY_DEFAULTS[request.strategy])
+        if unknown:
+            return {"success": False, "message": f"Unknown parameters for {request.strategy}: {', '.join(sorted(unknown))}"}
+        params = {**STRATEGY_DEFAULTS[request.strategy], **request.params}
+        error = self._check_params(request.strategy, params)
+        if error:
+            return {"success": False, "message": error}
+            
+        # Load on the event loop: the request's Session must stay on this thread, and the cached
+        # windows are copied before the generator can write into their ring buffers again
+        tickers, timestamps, closes = self._load_closes(db, tickers, request.days)
+        if not tickers:
+            return {"success": False, "message": "No price history for the requested tickers"}
+            
+        # The NumPy work runs off the event loop so ticks and other requests are not held up
+        return await asyncio.to_thread(self._evaluate, request, params, tickers, timestamps, closes)
+        
+    def _evaluate(self, request: BacktestRequest, params: Dict[str, float], tickers: List[str],
+                  timestamps: np.ndarray, closes: np.ndarray) -> Dict:
+        """Run the strategy over loaded closes; touches no shared state, so it is safe in a worker thread"""
+        fee = request.commission_bps / 10_000
+        if request.strategy == "rebalance":
+            equity, holdings = self._rebalance(closes, request.initial_cash, int(params["period"]), fee)
+        else:
+            if request.strategy == "sma_crossover":
+                signals = self._sma_crossover(closes, int(params["fast"]), int(params["slow"]))
+            else:
+                signals = self._threshold(closes, int(params["lookback"]), params["entry"], params["exit"])
+            equity, holdings = self._run_signals(closes, signals, request.initial_cash, fee)
+            
+        trades = self._trades(tickers, timestamps, closes, holdings)
+        return {
+            "success": True,
+            "strategy": request.strategy,
+            "params": params,
+            "tickers": tickers,
+            "equity_curve": [
+                {"date": from_timestamp(timestamp), "equity": round(value, 2)}
+                for timestamp, value in zip(timestamps.tolist(), equity.tolist())
+            ],
+            "trades": trades[-self.max_trades:],
+            "trades_truncated": len(trades) > self.max_trades,
+            "stats": self._stats(equity, holdings, closes, request.initial_cash, len(trades))
+        }
+        
+    def _check_params(self, strategy: str, params: Dict[str, float]) -> Optional[str]:
+        if strategy == "sma_crossover":
+            if not 1 <= params["fast"] < params["slow"]:
+                return "sma_crossover needs 1 <= fast < slow"
+        elif strategy == "threshold":
+            if params["lookback"] < 1:
+                return "threshold needs lookback >= 1"
+            if params["entry"] >= params["exit"]:
+                return "threshold needs entry < exit"
+        elif params["period"] < 1:
+            return "rebalance needs period >= 1"
+        return None
+        
+    def _load_closes(self, db: Session, tickers: List[str], days: int) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Newest `days` closes of each ticker as a (bars x tickers) matrix, aligned on the newest bar
+        (every generator tick adds one bar to every instrument). Shorter histories are NaN-padded
+        at the start; tickers without history are dropped. Cached tickers skip the database and
+        every miss is read in one bar store query.
+        """
+        series = {}
+        for ticker in tickers:
+            buffer = price_cache.buffers.get(ticker)
+            if buffer is not None and len(buffer) > 0:
+                # Windows are views into the ring buffer, so take private copies
+                window = buffer.window(days)
+                series[ticker] = {
+                    "timestamp": np.array(window["timestamp"], copy=True),
+                    "close": np.array(window["close"], copy=True)
+                }
+                
+        misses = [ticker for ticker in tickers if ticker not in series]
+        if misses:
+            series.update(bar_store.get_latest_bars(db, misses, days))
+            
+        tickers = [ticker for ticker in tickers if ticker in series]
+        length = max((len(series[ticker]["close"]) for ticker in tickers), default=0)
+        closes = np.full((length, len(tickers)), np.nan)
+        stamps = np.zeros((length, len(tickers)), dtype=np.int64)
+        for column, ticker in enumerate(tickers):
+            bars = series[ticker]
+            count = len(bars["close"])
+            closes[length - count:, column] = bars["close"]
+            stamps[length - count:, column] = bars["timestamp"]
+        # Date each row by its newest bar across the universe
+        return tickers, stamps.max(axis=1), closes
+        
+    def _sma_crossover(self, closes: np.ndarray, fast: int, slow: int) -> np.ndarray:
+        """Long while the fast moving average is above the slow one"""
+        with np.errstate(invalid="ignore"):
+            return rolling_mean(closes, fast) > rolling_mean(closes, slow)
+            
+    def _threshold(self, closes: np.ndarray, lookback: int, entry: float, exit: float) -> np.ndarray:
+        """
+        Mean reversion: enter once the close is `entry` (a fraction, e.g. -0.05) away from its
+        moving average and hold until it is `exit` away. Entries and exits are marked as 1 and 0
+        and forward-filled, so the position between them needs no per-bar loop.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            deviation = closes / rolling_mean(closes, lookback) - 1
+        marks = np.full(closes.shape, np.nan)
+        marks[deviation >= exit] = 0.0
+        marks[deviation <= entry] = 1.0
+        return forward_fill(marks) == 1.0
+        
+    def _run_signals(self, closes: np.ndarray, signals: np.ndarray, initial_cash: float, fee: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Give each ticker an equal sleeve of the starting cash, fully invested while its signal
+        (taken at a bar's close) is on and in cash otherwise. Returns the equity curve and the
+        shares held in each sleeve after every bar.
+        """
+        positions = signals.astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            returns = np.nan_to_num(closes[1:] / closes[:-1] - 1)
+        growth = np.ones(closes.shape)
+        growth[1:] = 1 + positions[:-1] * returns
+        # Commission on the sleeve value traded at every entry and exit
+        turnover = np.abs(np.diff(positions, axis=0, prepend=0.0))
+        growth *= 1 - fee * turnover
+        
+        sleeves = (initial_cash / closes.shape[1]) * np.cumprod(growth, axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            holdings = np.where(signals, sleeves / closes, 0.0)
+        return sleeves.sum(axis=1), holdings
+        
+    def _rebalance(self, closes: np.ndarray, initial_cash: float, period: int, fee: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Equal-weight buy and hold, reset to equal weights every `period` bars. Shares are fixed
+        between rebalances, so each period's value is one matrix product of its shares and closes.
+        """
+        bars, ticker_count = closes.shape
+        prices = np.nan_to_num(closes)
+        starts = np.arange(0, bars, period)
+        holdings = np.zeros(closes.shape)
+        equity = np.empty(bars)
+        
+        # Loops over rebalance dates only; each step is vectorized across tickers and bars
+        value = initial_cash
+        shares = np.zeros(ticker_count)
+        for start, end in zip(starts, np.r_[starts[1:], bars]):
+            if start > 0:
+                value = float(shares @ prices[start])
+            # Rows are aligned on the newest bar, so the longest history is always tradable
+            tradable = ~np.isnan(closes[start])
+            target = np.zeros(ticker_count)
+            target[tradable] = (value / tradable.sum()) / closes[start, tradable]
+            value -= fee * float(np.abs(target - shares) @ prices[start])
+            # Scale down to pay the commission out of the rebalanced holdings
+            shares = target * (value / float(target @ prices[start]))
+            holdings[start:end] = shares
+            equity[start:end] = prices[start:end] @ shares
+        return equity, holdings
+        
+    def _trades(self, tickers: List[str], timestamps: np.ndarray, closes: np.ndarray, holdings: np.ndarray) -> List[Dict]:
+        """Every change in a sleeve's shares as a buy or sell at that bar's close, oldest first"""
+        changes = np.diff(holdings, axis=0, prepend=0.0)
+        rows, columns = np.nonzero(np.abs(changes) > 1e-9)
+        quantities = changes[rows, columns]
+        return [
+            {
+                "date": from_timestamp(timestamp),
+                "stock_ticker": tickers[column],
+                "side": "buy" if quantity > 0 else "sell",
+                "quantity": round(abs(quantity), 4),
+                "price": round(price, 2)
+            }
+            for timestamp, column, quantity, price in zip(
+                timestamps[rows].tolist(), columns.tolist(), quantities.tolist(), closes[rows, columns].tolist()
+            )
+        ]
+        
+    def _stats(self, equity: np.ndarray, holdings: np.ndarray, closes: np.ndarray, initial_cash: float, trade_count: int) -> Dict:
+        returns = equity[1:] / equity[:-1] - 1
+        years = (len(equity) - 1) / BARS_PER_YEAR
+        total_return = equity[-1] / initial_cash - 1
+        volatility = float(returns.std() * np.sqrt(BARS_PER_YEAR)) if len(returns) > 1 else 0.0
+        drawdowns = equity / np.maximum.accumulate(equity) - 1
+        
+        # Round trips: each exit against the price of its most recent entry
+        held = holdings > 0
+        entries = held & ~np.vstack([np.zeros((1, held.shape[1]), dtype=bool), held[:-1]])
+        exits = ~held & np.vstack([np.zeros((1, held.shape[1]), dtype=bool), held[:-1]])
+        entry_prices = forward_fill(np.where(entries, closes, np.nan))
+        exit_returns = closes[exits] / entry_prices[exits] - 1
+        
+        return {
+            "final_equity": round(float(equity[-1]), 2),
+            "total_return_percent": round(float(total_return) * 100, 2),
+            "annualized_return_percent": round(float((1 + total_return) ** (1 / years) - 1) * 100, 2) if years > 0 and total_return > -1 else None,
+            "annualized_volatility_percent": round(volatility * 100, 2),
+            "sharpe_ratio": round(float(returns.mean() * BARS_PER_YEAR) / volatility, 2) if volatility > 0 else None,
+            "max_drawdown_percent": round(float(drawdowns.min()) * 100, 2),
+            "trade_count": trade_count,
+            "round_trips": int(len(exit_returns)),
+            "win_rate_percent": round(float((exit_returns > 0).mean()) * 100, 2) if len(exit_returns) else None,
+            "exposure_percent": round(float(held.mean()) * 100, 2),
+            "bars": int(len(equity))
+        }
+
+# Create service instance
+backtest_service = BacktestService()
@@ -0,0 +1,495 @@
+import io
+import os
+import re
+import logging
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import func, select, insert, delete, and_, or_
+from sqlalchemy.orm import Session, aliased
+from models import Instrument, StockDataPoint
+from services.price_cache import PriceRingBuffer, BAR_COLUMNS, COLUMN_DTYPES, to_timestamp, from_timestamp
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Number of daily data points kept per instrument
+MAX_DATA_POINTS = 365
+
+# Tickers that can be stored; the mmap backend uses the ticker as its file name
+TICKER_PATTERN = re.compile(r"[A-Z0-9.\-^=]+")
+
+class SqlBarStore:
+    """Default time-series backend: one stock_data_points row per bar"""
+    
+    name = "sql"
+    
+    def load_latest(self, db: Session) -> List[Tuple[int, str, Optional[datetime], Optional[float]]]:
+        """Return (id, ticker, date, close) for every instrument, with its latest bar if any"""
+        # Correlated lookup resolves to one index seek per instrument on (instrument_id, date)
+        latest_point_id = select(StockDataPoint.id)\
+            .where(StockDataPoint.instrument_id == Instrument.id)\
+            .order_by(StockDataPoint.date.desc())\
+            .limit(1)\
+            .correlate(Instrument)\
+            .scalar_subquery()
+            
+        return db.query(Instrument.id, Instrument.ticker, StockDataPoint.date, StockDataPoint.close)\
+            .outerjoin(StockDataPoint, StockDataPoint.id == latest_point_id)\
+            .order_by(Instrument.id)\
+            .all()
+            
+    def append_bars(self, db: Session, instrument_ids: List[int], tickers: List[str], dates: List[datetime], bars: Dict[str, np.ndarray]):
+        """Write one new bar per instrument with a single bulk insert"""
+        db.execute(insert(StockDataPoint.__table__), [
+            {
+                "instrument_id": instrument_id,
+                "date": date,
+                "open": open_price,
+                "high": high_price,
+                "low": low_price,
+                "close": close_price,
+                "volume": volume
+            }
+            for instrument_id, date, open_price, high_price, low_price, close_price, volume in zip(
+                instrument_ids,
+                dates,
+                bars["open"].tolist(),
+                bars["high"].tolist(),
+                bars["low"].tolist(),
+                bars["close"].tolist(),
+                bars["volume"].tolist()
+            )
+        ])
+        
+    def prune(self, db: Session):
+        """Delete every bar beyond the newest MAX_DATA_POINTS of each instrument, in one statement"""
+        # Ranked newest first (by date, then id), these are the rows ROW_NUMBER() would number
+        # past MAX_DATA_POINTS. Numbering every stored bar costs ten times as much per tick, so
+        # each instrument's cutoff (its first bar past the newest MAX_DATA_POINTS) is found with
+        # one bounded walk of the (instrument_id, date) index, and the cutoff and everything
+        # older goes, however far over the instrument is (e.g. after a backfill).
+        cutoff_id = select(StockDataPoint.id)\
+            .where(StockDataPoint.instrument_id == Instrument.id)\
+            .order_by(StockDataPoint.date.desc(), StockDataPoint.id.desc())\
+            .limit(1)\
+            .offset(MAX_DATA_POINTS)\
+            .correlate(Instrument)\
+            .scalar_subquery()
+        # MATERIALIZED computes each cutoff once; inlined, it would be re-run for every bar
+        cutoffs = select(Instrument.id.label("instrument_id"), cutoff_id.label("point_id"))\
+            .cte("cutoffs")\
+            .prefix_with("MATERIALIZED")
+        cutoff = aliased(StockDataPoint, name="cutoff")
+        expired = select(StockDataPoint.id)\
+            .select_from(cutoffs)\
+            .join(cutoff, cutoff.id == cutoffs.c.point_id)\
+            .join(StockDataPoint, and_(
+                StockDataPoint.instrument_id == cutoffs.c.instrument_id,
+                StockDataPoint.date <= cutoff.date
+            ))\
+            .where(or_(StockDataPoint.date < cutoff.date, StockDataPoint.id <= cutoff.id))
+            
+        db.execute(
+            delete(StockDataPoint)
+            .where(StockDataPoint.id.in_(expired))
+            .execution_options(synchronize_session=False)
+        )
+        
+    def count_bars(self, db: Session, instrument_id: int, ticker: str) -> int:
+        """Number of stored bars for an instrument"""
+        return db.query(func.count(StockDataPoint.id))\
+            .filter(StockDataPoint.instrument_id == instrument_id)\
+            .scalar()
+            
+    def instruments_without_history(self, db: Session) -> List[Tuple[int, str]]:
+        """(id, ticker) of every instrument that has no stored bars yet"""
+        has_bars = select(StockDataPoint.id).where(StockDataPoint.instrument_id == Instrument.id).exists()
+        return db.query(Instrument.id, Instrument.ticker)\
+            .filter(~has_bars)\
+            .order_by(Instrument.id)\
+            .all()
+            
+    def write_history(self, db: Session, instrument_id: int, ticker: str, dates: List[datetime], bars: Dict[str, np.ndarray]):
+        """
+        Store a full history (oldest first) for an instrument that has none yet.
+        Uses COPY on PostgreSQL and a single executemany insert elsewhere
+        (a Core table insert, which skips the ORM bulk-insert bookkeeping).
+        """
+        columns = (
+            dates,
+            np.asarray(bars["open"]).tolist(),
+            np.asarray(bars["high"]).tolist(),
+            np.asarray(bars["low"]).tolist(),
+            np.asarray(bars["close"]).tolist(),
+            np.asarray(bars["volume"]).tolist()
+        )
+        
+        if db.get_bind().dialect.name == "postgresql":
+            buffer = io.StringIO()
+            for date, open_price, high_price, low_price, close_price, volume in zip(*columns):
+                buffer.write(f"{instrument_id},{date.isoformat()},{open_price},{high_price},{low_price},{close_price},{volume}\n")
+            buffer.seek(0)
+            
+            # Runs on the session's own connection, so it commits with the session
+            cursor = db.connection().connection.cursor()
+            try:
+                cursor.copy_expert(
+                    "COPY stock_data_points (instrument_id, date, open, high, low, close, volume) "
+                    "FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+            finally:
+                cursor.close()
+            return
+            
+        db.execute(insert(StockDataPoint.__table__), [
+            {
+                "instrument_id": instrument_id,
+                "date": date,
+                "open": open_price,
+                "high": high_price,
+                "low": low_price,
+                "close": close_price,
+                "volume": volume
+            }
+            for date, open_price, high_price, low_price, close_price, volume in zip(*columns)
+        ])
+        
+    def get_bars(self, db: Session, ticker: str, size: Optional[int] = None) -> Optional[Dict[str, np.ndarray]]:
+        """Newest `size` bars of a ticker as columns (oldest first), or None if it has none"""
+        query = db.query(
+            StockDataPoint.date,
+            StockDataPoint.open,
+            StockDataPoint.high,
+            StockDataPoint.low,
+            StockDataPoint.close,
+            StockDataPoint.volume
+        ).join(Instrument, Instrument.id == StockDataPoint.instrument_id)\
+         .filter(Instrument.ticker == ticker.upper())\
+         .order_by(StockDataPoint.date.desc())
+        if size is not None:
+            query = query.limit(size)
+            
+        rows = query.all()
+        if not rows:
+            return None
+            
+        rows.reverse()
+        return self._to_columns(rows)
+        
+    def get_latest_bars(self, db: Session, tickers: List[str], size: int = 2) -> Dict[str, Dict[str, np.ndarray]]:
+        """Newest `size` bars (oldest first) of each given ticker that has any, read in one query"""
+        if not tickers:
+            return {}
+            
+        # Rank each instrument's bars newest first and keep the top `size` per instrument
+        ranked = select(
+            StockDataPoint.instrument_id,
+            StockDataPoint.date,
+            StockDataPoint.open,
+            StockDataPoint.high,
+            StockDataPoint.low,
+            StockDataPoint.close,
+            StockDataPoint.volume,
+            func.row_number().over(
+                partition_by=StockDataPoint.instrument_id,
+                order_by=StockDataPoint.date.desc()
+            ).label("rank")
+        ).join(Instrument, Instrument.id == StockDataPoint.instrument_id)\
+         .where(Instrument.ticker.in_([ticker.upper() for ticker in tickers]))\
+         .subquery()
+        rows = db.query(
+            Instrument.ticker,
+            ranked.c.date,
+            ranked.c.open,
+            ranked.c.high,
+            ranked.c.low,
+            ranked.c.close,
+            ranked.c.volume
+        ).join(ranked, ranked.c.instrument_id == Instrument.id)\
+         .filter(ranked.c.rank <= size)\
+         .order_by(Instrument.ticker, ranked.c.date)\
+         .all()
+         
+        series = {}
+        start = 0
+        for end in range(1, len(rows) + 1):
+            if end == len(rows) or rows[end][0] != rows[start][0]:
+                series[rows[start][0]] = self._to_columns([row[1:] for row in rows[start:end]])
+                start = end
+        return series
+        
+    def iter_series(self, db: Session) -> Iterator[Tuple[str, Dict[str, np.ndarray]]]:
+        """Yield (ticker, bars) for every instrument with stored history, read in one query"""
+        rows = db.query(
+            Instrument.ticker,
+            StockDataPoint.date,
+            StockDataPoint.open,
+            StockDataPoint.high,
+            StockDataPoint.low,
+            StockDataPoint.close,
+            StockDataPoint.volume
+        ).join(StockDataPoint, StockDataPoint.instrument_id == Instrument.id)\
+         .order_by(Instrument.ticker, StockDataPoint.date)\
+         .all()
+         
+        start = 0
+        for end in range(1, len(rows) + 1):
+            if end == len(rows) or rows[end][0] != rows[start][0]:
+                yield rows[start][0], self._to_columns([row[1:] for row in rows[start:end]])
+                start = end
+                
+    def latest_closes(self, db: Session) -> Dict[str, float]:
+        """Latest close of every instrument that has stored history"""
+        return {
+            ticker: close
+            for _, ticker, _, close in self.load_latest(db)
+            if close is not None
+        }
+        
+    def flush(self):
+        """Nothing to flush; rows are durable once the session commits"""
+        
+    def _to_columns(self, rows) -> Dict[str, np.ndarray]:
+        """Convert (date, open, high, low, close, volume) rows into column arrays"""
+        dates, opens, highs, lows, closes, volumes = zip(*rows)
+        return {
+            "timestamp": np.array([to_timestamp(date) for date in dates], dtype=COLUMN_DTYPES["timestamp"]),
+            "open": np.array(opens, dtype=COLUMN_DTYPES["open"]),
+            "high": np.array(highs, dtype=COLUMN_DTYPES["high"]),
+            "low": np.array(lows, dtype=COLUMN_DTYPES["low"]),
+            "close": np.array(closes, dtype=COLUMN_DTYPES["close"]),
+            "volume": np.array(volumes, dtype=COLUMN_DTYPES["volume"])
+        }
+
+class MmapBarStore:
+    """
+    Time-series backend that keeps each ticker's bars in its own memory-mapped file.
+    A file is a 64-byte header followed by one fixed-width column per bar field,
+    laid out as a mirrored circular buffer (see PriceRingBuffer): new bars overwrite
+    the oldest in place, so there is nothing to prune, and reads are zero-copy
+    slices of the mapping. Instruments and watchlists still live in the SQL database.
+    """
+    
+    name = "mmap"
+    
+    MAGIC = b"MPBARS01"
+    HEADER_BYTES = 64  # magic, capacity, count, head, then padding
+    
+    def __init__(self, directory: str, capacity: int = MAX_DATA_POINTS, max_open_files: int = 512):
+        self.directory = directory
+        self.capacity = capacity
+        self.max_open_files = max_open_files
+        # Each mapping holds a file descriptor, so only the most recently used stay open.
+        # The limit grows to the instrument count (see _reserve), so a tick never re-maps a file
+        self._open_buffers: "OrderedDict[str, Tuple[np.memmap, PriceRingBuffer]]" = OrderedDict()
+        self._unstorable_tickers: Set[str] = set()
+        os.makedirs(directory, exist_ok=True)
+        
+    def load_latest(self, db: Session) -> List[Tuple[int, str, Optional[datetime], Optional[float]]]:
+        """Return (id, ticker, date, close) for every instrument, with its latest bar if any"""
+        instruments = db.query(Instrument.id, Instrument.ticker).order_by(Instrument.id).all()
+        # The tick appends to every file right after this, so keep them all mapped between the two
+        self._reserve(len(instruments))
+        
+        latest = []
+        for instrument_id, ticker in instruments:
+            if not self._storable(ticker):
+                # Left out of the tick rather than failing it for every other instrument
+                continue
+            buffer = self._get_buffer(ticker, create=False)
+            if buffer is None or len(buffer) == 0:
+                latest.append((instrument_id, ticker, None, None))
+                continue
+                
+            newest = buffer.window(1)
+            latest.append((
+                instrument_id,
+                ticker,
+                from_timestamp(int(newest["timestamp"][0])),
+                float(newest["close"][0])
+            ))
+        return latest
+        
+    def append_bars(self, db: Session, instrument_ids: List[int], tickers: List[str], dates: List[datetime], bars: Dict[str, np.ndarray]):
+        """Write one new bar per ticker into its circular file"""
+        columns = zip(
+            tickers,
+            dates,
+            bars["open"].tolist(),
+            bars["high"].tolist(),
+            bars["low"].tolist(),
+            bars["close"].tolist(),
+            bars["volume"].tolist()
+        )
+        for ticker, date, open_price, high_price, low_price, close_price, volume in columns:
+            if not self._storable(ticker):
+                continue
+            buffer = self._get_buffer(ticker, create=True)
+            buffer.append(to_timestamp(date), open_price, high_price, low_price, close_price, volume)
+            
+    def prune(self, db: Session):
+        """Nothing to prune; circular files overwrite their oldest bar in place"""
+        
+    def count_bars(self, db: Session, instrument_id: int, ticker: str) -> int:
+        """Number of stored bars for a ticker"""
+        buffer = self._get_buffer(ticker, create=False)
+        return len(buffer) if buffer is not None else 0
+        
+    def instruments_without_history(self, db: Session) -> List[Tuple[int, str]]:
+        """(id, ticker) of every instrument that has no bar file (or an empty one) yet"""
+        return [
+            (instrument_id, ticker)
+            for instrument_id, ticker in db.query(Instrument.id, Instrument.ticker).order_by(Instrument.id).all()
+            if self.count_bars(db, instrument_id, ticker) == 0
+        ]
+        
+    def write_history(self, db: Session, instrument_id: int, ticker: str, dates: List[datetime], bars: Dict[str, np.ndarray]):
+        """Store a full history (oldest first) for a ticker that has none yet"""
+        buffer = self._get_buffer(ticker, create=True)
+        buffer.replace({"timestamp": [to_timestamp(date) for date in dates], **bars})
+        
+    def get_bars(self, db: Session, ticker: str, size: Optional[int] = None) -> Optional[Dict[str, np.ndarray]]:
+        """Newest `size` bars of a ticker as zero-copy column views (oldest first), or None"""
+        buffer = self._get_buffer(ticker.upper(), create=False)
+        if buffer is None or len(buffer) == 0:
+            return None
+        return buffer.window(size)
+        
+    def get_latest_bars(self, db: Session, tickers: List[str], size: int = 2) -> Dict[str, Dict[str, np.ndarray]]:
+        """Newest `size` bars (oldest first) of each given ticker that has a bar file"""
+        series = {}
+        for ticker in tickers:
+            bars = self.get_bars(db, ticker, size)
+            if bars is not None:
+                series[ticker.upper()] = bars
+        return series
+        
+    def iter_series(self, db: Session) -> Iterator[Tuple[str, Dict[str, np.ndarray]]]:
+        """Yield (ticker, bars) for every instrument with a bar file"""
+        for (ticker,) in db.query(Instrument.ticker).order_by(Instrument.ticker).all():
+            bars = self.get_bars(db, ticker)
+            if bars is not None:
+                yield ticker, bars
+                
+    def latest_closes(self, db: Session) -> Dict[str, float]:
+        """Latest close of every instrument that has stored history"""
+        return {
+            ticker: close
+            for _, ticker, _, close in self.load_latest(db)
+            if close is not None
+        }
+        
+    def flush(self):
+        """Write dirty pages of every open mapping back to disk"""
+        for mapping, _ in self._open_buffers.values():
+            mapping.flush()
+            
+    def _reserve(self, count: int):
+        """
+        Let at least `count` mappings stay open, raising the process's open-file limit if
+        needed. Half the limit is left for sockets and database connections; past that the
+        LRU stays bounded and the least recently used files are re-mapped on demand.
+        """
+        if count <= self.max_open_files:
+            return
+        try:
+            import resource
+        except ImportError:
+            return
+            
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = 2 * count + 64
+        if soft != resource.RLIM_INFINITY and soft < wanted:
+            raised = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (raised, hard))
+                soft = raised
+            except (ValueError, OSError) as e:
+                logger.warning(f"Could not raise the open file limit to {raised}: {e}")
+                
+        available = count if soft == resource.RLIM_INFINITY else min(count, soft // 2)
+        if available > self.max_open_files:
+            logger.info(f"Keeping up to {available} bar files mapped for {count} instruments")
+            self.max_open_files = available
+            
+    def _storable(self, ticker: str) -> bool:
+        """Whether a ticker can name a bar file; others are skipped with one warning each"""
+        if TICKER_PATTERN.fullmatch(ticker):
+            return True
+        if ticker not in self._unstorable_tickers:
+            self._unstorable_tickers.add(ticker)
+            logger.warning(f"Skipping ticker '{ticker}': it cannot be used as a bar file name")
+        return False
+        
+    def _path(self, ticker: str) -> str:
+        if not TICKER_PATTERN.fullmatch(ticker):
+            raise ValueError(f"Ticker '{ticker}' cannot be used as a bar file name")
+        return os.path.join(self.directory, f"{ticker}.bars")
+        
+    def _get_buffer(self, ticker: str, create: bool) -> Optional[PriceRingBuffer]:
+        """Map a ticker's file (creating it if asked) and wrap it in a ring buffer"""
+        entry = self._open_buffers.get(ticker)
+        if entry is not None:
+            self._open_buffers.move_to_end(ticker)
+            return entry[1]
+            
+        if not create and not TICKER_PATTERN.fullmatch(ticker):
+            # No file can exist for it
+            return None
+            
+        path = self._path(ticker)
+        column_bytes = 2 * self.capacity * 8
+        file_size = self.HEADER_BYTES + len(BAR_COLUMNS) * column_bytes
+        
+        if not os.path.exists(path):
+            if not create:
+                return None
+            with open(path, "wb") as bar_file:
+                bar_file.truncate(file_size)
+                bar_file.write(self.MAGIC)
+                bar_file.write(np.array([self.capacity, 0, 0], dtype="<i8").tobytes())
+                
+        mapping = np.memmap(path, dtype=np.uint8, mode="r+")
+        if bytes(mapping[:len(self.MAGIC)]) != self.MAGIC or len(mapping) != file_size:
+            raise ValueError(f"Bar file {path} is not a {self.capacity}-bar store file")
+            
+        header = mapping[len(self.MAGIC):len(self.MAGIC) + 24].view("<i8")
+        if int(header[0]) != self.capacity:
+            raise ValueError(f"Bar file {path} holds {int(header[0])} bars, expected {self.capacity}")
+            
+        columns = {}
+        offset = self.HEADER_BYTES
+        for name in BAR_COLUMNS:
+            columns[name] = mapping[offset:offset + column_bytes].view(np.dtype(COLUMN_DTYPES[name]).newbyteorder("<"))
+            offset += column_bytes
+            
+        buffer = PriceRingBuffer(self.capacity, columns=columns, meta=header[1:3])
+        self._open_buffers[ticker] = (mapping, buffer)
+        
+        # Close the least recently used mappings; views handed out keep theirs alive
+        while len(self._open_buffers) > self.max_open_files:
+            _, (old_mapping, _) = self._open_buffers.popitem(last=False)
+            old_mapping.flush()
+            
+        return buffer
+
+def create_bar_store():
+    """Build the backend selected by BAR_STORE_BACKEND ('sql' by default, or 'mmap')"""
+    backend = os.getenv("BAR_STORE_BACKEND", "sql").lower()
+    if backend == "mmap":
+        return MmapBarStore(
+            os.getenv("BAR_STORE_PATH", "./bar_data"),
+            capacity=MAX_DATA_POINTS,
+            max_open_files=int(os.getenv("BAR_STORE_MAX_OPEN_FILES", "512"))
+        )
+    if backend != "sql":
+        raise ValueError(f"Unknown BAR_STORE_BACKEND '{backend}', expected 'sql' or 'mmap'")
+    return SqlBarStore()
+
+# Global instance
+bar_store = create_bar_store()
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class BriefingCache:
+    """
+    TTL + LRU cache of generated AI briefings.
+    Keys carry everything a briefing depends on (watchlist, tickers, newest bar), so a hit is
+    always current and entries only expire to bound memory and staleness. Concurrent misses
+    for one key share a single in-flight generation instead of each calling the model.
+    """
+    
+    def __init__(self):
+        self.ttl = float(os.getenv("BRIEFING_CACHE_TTL_SECONDS", "300"))
+        self.max_entries = int(os.getenv("BRIEFING_CACHE_MAX_ENTRIES", "1000"))
+        # key -> (expiry on the monotonic clock, briefing), least recently used first
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        
+    def __len__(self) -> int:
+        return len(self.entries)
+        
+    async def get_or_create(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """The cached value for a key, generating it with `factory` at most once at a time"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self.entries[key]
+            
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(factory())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # Shielded so a caller that goes away does not cancel the generation others are waiting on
+        return await asyncio.shield(task)
+        
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        self.in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            # Failures are not cached; the next request tries again
+            return
+        self.entries[key] = (time.monotonic() + self.ttl, task.result())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+# Global instance
+briefing_cache = BriefingCache()
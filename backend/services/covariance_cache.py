@@ -0,0 +1,127 @@
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from services.price_cache import price_cache
+
+logger = logging.getLogger(__name__)
+
+class CovarianceCache:
+    """
+    Rolling covariance of daily returns for the tickers held in paper portfolios, plus the market.
+    A ring of the last `window` return rows is kept together with their running sums and
+    cross-product matrix. Each generator tick swaps the oldest row out of those totals and the
+    new one in (O(tickers^2)) instead of recomputing from the whole window, and the totals are
+    rebuilt from the price cache every `window` ticks so rounding error cannot accumulate.
+    Column 0 is the market: the equal-weighted return of every cached ticker, used for beta.
+    """
+    
+    def __init__(self, window: int = 250):
+        self.window = min(window, price_cache.capacity - 1)
+        self.max_tickers = 500
+        self.tickers: List[str] = []
+        self.columns: Dict[str, int] = {}  # ticker -> column, after the market column
+        self.returns: Optional[np.ndarray] = None  # (window, 1 + tickers) ring of return rows
+        self.position = 0  # Ring row the next tick overwrites
+        self.count = 0
+        self.sums: Optional[np.ndarray] = None
+        self.products: Optional[np.ndarray] = None
+        self.ticks_since_rebuild = 0
+        
+    def track(self, tickers: List[str]):
+        """Make sure the given tickers have columns, rebuilding the totals if any are new"""
+        missing = [ticker for ticker in tickers if ticker not in self.columns]
+        if not missing and self.returns is not None:
+            return
+        tracked = self.tickers + missing
+        if len(tracked) > self.max_tickers:
+            # Start over from just the tickers asked for now
+            tracked = list(dict.fromkeys(tickers))
+        self.rebuild(tracked)
+        
+    def rebuild(self, tickers: List[str]):
+        """Recompute the return window and its totals from the price cache"""
+        closes = {
+            ticker: buffer.window(self.window + 1)["close"]
+            for ticker, buffer in price_cache.buffers.items()
+            if len(buffer) > 1
+        }
+        length = max((len(column) for column in closes.values()), default=1)
+        # Align every series on its newest bar, as each tick adds one bar to every instrument
+        matrix = np.full((length, len(closes)), np.nan)
+        index = {}
+        for column, (ticker, values) in enumerate(closes.items()):
+            matrix[length - len(values):, column] = values
+            index[ticker] = column
+        with np.errstate(invalid="ignore", divide="ignore"):
+            all_returns = matrix[1:] / matrix[:-1] - 1
+            
+        rows = np.zeros((len(all_returns), 1 + len(tickers)))
+        if all_returns.shape[1]:
+            rows[:, 0] = np.nanmean(all_returns, axis=1)
+        for column, ticker in enumerate(tickers, start=1):
+            if ticker in index:
+                # Bars before a ticker's history began count as unchanged
+                rows[:, column] = np.nan_to_num(all_returns[:, index[ticker]])
+                
+        self.tickers = list(tickers)
+        self.columns = {ticker: column for column, ticker in enumerate(tickers, start=1)}
+        self.returns = np.zeros((self.window, 1 + len(tickers)))
+        self.count = len(rows)
+        self.returns[:self.count] = rows
+        self.position = self.count % self.window
+        self.sums = rows.sum(axis=0)
+        self.products = rows.T @ rows
+        self.ticks_since_rebuild = 0
+        
+    def append(self, tickers: List[str], previous_closes: np.ndarray, closes: np.ndarray):
+        """Roll one generator tick (every instrument's previous and new close) into the totals"""
+        if self.returns is None:
+            return
+            
+        with np.errstate(invalid="ignore", divide="ignore"):
+            tick_returns = closes / previous_closes - 1
+        valid = np.isfinite(tick_returns)
+        row = np.zeros(1 + len(self.tickers))
+        row[0] = tick_returns[valid].mean() if valid.any() else 0.0
+        if self.tickers:
+            tick_columns = {ticker: column for column, ticker in enumerate(tickers)}
+            for ticker, column in self.columns.items():
+                tick_column = tick_columns.get(ticker)
+                if tick_column is not None and valid[tick_column]:
+                    row[column] = tick_returns[tick_column]
+                    
+        if self.count == self.window:
+            oldest = self.returns[self.position]
+            self.sums -= oldest
+            self.products -= np.outer(oldest, oldest)
+        else:
+            self.count += 1
+        self.returns[self.position] = row
+        self.sums += row
+        self.products += np.outer(row, row)
+        self.position = (self.position + 1) % self.window
+        
+        self.ticks_since_rebuild += 1
+        if self.ticks_since_rebuild >= self.window:
+            self.rebuild(self.tickers)
+            
+    def snapshot(self, tickers: List[str]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Covariance matrix and chronological return rows for the market followed by the given
+        tickers, or None with fewer than two returns. Call track() for the tickers first.
+        """
+        if self.returns is None or self.count < 2:
+            return None
+        selected = [0] + [self.columns[ticker] for ticker in tickers]
+        count = self.count
+        sums = self.sums[selected]
+        covariance = (self.products[np.ix_(selected, selected)] - np.outer(sums, sums) / count) / (count - 1)
+        
+        if count < self.window:
+            rows = self.returns[:count]
+        else:
+            rows = np.roll(self.returns, -self.position, axis=0)
+        return covariance, rows[:, selected]
+
+# Global instance
+covariance_cache = CovarianceCache()
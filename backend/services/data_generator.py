@@ -1,26 +1,80 @@
 import asyncio
-import random
+import time
+import numpy as np
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from database import SessionLocal
-from models import Stock, StockDataPoint
+from models import Instrument
+from services.bar_store import bar_store, MAX_DATA_POINTS
 from services.price_alert_service import price_alert_service
+from services.paper_trading_service import paper_trading_service
+from services.portfolio_valuation import portfolio_valuations
+from services.price_cache import price_cache, to_timestamp
+from services.covariance_cache import covariance_cache
+from services.equity_curve import equity_curve
+from services.price_stream import price_stream
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def simulate_next_bars(base_prices: np.ndarray, rng: np.random.Generator) -> dict:
+    """
+    Generate the next OHLCV bar for many stocks at once.
+    Uses the same distributions as the historical generator:
+    close moves -3%..+3%, open stays within 0.5% of the previous close,
+    high/low extend up to 1% beyond the open/close range.
+    """
+    count = len(base_prices)
+    close_prices = base_prices * (1 + rng.uniform(-0.03, 0.03, count))
+    open_prices = base_prices * (1 + rng.uniform(-0.005, 0.005, count))
+    high_prices = np.maximum(open_prices, close_prices) * (1 + rng.uniform(0, 0.01, count))
+    low_prices = np.minimum(open_prices, close_prices) * (1 - rng.uniform(0, 0.01, count))
+    volumes = rng.integers(1_000_000, 10_000_000, count, endpoint=True)
+    
+    return {
+        "open": open_prices,
+        "high": high_prices,
+        "low": low_prices,
+        "close": close_prices,
+        "volume": volumes
+    }
+
+def simulate_history(base_price: float, days: int, rng: np.random.Generator) -> dict:
+    """
+    Generate `days` consecutive OHLCV bars for one stock as a vectorized random walk.
+    Each bar uses the same distributions as simulate_next_bars, with the previous
+    bar's close as its base price.
+    """
+    close_prices = base_price * np.cumprod(1 + rng.uniform(-0.03, 0.03, days))
+    previous_closes = np.concatenate(([base_price], close_prices[:-1]))
+    open_prices = previous_closes * (1 + rng.uniform(-0.005, 0.005, days))
+    high_prices = np.maximum(open_prices, close_prices) * (1 + rng.uniform(0, 0.01, days))
+    low_prices = np.minimum(open_prices, close_prices) * (1 - rng.uniform(0, 0.01, days))
+    volumes = rng.integers(1_000_000, 10_000_000, days, endpoint=True)
+    
+    return {
+        "open": open_prices,
+        "high": high_prices,
+        "low": low_prices,
+        "close": close_prices,
+        "volume": volumes
+    }
+
 class StockDataGenerator:
     """
     Background service that generates synthetic stock data every 3 seconds.
     Each data point represents 1 day in the database.
-    Maintains only 365 data points per stock.
+    Maintains only 365 data points per instrument (one series per ticker,
+    shared by every watchlist that holds it).
+    All instruments are advanced together in one batch per tick.
     """
     
     def __init__(self):
         self.running = False
         self.last_prices = {}  # Cache of last prices for each stock
+        self.last_tick_stats = None  # Stock count and per-phase timings of the last tick
+        self.rng = np.random.default_rng()
         
     async def start(self):
         """Start the data generator"""
@@ -31,6 +85,7 @@ class StockDataGenerator:
     async def stop(self):
         """Stop the data generator"""
         self.running = False
+        bar_store.flush()
         logger.info("Stock data generator stopped")
         
     async def _generate_loop(self):
@@ -44,170 +99,167 @@ class StockDataGenerator:
                 await asyncio.sleep(3)
                 
     async def _generate_data_for_all_stocks(self):
-        """Generate data for all stocks in the database"""
+        """Generate one data point for every instrument in a single batch tick"""
         db = SessionLocal()
+        timings = {}
+        tick_started = time.perf_counter()
         try:
-            # Get all stocks
-            stocks = db.query(Stock).all()
+            # Load every instrument together with its latest data point in one pass
+            phase_started = time.perf_counter()
+            rows = bar_store.load_latest(db)
+            timings["load"] = time.perf_counter() - phase_started
             
-            if not stocks:
+            if not rows:
                 return
             
-            for stock in stocks:
-                self._generate_data_point(db, stock)
+            # Simulate the next bar for all instruments in one NumPy pass
+            phase_started = time.perf_counter()
+            instrument_ids = [row[0] for row in rows]
+            tickers = [row[1] for row in rows]
+            base_prices = np.array([
+                self.last_prices.get(ticker, close if close is not None else np.nan)
+                for _, ticker, _, close in rows
+            ], dtype=np.float64)
+            missing = np.isnan(base_prices)
+            base_prices[missing] = self.rng.uniform(50, 500, int(missing.sum()))
+            
+            fallback_date = datetime.now() - timedelta(days=365)
+            next_dates = [
+                date + timedelta(days=1) if date else fallback_date
+                for _, _, date, _ in rows
+            ]
+            
+            bars = simulate_next_bars(base_prices, self.rng)
+            rounded_bars = {
+                "open": np.round(bars["open"], 2),
+                "high": np.round(bars["high"], 2),
+                "low": np.round(bars["low"], 2),
+                "close": np.round(bars["close"], 2),
+                "volume": bars["volume"]
+            }
+            timings["simulate"] = time.perf_counter() - phase_started
             
+            # Write all new bars in one batch to the configured bar store
+            phase_started = time.perf_counter()
+            bar_store.append_bars(db, instrument_ids, tickers, next_dates, rounded_bars)
+            timings["insert"] = time.perf_counter() - phase_started
+            
+            # Keep only the newest MAX_DATA_POINTS per instrument (one set-based delete on SQL)
+            phase_started = time.perf_counter()
+            bar_store.prune(db)
+            timings["prune"] = time.perf_counter() - phase_started
+            
+            phase_started = time.perf_counter()
             db.commit()
-            logger.info(f"Generated data points for {len(stocks)} stocks")
+            timings["commit"] = time.perf_counter() - phase_started
+            
+            # Update the last price cache and the in-memory bar cache
+            self.last_prices.update(zip(tickers, bars["close"].tolist()))
+            price_cache.append_bars(tickers, next_dates, rounded_bars)
+            # Roll the tick into the risk covariance window right away, so it never lags the cache
+            previous_closes = np.array([close if close is not None else np.nan for _, _, _, close in rows], dtype=np.float64)
+            covariance_cache.append(tickers, previous_closes, rounded_bars["close"])
             
-            # Check price alerts for all updated stocks
-            for stock in stocks:
-                if stock.ticker in self.last_prices:
-                    await price_alert_service.check_price_alerts(
-                        stock.ticker, 
-                        self.last_prices[stock.ticker]
-                    )
+            # Push the new quotes to WebSocket subscribers (never blocks on slow clients)
+            price_stream.publish(tickers)
+            
+            timings["total"] = time.perf_counter() - tick_started
+            self.last_tick_stats = {
+                "instruments": len(rows),
+                "timings_ms": {phase: round(seconds * 1000, 2) for phase, seconds in timings.items()}
+            }
+            logger.info(
+                f"Generated data points for {len(rows)} instruments in {timings['total'] * 1000:.1f} ms "
+                f"(load {timings['load'] * 1000:.1f}, simulate {timings['simulate'] * 1000:.1f}, "
+                f"insert {timings['insert'] * 1000:.1f}, prune {timings['prune'] * 1000:.1f}, "
+                f"commit {timings['commit'] * 1000:.1f})"
+            )
+            
+            # Check price alerts for all updated tickers in one batch
+            await price_alert_service.check_price_alerts_batch(
+                {ticker: self.last_prices[ticker] for ticker in tickers}
+            )
+            
+            # Fill resting paper orders crossed by the new closing prices, then revalue
+            # the tracked portfolios that hold an updated ticker
+            closes = dict(zip(tickers, rounded_bars["close"].tolist()))
+            await paper_trading_service.match_resting_orders(closes)
+            portfolio_valuations.revalue(closes)
+            
+            # Write the tracked accounts' values to the equity curve when a snapshot is due
+            equity_curve.record(db)
             
         except Exception as e:
             logger.error(f"Error generating data: {e}")
             db.rollback()
         finally:
             db.close()
-            
-    def _generate_data_point(self, db: Session, stock: Stock):
-        """Generate a single data point for a stock"""
-        ticker = stock.ticker
-        
-        # Get the last data point for this stock to determine the next date
-        last_point = db.query(StockDataPoint)\
-            .filter(StockDataPoint.stock_id == stock.id)\
-            .order_by(StockDataPoint.date.desc())\
-            .first()
-        
-        # Determine the base price
-        if ticker in self.last_prices:
-            base_price = self.last_prices[ticker]
-        elif last_point:
-            base_price = last_point.close
-        else:
-            # Initialize with a random price between 50 and 500
-            base_price = random.uniform(50, 500)
-        
-        # Determine the next date (1 day after the last point)
-        if last_point:
-            next_date = last_point.date + timedelta(days=1)
-        else:
-            # Start from 365 days ago
-            next_date = datetime.now() - timedelta(days=365)
-        
-        # Generate realistic OHLCV data
-        # Daily change between -3% and +3%
-        change_percent = random.uniform(-0.03, 0.03)
-        close_price = base_price * (1 + change_percent)
-        
-        # Open price is close to yesterday's close
-        open_price = base_price * (1 + random.uniform(-0.005, 0.005))
-        
-        # High is the maximum of open, close, and some random variation
-        high_price = max(open_price, close_price) * (1 + random.uniform(0, 0.01))
-        
-        # Low is the minimum of open, close, and some random variation
-        low_price = min(open_price, close_price) * (1 - random.uniform(0, 0.01))
-        
-        # Volume is random between 1M and 10M
-        volume = random.randint(1_000_000, 10_000_000)
-        
-        # Create the data point
-        data_point = StockDataPoint(
-            stock_id=stock.id,
-            date=next_date,
-            open=round(open_price, 2),
-            high=round(high_price, 2),
-            low=round(low_price, 2),
-            close=round(close_price, 2),
-            volume=volume
-        )
-        
-        db.add(data_point)
-        
-        # Update the last price cache
-        self.last_prices[ticker] = close_price
-        
-        # Clean up old data points (keep only 365)
-        total_points = db.query(func.count(StockDataPoint.id))\
-            .filter(StockDataPoint.stock_id == stock.id)\
-            .scalar()
-        
-        if total_points >= 365:
-            # Delete the oldest points to keep only 365
-            points_to_delete = total_points - 365 + 1  # +1 for the one we just added
-            oldest_points = db.query(StockDataPoint)\
-                .filter(StockDataPoint.stock_id == stock.id)\
-                .order_by(StockDataPoint.date.asc())\
-                .limit(points_to_delete)\
-                .all()
-            
-            for point in oldest_points:
-                db.delete(point)
-                
-    async def initialize_stock_data(self, stock_id: int):
-        """Initialize historical data for a newly added stock"""
+    
+    async def initialize_stock_data(self, instrument_id: int):
+        """Initialize historical data for a newly added instrument"""
         db = SessionLocal()
         try:
-            stock = db.query(Stock).filter(Stock.id == stock_id).first()
-            if not stock:
+            instrument = db.query(Instrument).filter(Instrument.id == instrument_id).first()
+            if not instrument:
                 return
             
-            # Check if stock already has data
-            existing_count = db.query(func.count(StockDataPoint.id))\
-                .filter(StockDataPoint.stock_id == stock_id)\
-                .scalar()
-            
-            if existing_count > 0:
-                logger.info(f"Stock {stock.ticker} already has {existing_count} data points")
+            history = self.backfill_history(db, instrument.id, instrument.ticker)
+            if history is None:
                 return
             
-            # Generate 365 days of historical data
-            base_price = random.uniform(50, 500)
-            current_price = base_price
-            start_date = datetime.now() - timedelta(days=365)
-            
-            logger.info(f"Initializing 365 days of data for {stock.ticker}")
-            
-            for i in range(365):
-                current_date = start_date + timedelta(days=i)
-                
-                # Generate realistic OHLCV data
-                change_percent = random.uniform(-0.03, 0.03)
-                close_price = current_price * (1 + change_percent)
-                open_price = current_price * (1 + random.uniform(-0.005, 0.005))
-                high_price = max(open_price, close_price) * (1 + random.uniform(0, 0.01))
-                low_price = min(open_price, close_price) * (1 - random.uniform(0, 0.01))
-                volume = random.randint(1_000_000, 10_000_000)
-                
-                data_point = StockDataPoint(
-                    stock_id=stock_id,
-                    date=current_date,
-                    open=round(open_price, 2),
-                    high=round(high_price, 2),
-                    low=round(low_price, 2),
-                    close=round(close_price, 2),
-                    volume=volume
-                )
-                
-                db.add(data_point)
-                current_price = close_price
-            
-            # Update the last price cache
-            self.last_prices[stock.ticker] = current_price
-            
             db.commit()
-            logger.info(f"Initialized 365 data points for {stock.ticker}")
+            self.cache_history(instrument.ticker, history)
+            logger.info(f"Initialized {MAX_DATA_POINTS} data points for {instrument.ticker}")
             
         except Exception as e:
             logger.error(f"Error initializing stock data: {e}")
             db.rollback()
         finally:
             db.close()
+    
+    def backfill_history(self, db: Session, instrument_id: int, ticker: str):
+        """
+        Write a year of synthetic history for an instrument that has none yet.
+        The whole series is generated as arrays and stored with one bulk write;
+        the caller commits. Returns (dates, bars) or None if data already exists.
+        """
+        # Check if the instrument already has data (another watchlist added it first)
+        existing_count = bar_store.count_bars(db, instrument_id, ticker)
+        
+        if existing_count > 0:
+            logger.info(f"Stock {ticker} already has {existing_count} data points")
+            return None
+        
+        dates, rounded_bars, last_close = self.generate_history()
+        bar_store.write_history(db, instrument_id, ticker, dates, rounded_bars)
+        
+        # Continue the live series from the unrounded last close
+        self.last_prices[ticker] = last_close
+        
+        return dates, rounded_bars
+        
+    def generate_history(self):
+        """Simulate 365 days of bars ending today; returns (dates, rounded bars, unrounded last close)"""
+        start_date = datetime.now() - timedelta(days=MAX_DATA_POINTS)
+        dates = [start_date + timedelta(days=i) for i in range(MAX_DATA_POINTS)]
+        
+        bars = simulate_history(self.rng.uniform(50, 500), MAX_DATA_POINTS, self.rng)
+        rounded_bars = {
+            "open": np.round(bars["open"], 2),
+            "high": np.round(bars["high"], 2),
+            "low": np.round(bars["low"], 2),
+            "close": np.round(bars["close"], 2),
+            "volume": bars["volume"]
+        }
+        return dates, rounded_bars, float(bars["close"][-1])
+    
+    def cache_history(self, ticker: str, history):
+        """Load a freshly written history into the in-memory price cache"""
+        dates, bars = history
+        price_cache.set_series(ticker, {
+            "timestamp": [to_timestamp(date) for date in dates],
+            **bars
+        })
 
 # Global instance
 data_generator = StockDataGenerator()
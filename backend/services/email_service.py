@@ -1,48 +1,224 @@
+import asyncio
+import logging
 import smtplib
 import os
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+class SmtpConnectionSlot:
+    """One worker's reusable authenticated SMTP connection, opened on first use"""
+    
+    def __init__(self):
+        self.server: Optional[smtplib.SMTP] = None
+        
+    def close(self):
+        """Close the connection, ignoring errors from an already broken one"""
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+        self.server = None
+
 class EmailService:
+    """
+    Outbound email through a bounded queue drained by a pool of async workers.
+    Each worker keeps one authenticated SMTP connection open and sends queued
+    messages in batches from a thread, so a slow mail server never blocks the
+    event loop. Failed messages are retried with exponential backoff.
+    """
+    
     def __init__(self):
         self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
         self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
+        self.smtp_use_tls = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
         self.email = os.getenv("EMAIL_USER")
         self.password = os.getenv("EMAIL_PASSWORD")
         
+        self.worker_count = int(os.getenv("EMAIL_WORKERS", "4"))
+        self.queue_size = int(os.getenv("EMAIL_QUEUE_SIZE", "1000"))
+        self.batch_size = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+        self.max_attempts = int(os.getenv("EMAIL_MAX_ATTEMPTS", "4"))
+        self.retry_base_delay = float(os.getenv("EMAIL_RETRY_BASE_DELAY", "1.0"))
+        
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.slots: List[SmtpConnectionSlot] = []
+        self.stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0, "dropped": 0}
+        
+    def start(self):
+        """Start the worker pool on the running event loop (idempotent)"""
+        if self.workers:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.slots = [SmtpConnectionSlot() for _ in range(self.worker_count)]
+        self.workers = [asyncio.create_task(self._worker(slot)) for slot in self.slots]
+        
+    async def stop(self, timeout: float = 10.0):
+        """Give queued messages a chance to go out, then stop workers and close connections"""
+        if not self.workers:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Email queue stopped with {self.queue.qsize()} messages unsent")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        for slot in self.slots:
+            await asyncio.to_thread(slot.close)
+        self.workers = []
+        self.slots = []
+        
+    @property
+    def configured(self) -> bool:
+        """Whether SMTP credentials are set"""
+        return bool(self.email and self.password)
+        
+    def enqueue(self, message: MIMEMultipart, result: Optional[asyncio.Future] = None) -> bool:
+        """
+        Queue a message for delivery without waiting; False if the queue is full.
+        If a future is given it is resolved with True once sent or False once given up on.
+        """
+        self.start()
+        try:
+            self.queue.put_nowait((message, 1, result))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            logger.warning(f"Email queue full, dropping message to {message['To']}")
+            return False
+        self.stats["queued"] += 1
+        return True
+        
+    async def deliver(self, message: MIMEMultipart) -> bool:
+        """Queue a message and wait until it is sent (True) or given up on (False)"""
+        result = asyncio.get_running_loop().create_future()
+        if not self.enqueue(message, result):
+            return False
+        return await result
+        
+    def build_price_alert_message(self, alert_data: dict) -> MIMEMultipart:
+        """Create the price alert email for a triggered alert"""
+        msg = MIMEMultipart()
+        msg['From'] = self.email
+        msg['To'] = alert_data['email']
+        msg['Subject'] = f"🚨 Price Alert: {alert_data['stock_ticker']} - {alert_data['trigger_type'].title()} Threshold Reached"
+        
+        # Create HTML body
+        html_body = self._create_alert_email_body(alert_data)
+        msg.attach(MIMEText(html_body, 'html'))
+        return msg
+        
     async def send_price_alert(self, alert_data: dict):
-        """Send price alert email notification"""
+        """Queue a price alert email notification; returns whether it was accepted"""
         try:
-            if not self.email or not self.password:
+            if not self.configured:
                 print("Email credentials not configured. Skipping email notification.")
                 return False
             
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = self.email
-            msg['To'] = alert_data['email']
-            msg['Subject'] = f"🚨 Price Alert: {alert_data['stock_ticker']} - {alert_data['trigger_type'].title()} Threshold Reached"
+            # Delivery happens on the worker pool
+            return self.enqueue(self.build_price_alert_message(alert_data))
             
-            # Create HTML body
-            html_body = self._create_alert_email_body(alert_data)
-            msg.attach(MIMEText(html_body, 'html'))
+        except Exception as e:
+            print(f"Error queueing price alert email: {e}")
+            return False
+    
+    async def _worker(self, slot: SmtpConnectionSlot):
+        """Drain the queue in batches over this worker's connection"""
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
             
-            # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.email, self.password)
-                server.send_message(msg)
+            try:
+                failures = await asyncio.to_thread(self._send_batch, slot, batch)
+            except Exception as e:
+                failures = [(item, e) for item in batch]
             
-            print(f"Price alert email sent to {alert_data['email']} for {alert_data['stock_ticker']}")
-            return True
+            self.stats["sent"] += len(batch) - len(failures)
+            failed_items = {id(item) for item, _ in failures}
+            for item in batch:
+                if id(item) not in failed_items:
+                    self._resolve(item[2], True)
+            for (message, attempt, result), error in failures:
+                self._schedule_retry(message, attempt, result, error)
+            for _ in batch:
+                self.queue.task_done()
+                
+    def _schedule_retry(self, message: MIMEMultipart, attempt: int, result: Optional[asyncio.Future], error: Exception):
+        """Requeue a failed message after an exponential backoff, or give up"""
+        if attempt >= self.max_attempts:
+            self.stats["failed"] += 1
+            logger.error(f"Giving up on email to {message['To']} after {attempt} attempts: {error}")
+            self._resolve(result, False)
+            return
+        
+        delay = self.retry_base_delay * 2 ** (attempt - 1)
+        self.stats["retried"] += 1
+        logger.warning(f"Email to {message['To']} failed ({error}), retrying in {delay:.1f}s")
+        
+        def requeue():
+            try:
+                self.queue.put_nowait((message, attempt + 1, result))
+            except asyncio.QueueFull:
+                self.stats["dropped"] += 1
+                logger.warning(f"Email queue full, dropping retry to {message['To']}")
+                self._resolve(result, False)
+        
+        asyncio.get_running_loop().call_later(delay, requeue)
+        
+    def _resolve(self, result: Optional[asyncio.Future], sent: bool):
+        if result is not None and not result.done():
+            result.set_result(sent)
             
-        except Exception as e:
-            print(f"Error sending price alert email: {e}")
-            return False
+    def _send_batch(self, slot: SmtpConnectionSlot, batch: List[Tuple[MIMEMultipart, int, Optional[asyncio.Future]]]) -> List[Tuple[Tuple, Exception]]:
+        """Send a batch over one connection (runs in a thread); returns the items that failed"""
+        failures = []
+        for item in batch:
+            try:
+                self._send_message(slot, item[0])
+            except Exception as e:
+                failures.append((item, e))
+        return failures
+        
+    def _send_message(self, slot: SmtpConnectionSlot, message: MIMEMultipart):
+        """Send over the slot's connection, reconnecting once if the server dropped it"""
+        for reconnect in (False, True):
+            if slot.server is None:
+                slot.server = self._connect()
+            try:
+                slot.server.send_message(message)
+                return
+            except smtplib.SMTPServerDisconnected:
+                slot.server = None
+                if reconnect:
+                    raise
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # The server rejected this message but the session is still usable
+                raise
+            except Exception:
+                slot.close()
+                raise
+            
+    def _connect(self) -> smtplib.SMTP:
+        """Open and authenticate a new SMTP connection"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+        try:
+            if self.smtp_use_tls:
+                server.starttls()
+            server.login(self.email, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
     
     def _create_alert_email_body(self, alert_data: dict):
         """Create HTML email body for price alert"""
@@ -153,10 +329,12 @@ class EmailService:
             
             msg.attach(MIMEText(body, 'html'))
             
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.email, self.password)
-                server.send_message(msg)
+            # Sent directly on a fresh connection so configuration errors surface here
+            def send():
+                with self._connect() as server:
+                    server.send_message(msg)
+            
+            await asyncio.to_thread(send)
             
             return True, "Test email sent successfully"
             
@@ -0,0 +1,116 @@
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import Integer, cast, func, insert
+from sqlalchemy.orm import Session
+from models import PaperEquitySnapshot
+from services.portfolio_valuation import portfolio_valuations
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class EquityCurve:
+    """
+    Time series of paper account values.
+    On every generator tick that falls due, the total value of each account whose value moved
+    since its last snapshot (it traded, or a holding was repriced) is written in one bulk
+    insert, so idle accounts add no rows and no trades ever have to be replayed to chart
+    past values; a curve simply holds its last value between snapshots. Reads downsample the series into equal time buckets in SQL, so a long
+    history never has to be loaded into Python.
+    """
+    
+    def __init__(self):
+        self.interval = float(os.getenv("PAPER_EQUITY_SNAPSHOT_INTERVAL", "60"))  # Seconds between snapshots
+        self.last_recorded_at: Optional[datetime] = None
+        
+    def record(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Snapshot every changed account if the interval has passed; returns how many were written"""
+        now = now or datetime.now()
+        if self.last_recorded_at is not None and (now - self.last_recorded_at).total_seconds() < self.interval:
+            return 0
+            
+        accounts = portfolio_valuations.accounts
+        rows = [
+            {
+                "account_id": account_id,
+                "recorded_at": now,
+                "total_value": round(accounts[account_id].total_value, 2)
+            }
+            for account_id in portfolio_valuations.changed if account_id in accounts
+        ]
+        if not rows:
+            # Nothing written, so the first account to change is snapshotted on the next tick
+            return 0
+        db.execute(insert(PaperEquitySnapshot), rows)
+        db.commit()
+        portfolio_valuations.changed.clear()
+        self.last_recorded_at = now
+        return len(rows)
+        
+    def get_curve(self, db: Session, account_id: int, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None, points: int = 200) -> List[Dict]:
+        """
+        An account's values between start and end (oldest first) in at most `points` points.
+        Each point covers an equal slice of time and carries the slice's last value, its
+        high and low, and the time of its last snapshot.
+        """
+        filters = [PaperEquitySnapshot.account_id == account_id]
+        if start is not None:
+            filters.append(PaperEquitySnapshot.recorded_at >= start)
+        if end is not None:
+            filters.append(PaperEquitySnapshot.recorded_at <= end)
+            
+        epoch = self._epoch_seconds(db)
+        first, last, count = db.query(func.min(epoch), func.max(epoch), func.count(PaperEquitySnapshot.id))\
+            .filter(*filters)\
+            .one()
+        if not count:
+            return []
+            
+        if count <= points:
+            rows = db.query(
+                PaperEquitySnapshot.recorded_at,
+                PaperEquitySnapshot.total_value,
+                PaperEquitySnapshot.total_value,
+                PaperEquitySnapshot.total_value
+            ).filter(*filters)\
+             .order_by(PaperEquitySnapshot.recorded_at, PaperEquitySnapshot.id)\
+             .all()
+        else:
+            # Widened slightly so the newest snapshot still lands in the last bucket
+            span = (float(last) - float(first)) * (1 + 1e-9) + 1e-6
+            bucket = cast((epoch - float(first)) * points / span, Integer)
+            buckets = db.query(
+                func.max(PaperEquitySnapshot.id).label("last_id"),
+                func.max(PaperEquitySnapshot.total_value).label("high"),
+                func.min(PaperEquitySnapshot.total_value).label("low")
+            ).filter(*filters)\
+             .group_by(bucket)\
+             .subquery()
+            # Snapshots are inserted in time order, so the highest id in a bucket is its last value
+            rows = db.query(
+                PaperEquitySnapshot.recorded_at,
+                PaperEquitySnapshot.total_value,
+                buckets.c.high,
+                buckets.c.low
+            ).join(buckets, buckets.c.last_id == PaperEquitySnapshot.id)\
+             .order_by(PaperEquitySnapshot.recorded_at, PaperEquitySnapshot.id)\
+             .all()
+             
+        return [
+            {"recorded_at": recorded_at, "total_value": value, "high": high, "low": low}
+            for recorded_at, value, high, low in rows
+        ]
+        
+    def _epoch_seconds(self, db: Session):
+        """SQL expression for a snapshot's time in seconds since the epoch"""
+        if db.get_bind().dialect.name == "postgresql":
+            return func.extract("epoch", PaperEquitySnapshot.recorded_at)
+        # SQLite: julianday() keeps fractional seconds, unlike strftime('%s')
+        return (func.julianday(PaperEquitySnapshot.recorded_at) - 2440587.5) * 86400.0
+
+# Global instance
+equity_curve = EquityCurve()
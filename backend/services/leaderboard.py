@@ -0,0 +1,61 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+from sortedcontainers import SortedList
+
+logger = logging.getLogger(__name__)
+
+class Leaderboard:
+    """
+    Paper accounts ranked by total value (every account starts with the same cash, so this is
+    also the ranking by return). Entries are (-value, account id) in a SortedList, so moving an
+    account, reading a rank and slicing the top N are all logarithmic in the number of accounts.
+    The valuation book pushes a new value whenever a trade or tick changes an account.
+    """
+    
+    def __init__(self):
+        self.ranking = SortedList()
+        self.values: Dict[int, float] = {}
+        
+    def __len__(self) -> int:
+        return len(self.values)
+        
+    def update(self, account_id: int, total_value: float):
+        """Move an account to the position of its new total value"""
+        total_value = round(total_value, 2)
+        previous = self.values.get(account_id)
+        if previous == total_value:
+            return
+        if previous is not None:
+            self.ranking.remove((-previous, account_id))
+        self.ranking.add((-total_value, account_id))
+        self.values[account_id] = total_value
+        
+    def remove(self, account_id: int):
+        """Take an account off the leaderboard"""
+        previous = self.values.pop(account_id, None)
+        if previous is not None:
+            self.ranking.remove((-previous, account_id))
+            
+    def rank(self, account_id: int) -> Optional[int]:
+        """1-based rank of an account; accounts with equal values share the best rank among them"""
+        total_value = self.values.get(account_id)
+        if total_value is None:
+            return None
+        return self.ranking.bisect_left((-total_value, -1)) + 1
+        
+    def top(self, limit: int, offset: int = 0) -> List[Tuple[int, int, float]]:
+        """(rank, account id, total value) of `limit` accounts from `offset`, best first"""
+        entries = self.ranking[offset:offset + limit]
+        if not entries:
+            return []
+            
+        ranked = []
+        rank = self.ranking.bisect_left((entries[0][0], -1)) + 1
+        for position, (negative_value, account_id) in enumerate(entries, start=offset + 1):
+            if ranked and negative_value != -ranked[-1][2]:
+                rank = position
+            ranked.append((rank, account_id, -negative_value))
+        return ranked
+
+# Global instance
+leaderboard = Leaderboard()
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List
+from dotenv import load_dotenv
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import NotificationOutbox
+from services.email_service import email_service
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class NotificationDispatcher:
+    """
+    Delivers rows from the notification outbox independently of whatever wrote them.
+    Due rows are claimed in batches (FOR UPDATE SKIP LOCKED on PostgreSQL, so several
+    dispatchers can share the table) and marked sending while delivery is in flight.
+    The claim is renewed while delivery is in flight (SMTP retries can outlast the lease),
+    so only a claim left behind by a crashed process expires and is picked up again;
+    every notification is delivered at least once.
+    """
+    
+    def __init__(self):
+        self.batch_size = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+        self.poll_interval = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+        self.max_attempts = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+        self.retry_base_delay = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", "30"))
+        self.claim_lease = timedelta(seconds=int(os.getenv("OUTBOX_CLAIM_LEASE_SECONDS", "300")))
+        self.running = False
+        self.wakeup = asyncio.Event()
+        
+    async def start(self):
+        """Start the dispatch loop"""
+        self.running = True
+        if not email_service.configured:
+            logger.warning("Email credentials not configured; outbox notifications stay pending")
+        logger.info("Notification dispatcher started")
+        await self._dispatch_loop()
+        
+    async def stop(self):
+        """Stop the dispatch loop after the batch in flight"""
+        self.running = False
+        self.wakeup.set()
+        logger.info("Notification dispatcher stopped")
+        
+    def wake(self):
+        """Dispatch right away instead of waiting for the next poll (e.g. after a trigger commits)"""
+        self.wakeup.set()
+        
+    async def _dispatch_loop(self):
+        """Deliver due notifications until stopped, polling when idle"""
+        while self.running:
+            try:
+                delivered = await self.dispatch_batch() if email_service.configured else 0
+                if delivered:
+                    continue
+            except Exception as e:
+                logger.error(f"Error dispatching notifications: {e}")
+                
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            
+    async def dispatch_batch(self) -> int:
+        """Claim and deliver one batch of due notifications; returns how many were claimed"""
+        db = SessionLocal()
+        try:
+            claimed = self._claim_batch(db)
+            if not claimed:
+                return 0
+                
+            renewal = asyncio.create_task(self._renew_claims([row["id"] for row in claimed]))
+            try:
+                results = await asyncio.gather(*(self._deliver(row) for row in claimed), return_exceptions=True)
+            finally:
+                renewal.cancel()
+                await asyncio.gather(renewal, return_exceptions=True)
+            self._record_results(db, claimed, results)
+            return len(claimed)
+        finally:
+            db.close()
+            
+    def _claim_batch(self, db: Session) -> List[Dict]:
+        """Mark up to batch_size due rows as sending and return their contents"""
+        now = datetime.now()
+        due = or_(
+            and_(NotificationOutbox.status == "pending", NotificationOutbox.available_at <= now),
+            and_(NotificationOutbox.status == "sending", NotificationOutbox.claimed_at < now - self.claim_lease)
+        )
+        rows = db.query(NotificationOutbox)\
+            .filter(due)\
+            .order_by(NotificationOutbox.id)\
+            .limit(self.batch_size)\
+            .with_for_update(skip_locked=True)\
+            .all()
+            
+        claimed = []
+        for row in rows:
+            row.status = "sending"
+            row.claimed_at = now
+            row.attempts += 1
+            # Copied out so delivery needs no further reads once the claim is committed
+            claimed.append({
+                "id": row.id,
+                "kind": row.kind,
+                "recipient": row.recipient,
+                "payload": row.payload,
+                "attempts": row.attempts
+            })
+        db.commit()
+        return claimed
+        
+    async def _renew_claims(self, ids: List[int]):
+        """Keep extending the lease on claimed rows, three times per lease, until cancelled"""
+        while True:
+            await asyncio.sleep(self.claim_lease.total_seconds() / 3)
+            db = SessionLocal()
+            try:
+                db.query(NotificationOutbox)\
+                    .filter(NotificationOutbox.id.in_(ids), NotificationOutbox.status == "sending")\
+                    .update({"claimed_at": datetime.now()}, synchronize_session=False)
+                db.commit()
+            except Exception as e:
+                logger.error(f"Error renewing notification claims: {e}")
+            finally:
+                db.close()
+                
+    async def _deliver(self, row: Dict) -> bool:
+        """Send one notification through the email worker pool"""
+        if row["kind"] != "price_alert":
+            raise ValueError(f"Unknown notification kind '{row['kind']}'")
+            
+        alert_data = dict(row["payload"])
+        if alert_data.get("created_at"):
+            alert_data["created_at"] = datetime.fromisoformat(alert_data["created_at"])
+        return await email_service.deliver(email_service.build_price_alert_message(alert_data))
+        
+    def _record_results(self, db: Session, rows: List[Dict], results: list):
+        """Mark delivered rows sent and schedule the rest for another attempt"""
+        now = datetime.now()
+        sent_ids = [row["id"] for row, result in zip(rows, results) if result is True]
+        if sent_ids:
+            db.query(NotificationOutbox)\
+                .filter(NotificationOutbox.id.in_(sent_ids))\
+                .update({"status": "sent", "sent_at": now, "last_error": None}, synchronize_session=False)
+                
+        for row, result in zip(rows, results):
+            if result is True:
+                continue
+                
+            error = str(result) if isinstance(result, Exception) else "Delivery failed"
+            if row["attempts"] >= self.max_attempts:
+                changes = {"status": "failed", "last_error": error}
+                logger.error(f"Giving up on notification {row['id']} to {row['recipient']}: {error}")
+            else:
+                retry_delay = timedelta(seconds=self.retry_base_delay * 2 ** (row["attempts"] - 1))
+                changes = {"status": "pending", "last_error": error, "available_at": now + retry_delay}
+            db.query(NotificationOutbox)\
+                .filter(NotificationOutbox.id == row["id"])\
+                .update(changes, synchronize_session=False)
+        db.commit()
+
+# Global instance
+notification_dispatcher = NotificationDispatcher()
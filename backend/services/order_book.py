@@ -0,0 +1,77 @@
+import heapq
+import logging
+from typing import Dict, List, Tuple
+from sqlalchemy.orm import Session
+from models import PaperOrder
+
+logger = logging.getLogger(__name__)
+
+# For each kind of resting order: the sign applied to its price so that the order
+# closest to triggering sits at the top of a min-heap
+HEAP_SIGNS = {
+    ("buy", "limit"): -1,   # Fills at or below the limit: highest limit first
+    ("sell", "limit"): 1,   # Fills at or above the limit: lowest limit first
+    ("buy", "stop"): 1,     # Triggers at or above the stop: lowest stop first
+    ("sell", "stop"): -1    # Triggers at or below the stop: highest stop first
+}
+
+class OrderBook:
+    """
+    In-memory mirror of open paper orders.
+    Each ticker keeps one heap per order kind, keyed by (signed price, order id) so the
+    most marketable and then oldest order is on top. A tick only pops orders that cross;
+    cancelled orders are dropped lazily when they surface.
+    """
+    
+    def __init__(self):
+        self.books: Dict[str, Dict[Tuple[str, str], List[Tuple[float, int]]]] = {}
+        # order id -> (ticker, side, order type, trigger price) of every open order
+        self.orders: Dict[int, Tuple[str, str, str, float]] = {}
+        
+    def __len__(self) -> int:
+        return len(self.orders)
+        
+    def load_from_db(self, db: Session):
+        """Rebuild the book from every open order in the database"""
+        self.books.clear()
+        self.orders.clear()
+        for order in db.query(PaperOrder).filter(PaperOrder.status == "open").all():
+            self.add(order)
+        logger.info(f"Order book loaded {len(self.orders)} open orders")
+        
+    def add(self, order: PaperOrder):
+        """Rest an open order in the book"""
+        price = order.limit_price if order.order_type == "limit" else order.stop_price
+        ticker = order.stock_ticker.upper()
+        kind = (order.side, order.order_type)
+        self.orders[order.id] = (ticker, order.side, order.order_type, price)
+        heap = self.books.setdefault(ticker, {}).setdefault(kind, [])
+        heapq.heappush(heap, (HEAP_SIGNS[kind] * price, order.id))
+        
+    def remove(self, order_id: int):
+        """Take an order out of the book (its heap entry is skipped when it surfaces)"""
+        self.orders.pop(order_id, None)
+        
+    def match(self, prices: Dict[str, float]) -> Dict[int, float]:
+        """
+        Pop every order crossed by the given prices and return {order id: fill price}.
+        Limit orders fill at their limit price; stop orders fill at the tick price.
+        """
+        fills = {}
+        for ticker, price in prices.items():
+            book = self.books.get(ticker)
+            if not book:
+                continue
+            for kind, heap in book.items():
+                sign = HEAP_SIGNS[kind]
+                # The top crosses when the tick price is on its trigger side of the order price
+                while heap and (heap[0][1] not in self.orders or heap[0][0] <= sign * price):
+                    _, order_id = heapq.heappop(heap)
+                    entry = self.orders.pop(order_id, None)
+                    if entry is None:
+                        continue
+                    fills[order_id] = entry[3] if kind[1] == "limit" else price
+        return fills
+
+# Global instance
+order_book = OrderBook()
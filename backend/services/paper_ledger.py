@@ -0,0 +1,126 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+from models import PaperAccount, PaperPosition, PaperLedgerEvent, PaperLedgerSnapshot
+
+load_dotenv()
+
+def apply_event(cash_balance: float, positions: Dict[str, Dict], event: PaperLedgerEvent) -> float:
+    """Replay one ledger event onto (cash, positions) in place; returns the new cash balance"""
+    if event.event_type == "reset":
+        positions.clear()
+    elif event.event_type == "buy":
+        position = positions.get(event.stock_ticker)
+        if position:
+            total_shares = position["quantity"] + event.quantity
+            total_cost_basis = (position["quantity"] * position["average_buy_price"]) + event.quantity * event.price
+            position["average_buy_price"] = total_cost_basis / total_shares
+            position["quantity"] = total_shares
+        else:
+            positions[event.stock_ticker] = {"quantity": event.quantity, "average_buy_price": event.price}
+    elif event.event_type == "sell":
+        position = positions[event.stock_ticker]
+        position["quantity"] -= event.quantity
+        if position["quantity"] == 0:
+            del positions[event.stock_ticker]
+    return cash_balance + event.cash_delta
+
+class PaperLedger:
+    """
+    Append-only history of every paper account change, with a full snapshot every
+    snapshot_interval events. The state as of any time is the nearest earlier snapshot
+    plus at most snapshot_interval replayed events, however long the history is.
+    """
+    
+    def __init__(self):
+        self.snapshot_interval = int(os.getenv("PAPER_LEDGER_SNAPSHOT_INTERVAL", "100"))
+        
+    def open_account(self, db: Session, account: PaperAccount):
+        """Write the opening snapshot of a new account (which must already have an id)"""
+        self._snapshot(db, account, {})
+        
+    def record(self, db: Session, account: PaperAccount, event_type: str, cash_delta: float,
+               stock_ticker: Optional[str] = None, quantity: int = 0, price: Optional[float] = None):
+        """
+        Append an event for a change already applied to the account and its positions.
+        The sequence number lives on the version-checked account row, so concurrent
+        writers can never both claim the same one.
+        """
+        account.ledger_sequence += 1
+        db.add(PaperLedgerEvent(
+            account_id=account.id,
+            sequence=account.ledger_sequence,
+            event_type=event_type,
+            stock_ticker=stock_ticker,
+            quantity=quantity,
+            price=price,
+            cash_delta=cash_delta,
+            occurred_at=datetime.now()
+        ))
+        
+        if account.ledger_sequence % self.snapshot_interval == 0:
+            # Flush first so the positions query sees this transaction's changes
+            db.flush()
+            positions = {
+                position.stock_ticker: {"quantity": position.quantity, "average_buy_price": position.average_buy_price}
+                for position in db.query(PaperPosition).filter(PaperPosition.account_id == account.id).all()
+            }
+            self._snapshot(db, account, positions)
+            
+    def state_at(self, db: Session, account_id: int, as_of: datetime) -> Optional[Dict]:
+        """Cash and positions of an account as of a point in time (None if it had no history yet)"""
+        target = db.query(PaperLedgerEvent.sequence)\
+            .filter(PaperLedgerEvent.account_id == account_id, PaperLedgerEvent.occurred_at <= as_of)\
+            .order_by(PaperLedgerEvent.occurred_at.desc(), PaperLedgerEvent.sequence.desc())\
+            .limit(1)\
+            .scalar()
+            
+        snapshot_query = db.query(PaperLedgerSnapshot).filter(PaperLedgerSnapshot.account_id == account_id)
+        if target is None:
+            # No events yet: only the opening snapshot can apply
+            snapshot_query = snapshot_query.filter(PaperLedgerSnapshot.sequence == 0, PaperLedgerSnapshot.taken_at <= as_of)
+        else:
+            snapshot_query = snapshot_query.filter(PaperLedgerSnapshot.sequence <= target)
+        snapshot = snapshot_query.order_by(PaperLedgerSnapshot.sequence.desc()).first()
+        if snapshot is None:
+            return None
+            
+        cash_balance = snapshot.cash_balance
+        positions = {ticker: dict(position) for ticker, position in snapshot.positions.items()}
+        events: List[PaperLedgerEvent] = []
+        if target is not None and target > snapshot.sequence:
+            events = db.query(PaperLedgerEvent)\
+                .filter(
+                    PaperLedgerEvent.account_id == account_id,
+                    PaperLedgerEvent.sequence > snapshot.sequence,
+                    PaperLedgerEvent.sequence <= target
+                )\
+                .order_by(PaperLedgerEvent.sequence)\
+                .all()
+        for event in events:
+            cash_balance = apply_event(cash_balance, positions, event)
+            
+        return {
+            "as_of": as_of,
+            "sequence": target or 0,
+            "replayed_events": len(events),
+            "cash_balance": cash_balance,
+            "positions": [
+                {"stock_ticker": ticker, **position}
+                for ticker, position in sorted(positions.items())
+            ]
+        }
+        
+    def _snapshot(self, db: Session, account: PaperAccount, positions: Dict[str, Dict]):
+        db.add(PaperLedgerSnapshot(
+            account_id=account.id,
+            sequence=account.ledger_sequence,
+            cash_balance=account.virtual_cash_balance,
+            positions=positions,
+            taken_at=datetime.now()
+        ))
+
+# Global instance
+paper_ledger = PaperLedger()
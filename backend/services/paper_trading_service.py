@@ -1,18 +1,33 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from typing import Dict, List, Optional
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import and_, select, tuple_
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+import asyncio
 import logging
+import random
+import numpy as np
 
-from models import PaperAccount, PaperPosition, PaperTrade, User
-from schemas import PaperOrderRequest, PaperPortfolioSummary
+from database import SessionLocal
+from models import PaperAccount, PaperPosition, PaperTrade, PaperOrder, User
+from schemas import PaperOrderRequest, PaperBasketOrderRequest, PaperPortfolioSummary, PaperOrder as PaperOrderSchema
 from services.stock_service import stock_service
+from services.order_book import order_book
+from services.portfolio_valuation import portfolio_valuations, AccountValuation
+from services.paper_ledger import paper_ledger
+from services.leaderboard import leaderboard
 
 logger = logging.getLogger(__name__)
 
+BASKET_MODES = ("all_or_nothing", "best_effort")
+
 class PaperTradingService:
     def __init__(self):
         self.initial_cash_balance = 100000.0  # Starting with $100,000 virtual funds
+        self.max_fill_attempts = 8  # Tries per fill when concurrent orders change the same account
+        self.fill_retry_delay = 0.01  # Seconds; doubled on each retry, with jitter
+        self.max_basket_legs = 50
     
     async def get_or_create_paper_account(self, user_id: int, db: Session) -> PaperAccount:
         """Get existing paper account or create a new one for the user"""
@@ -24,299 +39,817 @@ class PaperTradingService:
                 virtual_cash_balance=self.initial_cash_balance
             )
             db.add(paper_account)
+            db.flush()
+            paper_ledger.open_account(db, paper_account)
             db.commit()
             db.refresh(paper_account)
+            # Track the new account right away so it is on the leaderboard before its first read
+            portfolio_valuations.seed(paper_account.id, user_id, paper_account.virtual_cash_balance, [], 0.0, 0.0)
             logger.info(f"Created new paper account for user {user_id}")
         
         return paper_account
     
     async def get_portfolio_summary(self, user_id: int, db: Session) -> PaperPortfolioSummary:
         """Get comprehensive portfolio summary for paper trading"""
+        return portfolio_valuations.summary(await self.get_valuation(user_id, db))
+        
+    async def get_valuation(self, user_id: int, db: Session) -> AccountValuation:
+        """The account's tracked valuation, seeded from the database on first use"""
+        # Tracked accounts are kept current by trades and ticks, so no queries are needed
+        valuation = portfolio_valuations.get(user_id)
+        if valuation is None:
+            valuation = await self._seed_valuation(user_id, db)
+        return valuation
+    
+    async def get_leaderboard(self, user_id: int, db: Session, limit: int = 10, offset: int = 0) -> Dict:
+        """A page of accounts ranked by return, plus the requesting user's own rank"""
+        valuation = await self.get_valuation(user_id, db)
+        entries = leaderboard.top(limit, offset)
+        names = dict(
+            db.query(PaperAccount.id, User.full_name)
+            .join(User, User.id == PaperAccount.user_id)
+            .filter(PaperAccount.id.in_([account_id for _, account_id, _ in entries]))
+            .all()
+        ) if entries else {}
+        
+        def standing(rank: Optional[int], total_value: float) -> Dict:
+            return {
+                "rank": rank,
+                "total_value": round(total_value, 2),
+                "return_percent": round((total_value / self.initial_cash_balance - 1) * 100, 2)
+            }
+            
+        return {
+            "total_accounts": len(leaderboard),
+            "leaders": [
+                {
+                    "display_name": self._masked_name(names.get(account_id)),
+                    "is_you": account_id == valuation.account_id,
+                    **standing(rank, total_value)
+                }
+                for rank, account_id, total_value in entries
+            ],
+            "you": standing(leaderboard.rank(valuation.account_id), valuation.total_value)
+        }
+        
+    def _masked_name(self, full_name: Optional[str]) -> str:
+        """Public leaderboard handle: only the first letter of the name is shown"""
+        full_name = (full_name or "").strip()
+        return f"{full_name[0].upper()}***" if full_name else "Trader"
+        
+    async def seed_all_valuations(self, db: Session) -> int:
+        """Track every paper account in the valuation book (and so on the leaderboard) in one pass"""
+        accounts = db.query(PaperAccount).all()
+        positions_by_account: Dict[int, List[PaperPosition]] = {}
+        for position in db.query(PaperPosition).order_by(PaperPosition.id).all():
+            positions_by_account.setdefault(position.account_id, []).append(position)
+            
+        current_prices = await self._current_prices(
+            list({position.stock_ticker for positions in positions_by_account.values() for position in positions}), db
+        )
+        for paper_account in accounts:
+            self._seed_account(paper_account, positions_by_account.get(paper_account.id, []), current_prices)
+        logger.info(f"Valuation book seeded {len(accounts)} paper accounts")
+        return len(accounts)
+        
+    async def _seed_valuation(self, user_id: int, db: Session) -> AccountValuation:
+        """Value an account from the database and start tracking it in the valuation book"""
         paper_account = await self.get_or_create_paper_account(user_id, db)
         
         # Get all positions
         positions = db.query(PaperPosition).filter(PaperPosition.account_id == paper_account.id).all()
         
-        positions_value = 0.0
-        total_pnl = 0.0
-        positions_with_pnl = []
+        current_prices = await self._current_prices([position.stock_ticker for position in positions], db)
+        return self._seed_account(paper_account, positions, current_prices)
+        
+    async def _current_prices(self, tickers: List[str], db: Session) -> Dict[str, Optional[float]]:
+        """Price every holding at once: cached quotes first, then one bar store read for the rest"""
+        try:
+            quotes = await stock_service.get_stored_quotes(tickers, db)
+            return {ticker: quote.get("current_price") for ticker, quote in quotes.items()}
+        except Exception as e:
+            logger.error(f"Error getting stock data for portfolio positions: {e}")
+            return {}
+            
+    def _seed_account(self, paper_account: PaperAccount, positions: List[PaperPosition],
+                      current_prices: Dict[str, Optional[float]]) -> AccountValuation:
+        """Value an account's positions at the given prices and start tracking it"""
+        # Positions without a price are valued at their average buy price and carry no P&L
+        priced = [position for position in positions if current_prices.get(position.stock_ticker.upper()) is not None]
+        unpriced_value = sum(
+            position.quantity * position.average_buy_price
+            for position in positions if current_prices.get(position.stock_ticker.upper()) is None
+        )
+        
+        # Calculate position values and P&L in one vectorized pass
+        quantities = np.array([position.quantity for position in priced], dtype=np.float64)
+        average_prices = np.array([position.average_buy_price for position in priced], dtype=np.float64)
+        prices = np.array([current_prices[position.stock_ticker.upper()] for position in priced], dtype=np.float64)
+        
+        position_values = quantities * prices
+        cost_bases = quantities * average_prices
+        pnls = position_values - cost_bases
+        pnl_percents = np.divide(pnls, cost_bases, out=np.zeros_like(pnls), where=cost_bases > 0) * 100
+        
+        positions_value = float(position_values.sum()) + unpriced_value
+        total_pnl = float(pnls.sum())
+        
+        # Add P&L info to each position
+        positions_with_pnl = [
+            {
+                'id': position.id,
+                'account_id': position.account_id,
+                'stock_ticker': position.stock_ticker,
+                'quantity': position.quantity,
+                'average_buy_price': position.average_buy_price,
+                'current_price': current_price,
+                'position_value': position_value,
+                'pnl': pnl,
+                'pnl_percent': pnl_percent,
+                'created_at': position.created_at,
+                'updated_at': position.updated_at
+            }
+            for position, current_price, position_value, pnl, pnl_percent in zip(
+                priced, prices.tolist(), position_values.tolist(), pnls.tolist(), pnl_percents.tolist()
+            )
+        ]
+        
+        # Unpriced positions are tracked too, so a later tick can price them
+        positions_with_pnl.extend(
+            {
+                'id': position.id,
+                'account_id': position.account_id,
+                'stock_ticker': position.stock_ticker,
+                'quantity': position.quantity,
+                'average_buy_price': position.average_buy_price,
+                'current_price': None,
+                'created_at': position.created_at,
+                'updated_at': position.updated_at
+            }
+            for position in positions if current_prices.get(position.stock_ticker.upper()) is None
+        )
+        
+        return portfolio_valuations.seed(
+            paper_account.id,
+            paper_account.user_id,
+            paper_account.virtual_cash_balance,
+            positions_with_pnl,
+            positions_value,
+            total_pnl
+        )
+    
+    async def execute_buy_order(self, user_id: int, order: PaperOrderRequest, db: Session) -> Dict:
+        """Execute a buy order, or rest it in the order book until its price is reached"""
+        paper_account = await self.get_or_create_paper_account(user_id, db)
+        
+        if order.order_type == "stop" and not order.stop_price:
+            return {
+                "success": False,
+                "message": "Stop orders require a stop price"
+            }
+        
+        # Get current market price; tickers without stored bars are rejected rather than filled at mock prices
+        current_price = (await self._current_prices([order.stock_ticker], db)).get(order.stock_ticker.upper())
+        if not current_price:
+            return {
+                "success": False,
+                "message": f"Could not get current price for {order.stock_ticker}"
+            }
+        
+        if order.order_type == "limit" and order.limit_price:
+            if order.limit_price < current_price:
+                # Not marketable yet: rest until the price falls to the limit
+                return await self._rest_order(db, paper_account, None, "buy", order, order.limit_price)
+            # Use limit price as the fill price
+            current_price = order.limit_price
+        elif order.order_type == "stop" and current_price < order.stop_price:
+            # Not triggered yet: rest until the price rises to the stop
+            return await self._rest_order(db, paper_account, None, "buy", order, order.stop_price)
+        
+        # Funds are checked against the freshly locked account inside the fill
+        return await self._execute_fill(db, paper_account.id, "buy", order.stock_ticker, order.quantity, current_price)
+    
+    async def execute_sell_order(self, user_id: int, order: PaperOrderRequest, db: Session) -> Dict:
+        """Execute a sell order, or rest it in the order book until its price is reached"""
+        paper_account = await self.get_or_create_paper_account(user_id, db)
+        
+        if order.order_type == "stop" and not order.stop_price:
+            return {
+                "success": False,
+                "message": "Stop orders require a stop price"
+            }
+        
+        # Check if user has the position
+        position = db.query(PaperPosition).filter(
+            and_(
+                PaperPosition.account_id == paper_account.id,
+                PaperPosition.stock_ticker == order.stock_ticker.upper()
+            )
+        ).first()
+        
+        failure = self._check_sell(position, order.stock_ticker, order.quantity)
+        if failure:
+            return failure
         
-        for position in positions:
-            # Get current market price
+        # Get current market price; tickers without stored bars are rejected rather than filled at mock prices
+        current_price = (await self._current_prices([order.stock_ticker], db)).get(order.stock_ticker.upper())
+        if not current_price:
+            return {
+                "success": False,
+                "message": f"Could not get current price for {order.stock_ticker}"
+            }
+        
+        if order.order_type == "limit" and order.limit_price:
+            if order.limit_price > current_price:
+                # Not marketable yet: rest until the price rises to the limit
+                return await self._rest_order(db, paper_account, position, "sell", order, order.limit_price)
+            # Use limit price as the fill price
+            current_price = order.limit_price
+        elif order.order_type == "stop" and current_price > order.stop_price:
+            # Not triggered yet: rest until the price falls to the stop
+            return await self._rest_order(db, paper_account, position, "sell", order, order.stop_price)
+        
+        # Shares are checked again against the freshly locked position inside the fill
+        return await self._execute_fill(db, paper_account.id, "sell", order.stock_ticker, order.quantity, current_price)
+    
+    async def _execute_fill(self, db: Session, account_id: int, side: str, ticker: str, quantity: int, price: float) -> Dict:
+        """
+        Check and apply a fill against freshly read account and position rows, retrying on conflict.
+        On PostgreSQL the rows are read FOR UPDATE, so concurrent orders on one account queue up.
+        On every database the writes are version-checked, so an order that read a balance or
+        position that another order changed first is rolled back and retried from a fresh read.
+        """
+        for attempt in range(1, self.max_fill_attempts + 1):
             try:
-                stock_data = await stock_service.get_stock_data_from_db(position.stock_ticker, db)
-                current_price = stock_data.get('current_price', position.average_buy_price)
+                paper_account = db.query(PaperAccount)\
+                    .filter(PaperAccount.id == account_id)\
+                    .populate_existing()\
+                    .with_for_update()\
+                    .one()
+                position = db.query(PaperPosition)\
+                    .filter(PaperPosition.account_id == account_id, PaperPosition.stock_ticker == ticker.upper())\
+                    .populate_existing()\
+                    .with_for_update()\
+                    .first()
                 
-                # Calculate position value and P&L
-                position_value = position.quantity * current_price
-                cost_basis = position.quantity * position.average_buy_price
-                pnl = position_value - cost_basis
-                pnl_percent = (pnl / cost_basis) * 100 if cost_basis > 0 else 0
+                if side == "buy":
+                    failure = self._check_buy(paper_account, quantity, price)
+                else:
+                    failure = self._check_sell(position, ticker, quantity)
+                if failure:
+                    db.rollback()
+                    return failure
                 
-                positions_value += position_value
-                total_pnl += pnl
+                trade, position = self._apply_fill(db, paper_account, position, side, ticker, quantity, price)
+                total_amount = trade.total_amount
+                cash_balance = paper_account.virtual_cash_balance
+                db.commit()
+                break
                 
-                # Add P&L info to position
-                position_dict = {
-                    'id': position.id,
-                    'account_id': position.account_id,
-                    'stock_ticker': position.stock_ticker,
-                    'quantity': position.quantity,
-                    'average_buy_price': position.average_buy_price,
-                    'current_price': current_price,
-                    'position_value': position_value,
-                    'pnl': pnl,
-                    'pnl_percent': pnl_percent,
-                    'created_at': position.created_at,
-                    'updated_at': position.updated_at
-                }
-                positions_with_pnl.append(position_dict)
+            except (StaleDataError, IntegrityError) as e:
+                db.rollback()
+                if attempt == self.max_fill_attempts:
+                    logger.error(f"Giving up on {side} order for account {account_id} after {attempt} conflicting attempts: {e}")
+                    return {
+                        "success": False,
+                        "message": f"Error executing {side} order",
+                        "error": "The account was updated by other orders; please retry"
+                    }
+                # Back off with jitter so the conflicting orders do not collide again
+                await asyncio.sleep(self.fill_retry_delay * 2 ** (attempt - 1) * random.random())
                 
             except Exception as e:
-                logger.error(f"Error getting stock data for {position.stock_ticker}: {e}")
-                # Use average buy price as fallback
-                position_value = position.quantity * position.average_buy_price
-                positions_value += position_value
-        
-        total_value = paper_account.virtual_cash_balance + positions_value
-        total_pnl_percent = (total_pnl / (total_value - total_pnl)) * 100 if (total_value - total_pnl) > 0 else 0
-        
-        return PaperPortfolioSummary(
-            total_value=round(total_value, 2),
-            cash_balance=round(paper_account.virtual_cash_balance, 2),
-            positions_value=round(positions_value, 2),
-            total_pnl=round(total_pnl, 2),
-            total_pnl_percent=round(total_pnl_percent, 2),
-            positions=positions_with_pnl
-        )
+                db.rollback()
+                logger.error(f"Error executing {side} order: {e}")
+                return {
+                    "success": False,
+                    "message": f"Error executing {side} order",
+                    "error": str(e)
+                }
+        
+        self._update_valuation(account_id, cash_balance, ticker, position)
+        
+        logger.info(f"Executed {side} order: {quantity} shares of {ticker} at ${price:.2f}")
+        
+        return {
+            "success": True,
+            "message": f"Successfully {'bought' if side == 'buy' else 'sold'} {quantity} shares of {ticker} at ${price:.2f}",
+            "trade": {
+                "stock_ticker": ticker.upper(),
+                "quantity": quantity,
+                "price": price,
+                "total_amount": total_amount,
+                "trade_type": side
+            },
+            "remaining_cash": cash_balance
+        }
     
-    async def execute_buy_order(self, user_id: int, order: PaperOrderRequest, db: Session) -> Dict:
-        """Execute a buy order for paper trading"""
+    async def execute_basket_order(self, user_id: int, basket: PaperBasketOrderRequest, db: Session) -> Dict:
+        """
+        Execute many market orders in one transaction, priced with one quote lookup.
+        Sells run before buys, so their proceeds can fund the basket's buys. In
+        all_or_nothing mode any failing leg rolls back the whole basket; in best_effort
+        mode failing legs are skipped and the rest still fill.
+        """
+        if basket.mode not in BASKET_MODES:
+            return {
+                "success": False,
+                "message": f"Unknown basket mode '{basket.mode}'. Use one of: {', '.join(BASKET_MODES)}"
+            }
+        if not basket.legs:
+            return {
+                "success": False,
+                "message": "A basket needs at least one leg"
+            }
+        if len(basket.legs) > self.max_basket_legs:
+            return {
+                "success": False,
+                "message": f"A basket can have at most {self.max_basket_legs} legs"
+            }
+        for leg in basket.legs:
+            if leg.side not in ("buy", "sell") or leg.quantity <= 0:
+                return {
+                    "success": False,
+                    "message": f"Invalid leg for {leg.stock_ticker}: side must be buy or sell and quantity positive"
+                }
+        
         paper_account = await self.get_or_create_paper_account(user_id, db)
+        tickers = list(dict.fromkeys(leg.stock_ticker.upper() for leg in basket.legs))
         
-        # Get current market price
+        # Price every leg at once: cached quotes first, then one bar store read for the rest.
+        # Tickers without stored bars get no price, so their legs fail instead of filling at mock prices
         try:
-            stock_data = await stock_service.get_stock_data_from_db(order.stock_ticker, db)
-            current_price = stock_data.get('current_price')
-            
-            if not current_price:
-                raise ValueError(f"Could not get current price for {order.stock_ticker}")
-            
-            # Use limit price if specified and it's better than market price
-            if order.order_type == "limit" and order.limit_price:
-                if order.limit_price < current_price:
-                    # Limit order not filled (price too low)
-                    return {
-                        "success": False,
-                        "message": f"Limit order not filled. Current price ${current_price:.2f} is higher than limit price ${order.limit_price:.2f}",
-                        "order_type": "limit",
-                        "limit_price": order.limit_price,
-                        "current_price": current_price
-                    }
-                current_price = order.limit_price
-            
+            quotes = await stock_service.get_stored_quotes(tickers, db)
+            prices = {ticker: quote.get("current_price") for ticker, quote in quotes.items()}
         except Exception as e:
-            logger.error(f"Error getting stock price for {order.stock_ticker}: {e}")
+            logger.error(f"Error getting stock prices for basket: {e}")
             return {
                 "success": False,
-                "message": f"Could not get current price for {order.stock_ticker}",
+                "message": "Could not get current prices for the basket",
                 "error": str(e)
             }
         
-        # Calculate total cost
-        total_cost = order.quantity * current_price
+        # Sells first, each side in request order
+        legs = sorted(enumerate(basket.legs), key=lambda item: item[1].side != "sell")
+        all_or_nothing = basket.mode == "all_or_nothing"
         
-        # Check if user has enough cash
-        if paper_account.virtual_cash_balance < total_cost:
-            return {
-                "success": False,
-                "message": f"Insufficient funds. Required: ${total_cost:.2f}, Available: ${paper_account.virtual_cash_balance:.2f}",
-                "required_amount": total_cost,
-                "available_amount": paper_account.virtual_cash_balance
+        for attempt in range(1, self.max_fill_attempts + 1):
+            try:
+                account = db.query(PaperAccount)\
+                    .filter(PaperAccount.id == paper_account.id)\
+                    .populate_existing()\
+                    .with_for_update()\
+                    .one()
+                positions = {
+                    position.stock_ticker: position
+                    for position in db.query(PaperPosition)\
+                        .filter(PaperPosition.account_id == account.id, PaperPosition.stock_ticker.in_(tickers))\
+                        .order_by(PaperPosition.id)\
+                        .populate_existing()\
+                        .with_for_update()\
+                        .all()
+                }
+                
+                results = [None] * len(basket.legs)
+                for index, leg in legs:
+                    ticker = leg.stock_ticker.upper()
+                    price = prices.get(ticker)
+                    if not price:
+                        failure = {"message": f"Could not get current price for {leg.stock_ticker}"}
+                    elif leg.side == "buy":
+                        failure = self._check_buy(account, leg.quantity, price)
+                    else:
+                        failure = self._check_sell(positions.get(ticker), leg.stock_ticker, leg.quantity)
+                    
+                    if failure:
+                        results[index] = {
+                            "stock_ticker": ticker,
+                            "side": leg.side,
+                            "quantity": leg.quantity,
+                            "status": "rejected",
+                            "message": failure["message"]
+                        }
+                        if all_or_nothing:
+                            db.rollback()
+                            return {
+                                "success": False,
+                                "message": f"Basket rejected: {failure['message']}",
+                                "legs": [result for result in results if result is not None]
+                            }
+                        continue
+                    
+                    trade, positions[ticker] = self._apply_fill(db, account, positions.get(ticker), leg.side, ticker, leg.quantity, price)
+                    results[index] = {
+                        "stock_ticker": ticker,
+                        "side": leg.side,
+                        "quantity": leg.quantity,
+                        "status": "filled",
+                        "price": price,
+                        "total_amount": trade.total_amount
+                    }
+                
+                cash_balance = account.virtual_cash_balance
+                db.commit()
+                break
+                
+            except (StaleDataError, IntegrityError) as e:
+                db.rollback()
+                if attempt == self.max_fill_attempts:
+                    logger.error(f"Giving up on basket for account {paper_account.id} after {attempt} conflicting attempts: {e}")
+                    return {
+                        "success": False,
+                        "message": "Error executing basket order",
+                        "error": "The account was updated by other orders; please retry"
+                    }
+                await asyncio.sleep(self.fill_retry_delay * 2 ** (attempt - 1) * random.random())
+                
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error executing basket order: {e}")
+                return {
+                    "success": False,
+                    "message": "Error executing basket order",
+                    "error": str(e)
+                }
+        
+        filled = [result for result in results if result["status"] == "filled"]
+        filled_tickers = {result["stock_ticker"] for result in filled}
+        if filled_tickers and account.id in portfolio_valuations:
+            # One query for the positions the basket left behind, then delta updates
+            positions_after = {
+                position.stock_ticker: position
+                for position in db.query(PaperPosition).filter(
+                    PaperPosition.account_id == account.id,
+                    PaperPosition.stock_ticker.in_(filled_tickers)
+                ).all()
             }
+            for ticker in filled_tickers:
+                self._update_valuation(account.id, cash_balance, ticker, positions_after.get(ticker))
+        
+        logger.info(f"Executed basket for account {paper_account.id}: {len(filled)} of {len(results)} legs filled")
+        
+        return {
+            "success": True,
+            "message": f"Executed {len(filled)} of {len(results)} legs",
+            "mode": basket.mode,
+            "legs": results,
+            "remaining_cash": cash_balance
+        }
+    
+    async def _rest_order(self, db: Session, paper_account: PaperAccount, position: Optional[PaperPosition],
+                          side: str, order: PaperOrderRequest, trigger_price: float) -> Dict:
+        """Store a limit or stop order that cannot fill yet and add it to the order book"""
+        # Funds and shares are checked again when the order fills; this only refuses
+        # orders that could not fill even now
+        if side == "buy":
+            failure = self._check_buy(paper_account, order.quantity, trigger_price)
+        else:
+            failure = self._check_sell(position, order.stock_ticker, order.quantity)
+        if failure:
+            return failure
         
-        # Execute the trade
         try:
-            # Update cash balance
-            paper_account.virtual_cash_balance -= total_cost
-            
-            # Check if user already has a position in this stock
-            existing_position = db.query(PaperPosition).filter(
-                and_(
-                    PaperPosition.account_id == paper_account.id,
-                    PaperPosition.stock_ticker == order.stock_ticker.upper()
-                )
-            ).first()
-            
-            if existing_position:
-                # Update existing position (average price calculation)
-                total_shares = existing_position.quantity + order.quantity
-                total_cost_basis = (existing_position.quantity * existing_position.average_buy_price) + total_cost
-                new_average_price = total_cost_basis / total_shares
-                
-                existing_position.quantity = total_shares
-                existing_position.average_buy_price = new_average_price
-            else:
-                # Create new position
-                new_position = PaperPosition(
-                    account_id=paper_account.id,
-                    stock_ticker=order.stock_ticker.upper(),
-                    quantity=order.quantity,
-                    average_buy_price=current_price
-                )
-                db.add(new_position)
-            
-            # Record the trade
-            trade = PaperTrade(
+            resting_order = PaperOrder(
                 account_id=paper_account.id,
                 stock_ticker=order.stock_ticker.upper(),
-                trade_type="buy",
+                side=side,
+                order_type=order.order_type,
                 quantity=order.quantity,
-                price=current_price,
-                total_amount=total_cost
+                limit_price=order.limit_price if order.order_type == "limit" else None,
+                stop_price=order.stop_price if order.order_type == "stop" else None
             )
-            db.add(trade)
-            
+            db.add(resting_order)
             db.commit()
+            db.refresh(resting_order)
+            order_book.add(resting_order)
             
-            logger.info(f"Executed buy order: {order.quantity} shares of {order.stock_ticker} at ${current_price:.2f}")
+            logger.info(f"Placed {order.order_type} {side} order {resting_order.id}: {order.quantity} shares of {order.stock_ticker} at ${trigger_price:.2f}")
             
             return {
                 "success": True,
-                "message": f"Successfully bought {order.quantity} shares of {order.stock_ticker} at ${current_price:.2f}",
-                "trade": {
-                    "stock_ticker": order.stock_ticker.upper(),
-                    "quantity": order.quantity,
-                    "price": current_price,
-                    "total_amount": total_cost,
-                    "trade_type": "buy"
-                },
-                "remaining_cash": paper_account.virtual_cash_balance
+                "message": f"{order.order_type.capitalize()} order placed to {side} {order.quantity} shares of {order.stock_ticker} at ${trigger_price:.2f}",
+                "order": PaperOrderSchema.model_validate(resting_order)
             }
             
         except Exception as e:
             db.rollback()
-            logger.error(f"Error executing buy order: {e}")
+            logger.error(f"Error placing {side} order: {e}")
             return {
                 "success": False,
-                "message": "Error executing buy order",
+                "message": f"Error placing {side} order",
                 "error": str(e)
             }
     
-    async def execute_sell_order(self, user_id: int, order: PaperOrderRequest, db: Session) -> Dict:
-        """Execute a sell order for paper trading"""
-        paper_account = await self.get_or_create_paper_account(user_id, db)
-        
-        # Check if user has the position
-        position = db.query(PaperPosition).filter(
-            and_(
-                PaperPosition.account_id == paper_account.id,
-                PaperPosition.stock_ticker == order.stock_ticker.upper()
-            )
-        ).first()
-        
+    def _check_buy(self, paper_account: PaperAccount, quantity: int, price: float) -> Optional[Dict]:
+        """Failure response if the account cannot pay for the shares, otherwise None"""
+        total_cost = quantity * price
+        if paper_account.virtual_cash_balance < total_cost:
+            return {
+                "success": False,
+                "message": f"Insufficient funds. Required: ${total_cost:.2f}, Available: ${paper_account.virtual_cash_balance:.2f}",
+                "required_amount": total_cost,
+                "available_amount": paper_account.virtual_cash_balance
+            }
+        return None
+    
+    def _check_sell(self, position: Optional[PaperPosition], ticker: str, quantity: int) -> Optional[Dict]:
+        """Failure response if the position does not hold enough shares, otherwise None"""
         if not position:
             return {
                 "success": False,
-                "message": f"You don't have any shares of {order.stock_ticker} to sell"
+                "message": f"You don't have any shares of {ticker} to sell"
             }
         
-        if position.quantity < order.quantity:
+        if position.quantity < quantity:
             return {
                 "success": False,
-                "message": f"Insufficient shares. You have {position.quantity} shares, trying to sell {order.quantity}"
+                "message": f"Insufficient shares. You have {position.quantity} shares, trying to sell {quantity}"
             }
+        return None
+    
+    def _apply_fill(self, db: Session, paper_account: PaperAccount, position: Optional[PaperPosition],
+                    side: str, ticker: str, quantity: int, price: float) -> Tuple[PaperTrade, Optional[PaperPosition]]:
+        """Move cash and shares for a checked fill and record the trade; the caller commits"""
+        ticker = ticker.upper()
+        total_amount = quantity * price
+        
+        if side == "buy":
+            paper_account.virtual_cash_balance -= total_amount
+            if position:
+                # Update existing position (average price calculation)
+                total_shares = position.quantity + quantity
+                total_cost_basis = (position.quantity * position.average_buy_price) + total_amount
+                position.average_buy_price = total_cost_basis / total_shares
+                position.quantity = total_shares
+            else:
+                # Create new position
+                position = PaperPosition(
+                    account_id=paper_account.id,
+                    stock_ticker=ticker,
+                    quantity=quantity,
+                    average_buy_price=price
+                )
+                db.add(position)
+        else:
+            paper_account.virtual_cash_balance += total_amount
+            if position.quantity == quantity:
+                # Selling all shares, delete the position (flushed so a later buy in the
+                # same transaction can open a new one for the ticker)
+                db.delete(position)
+                db.flush()
+                position = None
+            else:
+                # Partial sale, update quantity
+                position.quantity -= quantity
+        
+        # Record the trade
+        trade = PaperTrade(
+            account_id=paper_account.id,
+            stock_ticker=ticker,
+            trade_type=side,
+            quantity=quantity,
+            price=price,
+            total_amount=total_amount
+        )
+        db.add(trade)
+        paper_ledger.record(
+            db, paper_account, side,
+            cash_delta=-total_amount if side == "buy" else total_amount,
+            stock_ticker=ticker, quantity=quantity, price=price
+        )
+        return trade, position
+    
+    def _position_state(self, position: PaperPosition) -> Dict:
+        """Committed position fields in the portfolio summary shape"""
+        return {
+            'id': position.id,
+            'account_id': position.account_id,
+            'stock_ticker': position.stock_ticker,
+            'quantity': position.quantity,
+            'average_buy_price': position.average_buy_price,
+            'created_at': position.created_at,
+            'updated_at': position.updated_at
+        }
+    
+    def _update_valuation(self, account_id: int, cash_balance: float, ticker: str, position: Optional[PaperPosition]):
+        """Apply a committed fill to the account's valuation if it is tracked"""
+        if account_id not in portfolio_valuations:
+            return
+        portfolio_valuations.apply_trade(
+            account_id,
+            cash_balance,
+            ticker,
+            self._position_state(position) if position else None
+        )
+    
+    async def match_resting_orders(self, prices: Dict[str, float]) -> int:
+        """
+        Fill every resting order crossed by a tick's {ticker: price} map in one transaction.
+        Quiet ticks never touch the database; returns how many orders filled.
+        """
+        fills = order_book.match(prices)
+        if not fills:
+            return 0
         
-        # Get current market price
+        db = SessionLocal()
         try:
-            stock_data = await stock_service.get_stock_data_from_db(order.stock_ticker, db)
-            current_price = stock_data.get('current_price')
+            for attempt in range(1, self.max_fill_attempts + 1):
+                try:
+                    return self._fill_resting_orders(db, fills)
+                except (StaleDataError, IntegrityError) as e:
+                    # An order endpoint changed one of the accounts first; redo the batch from fresh rows
+                    db.rollback()
+                    if attempt == self.max_fill_attempts:
+                        raise
+                    logger.warning(f"Retrying resting order fills after a conflicting update: {e}")
+                    await asyncio.sleep(self.fill_retry_delay * 2 ** (attempt - 1) * random.random())
             
-            if not current_price:
-                raise ValueError(f"Could not get current price for {order.stock_ticker}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error matching resting orders: {e}")
+            # The matched orders were already popped from the book; put the open ones back
+            order_book.load_from_db(db)
+            return 0
+        finally:
+            db.close()
+    
+    def _fill_resting_orders(self, db: Session, fills: Dict[int, float]) -> int:
+        """Apply matched fills in one transaction, locking the orders, accounts and positions involved"""
+        orders = db.query(PaperOrder)\
+            .filter(PaperOrder.id.in_(list(fills)), PaperOrder.status == "open")\
+            .order_by(PaperOrder.id)\
+            .with_for_update()\
+            .all()
+        account_ids = {order.account_id for order in orders}
+        tickers = {order.stock_ticker for order in orders}
+        accounts = {
+            account.id: account
+            for account in db.query(PaperAccount)\
+                .filter(PaperAccount.id.in_(account_ids))\
+                .order_by(PaperAccount.id)\
+                .with_for_update()\
+                .all()
+        }
+        positions = {
+            (position.account_id, position.stock_ticker): position
+            for position in db.query(PaperPosition)\
+                .filter(PaperPosition.account_id.in_(account_ids), PaperPosition.stock_ticker.in_(tickers))\
+                .order_by(PaperPosition.id)\
+                .with_for_update()\
+                .all()
+        }
+        
+        filled = 0
+        now = datetime.now()
+        # Oldest first, so earlier orders get the cash and shares when both cannot fill
+        for order in orders:
+            price = fills[order.id]
+            account = accounts[order.account_id]
+            key = (order.account_id, order.stock_ticker)
+            position = positions.get(key)
             
-            # Use limit price if specified and it's better than market price
-            if order.order_type == "limit" and order.limit_price:
-                if order.limit_price > current_price:
-                    # Limit order not filled (price too high)
-                    return {
-                        "success": False,
-                        "message": f"Limit order not filled. Current price ${current_price:.2f} is lower than limit price ${order.limit_price:.2f}",
-                        "order_type": "limit",
-                        "limit_price": order.limit_price,
-                        "current_price": current_price
-                    }
-                current_price = order.limit_price
+            if order.side == "buy":
+                failure = self._check_buy(account, order.quantity, price)
+            else:
+                failure = self._check_sell(position, order.stock_ticker, order.quantity)
+            if failure:
+                order.status = "rejected"
+                order.reject_reason = failure["message"]
+                continue
             
-        except Exception as e:
-            logger.error(f"Error getting stock price for {order.stock_ticker}: {e}")
+            _, positions[key] = self._apply_fill(db, account, position, order.side, order.stock_ticker, order.quantity, price)
+            order.status = "filled"
+            order.filled_price = price
+            order.filled_at = now
+            filled += 1
+        
+        # Cash balances of tracked accounts are read before the commit expires them
+        changed = {
+            (order.account_id, order.stock_ticker)
+            for order in orders if order.status == "filled" and order.account_id in portfolio_valuations
+        }
+        cash_balances = {account_id: accounts[account_id].virtual_cash_balance for account_id, _ in changed}
+        
+        db.commit()
+        
+        if changed:
+            # One query for the positions the fills left behind, then delta updates
+            positions_after = {
+                (position.account_id, position.stock_ticker): position
+                for position in db.query(PaperPosition).filter(
+                    PaperPosition.account_id.in_(cash_balances),
+                    PaperPosition.stock_ticker.in_({ticker for _, ticker in changed})
+                ).all()
+            }
+            for account_id, ticker in changed:
+                position = positions_after.get((account_id, ticker))
+                portfolio_valuations.apply_trade(
+                    account_id, cash_balances[account_id], ticker,
+                    self._position_state(position) if position else None
+                )
+        
+        if orders:
+            logger.info(f"Matched {len(orders)} resting orders: {filled} filled, {len(orders) - filled} rejected")
+        return filled
+    
+    async def get_orders(self, user_id: int, db: Session, status: Optional[str] = None, limit: int = 50) -> List[PaperOrder]:
+        """Get orders for paper trading account, optionally only those with one status"""
+        paper_account = await self.get_or_create_paper_account(user_id, db)
+        
+        query = db.query(PaperOrder).filter(PaperOrder.account_id == paper_account.id)
+        if status:
+            query = query.filter(PaperOrder.status == status)
+        
+        return query.order_by(PaperOrder.created_at.desc(), PaperOrder.id.desc()).limit(limit).all()
+    
+    async def cancel_order(self, user_id: int, order_id: int, db: Session) -> Dict:
+        """Cancel an open order and take it out of the order book"""
+        paper_account = await self.get_or_create_paper_account(user_id, db)
+        
+        order = db.query(PaperOrder).filter(
+            PaperOrder.id == order_id,
+            PaperOrder.account_id == paper_account.id
+        ).first()
+        
+        if not order:
             return {
                 "success": False,
-                "message": f"Could not get current price for {order.stock_ticker}",
-                "error": str(e)
+                "message": "Order not found"
             }
         
-        # Calculate total proceeds
-        total_proceeds = order.quantity * current_price
+        if order.status != "open":
+            return {
+                "success": False,
+                "message": f"Order is already {order.status}"
+            }
         
         try:
-            # Update cash balance
-            paper_account.virtual_cash_balance += total_proceeds
-            
-            # Update position
-            if position.quantity == order.quantity:
-                # Selling all shares, delete the position
-                db.delete(position)
-            else:
-                # Partial sale, update quantity
-                position.quantity -= order.quantity
-            
-            # Record the trade
-            trade = PaperTrade(
-                account_id=paper_account.id,
-                stock_ticker=order.stock_ticker.upper(),
-                trade_type="sell",
-                quantity=order.quantity,
-                price=current_price,
-                total_amount=total_proceeds
-            )
-            db.add(trade)
-            
+            order.status = "cancelled"
             db.commit()
-            
-            logger.info(f"Executed sell order: {order.quantity} shares of {order.stock_ticker} at ${current_price:.2f}")
+            order_book.remove(order.id)
             
             return {
                 "success": True,
-                "message": f"Successfully sold {order.quantity} shares of {order.stock_ticker} at ${current_price:.2f}",
-                "trade": {
-                    "stock_ticker": order.stock_ticker.upper(),
-                    "quantity": order.quantity,
-                    "price": current_price,
-                    "total_amount": total_proceeds,
-                    "trade_type": "sell"
-                },
-                "remaining_cash": paper_account.virtual_cash_balance
+                "message": "Order cancelled successfully",
+                "order": PaperOrderSchema.model_validate(order)
+            }
+            
+        except StaleDataError:
+            # A tick filled or rejected the order between the read and the cancel
+            db.rollback()
+            db.refresh(order)
+            return {
+                "success": False,
+                "message": f"Order is already {order.status}"
             }
             
         except Exception as e:
             db.rollback()
-            logger.error(f"Error executing sell order: {e}")
+            logger.error(f"Error cancelling order: {e}")
             return {
                 "success": False,
-                "message": "Error executing sell order",
+                "message": "Error cancelling order",
                 "error": str(e)
             }
     
-    async def get_trade_history(self, user_id: int, db: Session, limit: int = 50) -> List[PaperTrade]:
-        """Get trade history for paper trading account"""
+    async def get_trade_history(self, user_id: int, db: Session, limit: int = 50, cursor: Optional[int] = None,
+                                ticker: Optional[str] = None, side: Optional[str] = None) -> Tuple[List[PaperTrade], Optional[int]]:
+        """
+        Get one page of trade history, newest first, and the cursor for the next page (None on the last).
+        Pages seek on (account_id, created_at, id) through a composite index, so deep pages cost the
+        same as the first. The cursor is the id of the last trade on the previous page; a cursor that is
+        not one of this account's trades raises ValueError rather than looking like the end of history.
+        """
         paper_account = await self.get_or_create_paper_account(user_id, db)
         
-        trades = db.query(PaperTrade).filter(
-            PaperTrade.account_id == paper_account.id
-        ).order_by(PaperTrade.created_at.desc()).limit(limit).all()
+        query = db.query(PaperTrade).filter(PaperTrade.account_id == paper_account.id)
+        if ticker:
+            query = query.filter(PaperTrade.stock_ticker == ticker.upper())
+        if side:
+            query = query.filter(PaperTrade.trade_type == side)
+        if cursor is not None:
+            cursor_exists = db.query(PaperTrade.id)\
+                .filter(PaperTrade.id == cursor, PaperTrade.account_id == paper_account.id)\
+                .first()
+            if cursor_exists is None:
+                raise ValueError("cursor does not match a trade in this account's history")
+            # Compare against the cursor row's stored values, so timestamps match exactly on every database
+            cursor_trade = aliased(PaperTrade)
+            cursor_key = select(cursor_trade.created_at, cursor_trade.id)\
+                .where(cursor_trade.id == cursor, cursor_trade.account_id == paper_account.id)\
+                .scalar_subquery()
+            query = query.filter(tuple_(PaperTrade.created_at, PaperTrade.id) < cursor_key)
+        
+        # One extra row tells whether another page follows
+        trades = query.order_by(PaperTrade.created_at.desc(), PaperTrade.id.desc()).limit(limit + 1).all()
+        next_cursor = trades[limit - 1].id if len(trades) > limit else None
         
-        return trades
+        return trades[:limit], next_cursor
+    
+    async def get_portfolio_as_of(self, user_id: int, as_of: datetime, db: Session) -> Optional[Dict]:
+        """Cash and positions of the paper account as they were at a past time, rebuilt from the ledger"""
+        paper_account = await self.get_or_create_paper_account(user_id, db)
+        return paper_ledger.state_at(db, paper_account.id, as_of)
     
     async def reset_paper_account(self, user_id: int, db: Session) -> Dict:
         """Reset paper account to initial state"""
@@ -329,10 +862,27 @@ class PaperTradingService:
             # Delete all trades
             db.query(PaperTrade).filter(PaperTrade.account_id == paper_account.id).delete()
             
-            # Reset cash balance
+            # Delete all orders, taking open ones out of the order book
+            open_order_ids = [
+                order_id for (order_id,) in db.query(PaperOrder.id).filter(
+                    PaperOrder.account_id == paper_account.id,
+                    PaperOrder.status == "open"
+                ).all()
+            ]
+            db.query(PaperOrder).filter(PaperOrder.account_id == paper_account.id).delete()
+            
+            # Reset cash balance; the ledger keeps the history before the reset
+            cash_delta = self.initial_cash_balance - paper_account.virtual_cash_balance
             paper_account.virtual_cash_balance = self.initial_cash_balance
+            paper_ledger.record(db, paper_account, "reset", cash_delta=cash_delta)
             
             db.commit()
+            for order_id in open_order_ids:
+                order_book.remove(order_id)
+            # A reset account holds only its starting cash
+            portfolio_valuations.seed(paper_account.id, user_id, self.initial_cash_balance, [], 0.0, 0.0)
+            # The reset moves the account's value, so its equity curve records it
+            portfolio_valuations.changed.add(paper_account.id)
             
             logger.info(f"Reset paper account for user {user_id}")
             
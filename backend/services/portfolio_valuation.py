@@ -0,0 +1,186 @@
+import logging
+from typing import Dict, Iterable, Optional, Set, Tuple
+from schemas import PaperPortfolioSummary
+from services.price_cache import price_cache
+from services.leaderboard import leaderboard
+
+logger = logging.getLogger(__name__)
+
+class AccountValuation:
+    """Cash, valued positions and running totals of one paper account"""
+    
+    def __init__(self, account_id: int, user_id: int, cash_balance: float):
+        self.account_id = account_id
+        self.user_id = user_id
+        self.cash_balance = cash_balance
+        # ticker -> position in the portfolio summary shape; current_price is None when unpriced
+        self.positions: Dict[str, Dict] = {}
+        self.positions_value = 0.0
+        self.total_pnl = 0.0
+        
+    @property
+    def total_value(self) -> float:
+        """Cash plus positions at their latest prices"""
+        return self.cash_balance + self.positions_value
+
+def position_contribution(position: Dict) -> Tuple[float, float]:
+    """(value, P&L) a position adds to its account; unpriced positions count at cost with no P&L"""
+    if position["current_price"] is None:
+        return position["quantity"] * position["average_buy_price"], 0.0
+    return position["position_value"], position["pnl"]
+
+def price_position(position: Dict, current_price: Optional[float]):
+    """Set a position's current price and recompute its value and P&L in place"""
+    position["current_price"] = current_price
+    if current_price is None:
+        return
+    position_value = position["quantity"] * current_price
+    cost_basis = position["quantity"] * position["average_buy_price"]
+    pnl = position_value - cost_basis
+    position["position_value"] = position_value
+    position["pnl"] = pnl
+    position["pnl_percent"] = (pnl / cost_basis) * 100 if cost_basis > 0 else 0
+
+class PortfolioValuationBook:
+    """
+    In-memory valuations of paper accounts, kept current by deltas.
+    An account is seeded from the database on its first portfolio read. After that, trades
+    replace one position and ticks revalue only the accounts holding a changed ticker (found
+    through the ticker -> accounts index), so reads need no queries or recomputation.
+    Every change is passed on to the leaderboard, and the changed accounts are collected for
+    the next equity curve snapshot.
+    """
+    
+    def __init__(self):
+        self.accounts: Dict[int, AccountValuation] = {}
+        self.user_accounts: Dict[int, int] = {}
+        self.holders: Dict[str, Set[int]] = {}
+        # Accounts whose value moved (a trade, a tick or a reset) since the last equity snapshot
+        self.changed: Set[int] = set()
+        
+    def __len__(self) -> int:
+        return len(self.accounts)
+        
+    def __contains__(self, account_id: int) -> bool:
+        return account_id in self.accounts
+        
+    def get(self, user_id: int) -> Optional[AccountValuation]:
+        """Valuation of a user's account if it has been seeded"""
+        account_id = self.user_accounts.get(user_id)
+        return self.accounts.get(account_id) if account_id is not None else None
+        
+    def seed(self, account_id: int, user_id: int, cash_balance: float, positions: Iterable[Dict],
+             positions_value: float, total_pnl: float) -> AccountValuation:
+        """Start tracking an account from a full valuation computed against the database"""
+        self.invalidate(user_id)
+        valuation = AccountValuation(account_id, user_id, cash_balance)
+        for position in positions:
+            ticker = position["stock_ticker"].upper()
+            valuation.positions[ticker] = position
+            self.holders.setdefault(ticker, set()).add(account_id)
+        valuation.positions_value = positions_value
+        valuation.total_pnl = total_pnl
+        
+        self.accounts[account_id] = valuation
+        self.user_accounts[user_id] = account_id
+        leaderboard.update(account_id, valuation.total_value)
+        return valuation
+        
+    def invalidate(self, user_id: int):
+        """Stop tracking a user's account; the next portfolio read seeds it again"""
+        account_id = self.user_accounts.pop(user_id, None)
+        valuation = self.accounts.pop(account_id, None) if account_id is not None else None
+        if valuation is None:
+            return
+        for ticker in valuation.positions:
+            self._drop_holder(ticker, account_id)
+        leaderboard.remove(account_id)
+            
+    def apply_trade(self, account_id: int, cash_balance: float, ticker: str, position: Optional[Dict]):
+        """
+        Record a committed fill: the account's new cash balance and the position it left behind
+        (None once the position is closed). Untracked accounts are ignored.
+        """
+        valuation = self.accounts.get(account_id)
+        if valuation is None:
+            return
+            
+        ticker = ticker.upper()
+        valuation.cash_balance = cash_balance
+        previous = valuation.positions.get(ticker)
+        if previous is not None:
+            value, pnl = position_contribution(previous)
+            valuation.positions_value -= value
+            valuation.total_pnl -= pnl
+            
+        if position is None:
+            valuation.positions.pop(ticker, None)
+            self._drop_holder(ticker, account_id)
+            leaderboard.update(account_id, valuation.total_value)
+            self.changed.add(account_id)
+            return
+            
+        # Price the new position like a fresh read would, keeping the last tick price if uncached
+        quote = price_cache.get_quote(ticker)
+        if quote is not None:
+            current_price = quote["current_price"]
+        else:
+            current_price = previous["current_price"] if previous is not None else None
+        price_position(position, current_price)
+        value, pnl = position_contribution(position)
+        valuation.positions_value += value
+        valuation.total_pnl += pnl
+        # Replacing an existing key keeps the position in its place, like the id order of a fresh read
+        valuation.positions[ticker] = position
+        self.holders.setdefault(ticker, set()).add(account_id)
+        leaderboard.update(account_id, valuation.total_value)
+        self.changed.add(account_id)
+        
+    def revalue(self, prices: Dict[str, float]) -> int:
+        """Reprice the positions of every tracked account holding a ticker in the tick; returns how many"""
+        revalued = 0
+        touched = set()
+        for ticker, price in prices.items():
+            for account_id in self.holders.get(ticker, ()):
+                valuation = self.accounts[account_id]
+                position = valuation.positions[ticker]
+                old_value, old_pnl = position_contribution(position)
+                price_position(position, price)
+                value, pnl = position_contribution(position)
+                valuation.positions_value += value - old_value
+                valuation.total_pnl += pnl - old_pnl
+                touched.add(account_id)
+                if value != old_value:
+                    self.changed.add(account_id)
+                revalued += 1
+        # Each account moves on the leaderboard once, however many of its tickers changed
+        for account_id in touched:
+            leaderboard.update(account_id, self.accounts[account_id].total_value)
+        return revalued
+        
+    def summary(self, valuation: AccountValuation) -> PaperPortfolioSummary:
+        """Portfolio summary of a tracked account"""
+        total_value = valuation.total_value
+        total_pnl = valuation.total_pnl
+        total_pnl_percent = (total_pnl / (total_value - total_pnl)) * 100 if (total_value - total_pnl) > 0 else 0
+        
+        return PaperPortfolioSummary(
+            total_value=round(total_value, 2),
+            cash_balance=round(valuation.cash_balance, 2),
+            positions_value=round(valuation.positions_value, 2),
+            total_pnl=round(total_pnl, 2),
+            total_pnl_percent=round(total_pnl_percent, 2),
+            # Unpriced positions stay listed (current_price None), valued at cost
+            positions=list(valuation.positions.values())
+        )
+        
+    def _drop_holder(self, ticker: str, account_id: int):
+        accounts = self.holders.get(ticker)
+        if accounts is None:
+            return
+        accounts.discard(account_id)
+        if not accounts:
+            del self.holders[ticker]
+
+# Global instance
+portfolio_valuations = PortfolioValuationBook()
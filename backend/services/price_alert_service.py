@@ -1,10 +1,12 @@
 import asyncio
 from typing import List, Dict
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, update, insert, text, column, Integer, String, Float, DateTime
 from database import SessionLocal
-from models import PriceAlert, StockDataPoint
-from services.email_service import email_service
+from models import PriceAlert, NotificationOutbox
+from services.notification_dispatcher import notification_dispatcher
+from services.bar_store import bar_store
+from services.alert_index import alert_index
 from datetime import datetime
 
 class PriceAlertService:
@@ -12,84 +14,114 @@ class PriceAlertService:
     
     async def check_price_alerts(self, ticker: str, current_price: float):
         """Check if any price alerts should be triggered for a given ticker"""
+        await self.check_price_alerts_batch({ticker.upper(): current_price})
+    
+    async def check_price_alerts_batch(self, prices: Dict[str, float]) -> int:
+        """
+        Evaluate a whole tick's {ticker: price} map at once: one query finds every
+        crossed alert and one bulk UPDATE marks them triggered. Returns how many fired.
+        """
+        # Only tickers with a crossed threshold in the in-memory index reach the database
+        matches = {}
+        for ticker, price in prices.items():
+            matched = alert_index.match(ticker, price)
+            if matched:
+                matches[ticker] = matched
+        if not matches:
+            return 0
+        
         db = SessionLocal()
         try:
-            # Get all active price alerts for this ticker
-            alerts = db.query(PriceAlert).filter(
-                PriceAlert.stock_ticker == ticker.upper(),
-                PriceAlert.is_active == True,
-                PriceAlert.triggered_at.is_(None)  # Only untriggered alerts
-            ).all()
+            triggered = self._find_triggered_alerts(db, {ticker: prices[ticker] for ticker in matches})
             
-            if not alerts:
-                return
+            if triggered:
+                triggered_at = datetime.now()
+                # Bulk UPDATE by primary key for every triggered alert
+                db.execute(update(PriceAlert), [
+                    {
+                        'id': alert.id,
+                        'triggered_at': triggered_at,
+                        'triggered_price': alert.price,
+                        'trigger_type': alert.trigger_type,
+                        'is_active': False  # Deactivate after triggering
+                    }
+                    for alert in triggered
+                ])
+                # Record the notifications in the same transaction as the triggers
+                db.execute(insert(NotificationOutbox), [
+                    self._build_alert_notification(alert) for alert in triggered
+                ])
             
-            triggered_alerts = []
+            db.commit()
             
-            for alert in alerts:
-                should_trigger = False
-                trigger_type = None
-                
-                # Check high price alert
-                if alert.high_price and current_price >= alert.high_price:
-                    should_trigger = True
-                    trigger_type = 'high'
-                
-                # Check low price alert
-                if alert.low_price and current_price <= alert.low_price:
-                    should_trigger = True
-                    trigger_type = 'low'
-                
-                if should_trigger:
-                    # Mark alert as triggered
-                    alert.triggered_at = datetime.now()
-                    alert.triggered_price = current_price
-                    alert.trigger_type = trigger_type
-                    alert.is_active = False  # Deactivate after triggering
-                    
-                    triggered_alerts.append({
-                        'alert': alert,
-                        'current_price': current_price,
-                        'trigger_type': trigger_type
-                    })
+            # Triggered alerts are disarmed; ids that were no longer armed are stale
+            for matched in matches.values():
+                for alert_id, _ in matched:
+                    alert_index.remove(alert_id)
             
-            if triggered_alerts:
-                db.commit()
-                
-                # Send email notifications for triggered alerts
-                for trigger_data in triggered_alerts:
-                    await self._send_alert_notification(trigger_data)
-                    
-                print(f"Triggered {len(triggered_alerts)} price alerts for {ticker}")
+            if triggered:
+                # Delivery happens on the dispatcher, independently of alert evaluation
+                notification_dispatcher.wake()
+                print(f"Triggered {len(triggered)} price alerts across {len({alert.stock_ticker for alert in triggered})} tickers")
+            return len(triggered)
             
         except Exception as e:
-            print(f"Error checking price alerts for {ticker}: {e}")
+            print(f"Error checking price alerts for {len(matches)} tickers: {e}")
             db.rollback()
+            return 0
         finally:
             db.close()
     
-    async def _send_alert_notification(self, trigger_data: Dict):
-        """Send email notification for triggered alert"""
-        try:
-            alert = trigger_data['alert']
-            
-            email_data = {
+    def _find_triggered_alerts(self, db: Session, prices: Dict[str, float]) -> list:
+        """Armed alerts crossed by the given prices, found by joining against the prices as a VALUES list"""
+        params = {}
+        rows = []
+        for i, (ticker, price) in enumerate(prices.items()):
+            params[f"ticker_{i}"] = ticker
+            params[f"price_{i}"] = float(price)
+            rows.append(f"(:ticker_{i}, :price_{i})")
+        
+        # A zero or missing threshold counts as unset; a low crossing wins if both are crossed
+        query = text(f"""
+            WITH tick_prices (ticker, price) AS (VALUES {', '.join(rows)})
+            SELECT price_alerts.id, price_alerts.email, price_alerts.stock_ticker,
+                   price_alerts.high_price, price_alerts.low_price, price_alerts.created_at,
+                   tick_prices.price,
+                   CASE WHEN price_alerts.low_price <> 0 AND tick_prices.price <= price_alerts.low_price
+                        THEN 'low' ELSE 'high' END AS trigger_type
+            FROM price_alerts
+            JOIN tick_prices ON tick_prices.ticker = price_alerts.stock_ticker
+            WHERE price_alerts.is_active = :active
+              AND price_alerts.triggered_at IS NULL
+              AND ((price_alerts.high_price <> 0 AND tick_prices.price >= price_alerts.high_price)
+                OR (price_alerts.low_price <> 0 AND tick_prices.price <= price_alerts.low_price))
+        """).bindparams(active=True).columns(
+            column('id', Integer),
+            column('email', String),
+            column('stock_ticker', String),
+            column('high_price', Float),
+            column('low_price', Float),
+            column('created_at', DateTime(timezone=True)),
+            column('price', Float),
+            column('trigger_type', String)
+        )
+        return db.execute(query, params).all()
+    
+    def _build_alert_notification(self, alert) -> Dict:
+        """Outbox row carrying everything the alert email needs"""
+        return {
+            'kind': 'price_alert',
+            'recipient': alert.email,
+            'payload': {
+                'alert_id': alert.id,
                 'email': alert.email,
                 'stock_ticker': alert.stock_ticker,
-                'current_price': trigger_data['current_price'],
-                'trigger_type': trigger_data['trigger_type'],
-                'trigger_price': alert.high_price if trigger_data['trigger_type'] == 'high' else alert.low_price,
-                'created_at': alert.created_at
+                'current_price': alert.price,
+                'trigger_type': alert.trigger_type,
+                'trigger_price': alert.high_price if alert.trigger_type == 'high' else alert.low_price,
+                'created_at': alert.created_at.isoformat() if alert.created_at else None
             }
-            
-            success = await email_service.send_price_alert(email_data)
-            if success:
-                print(f"Alert notification sent to {alert.email} for {alert.stock_ticker}")
-            else:
-                print(f"Failed to send alert notification to {alert.email}")
-                
-        except Exception as e:
-            print(f"Error sending alert notification: {e}")
+        }
     
     async def get_user_alerts(self, user_id: int) -> List[Dict]:
         """Get all price alerts for a specific user"""
@@ -124,20 +156,11 @@ class PriceAlertService:
         """Check price alerts for all stocks with recent data"""
         db = SessionLocal()
         try:
-            # Get all stocks with recent data points
-            recent_data = db.query(StockDataPoint).filter(
-                StockDataPoint.date >= datetime.now().date()
-            ).order_by(desc(StockDataPoint.date)).all()
-            
-            # Group by stock ticker and get latest price for each
-            stock_prices = {}
-            for data_point in recent_data:
-                if data_point.stock.ticker not in stock_prices:
-                    stock_prices[data_point.stock.ticker] = data_point.close
+            # Latest price for each ticker from the configured bar store
+            stock_prices = bar_store.latest_closes(db)
             
-            # Check alerts for each stock
-            for ticker, price in stock_prices.items():
-                await self.check_price_alerts(ticker, price)
+            # Check alerts for every stock in one batch
+            await self.check_price_alerts_batch(stock_prices)
                 
         except Exception as e:
             print(f"Error checking all stock alerts: {e}")
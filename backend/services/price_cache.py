@@ -0,0 +1,307 @@
+import logging
+import numpy as np
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Columns held for every bar; timestamps are epoch microseconds of the stored (naive) datetime
+BAR_COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+COLUMN_DTYPES = {
+    "timestamp": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.int64
+}
+
+# Chart resolutions; coarser bars are stamped with the start of their week (Monday) or month
+RESOLUTIONS = ("day", "week", "month")
+# Shortest length of one coarser bar, used to size its ring buffer
+RESOLUTION_DAYS = {"week": 7, "month": 28}
+
+def to_timestamp(date: datetime) -> int:
+    """Convert a stored bar date to epoch microseconds"""
+    return int(round(date.timestamp() * 1_000_000))
+
+def from_timestamp(timestamp: int) -> datetime:
+    """Convert epoch microseconds back to the stored bar date"""
+    return datetime.fromtimestamp(timestamp / 1_000_000)
+
+@lru_cache(maxsize=4096)
+def period_start(day: date, resolution: str) -> int:
+    """Timestamp of the start of the week or month containing a bar's calendar day"""
+    if resolution == "week":
+        day = day - timedelta(days=day.weekday())
+    elif resolution == "month":
+        day = day.replace(day=1)
+    return to_timestamp(datetime.combine(day, time()))
+
+def rollup_bars(bars: Dict[str, np.ndarray], resolution: str) -> Dict[str, np.ndarray]:
+    """Aggregate columnar bars (oldest first) into weekly or monthly OHLCV bars"""
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution '{resolution}', expected one of {', '.join(RESOLUTIONS)}")
+    if resolution == "day" or len(bars["close"]) == 0:
+        return bars
+    
+    keys = np.array(
+        [period_start(from_timestamp(timestamp).date(), resolution) for timestamp in bars["timestamp"].tolist()],
+        dtype=np.int64
+    )
+    # Bars are in date order, so each period is one contiguous run
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    return {
+        "timestamp": keys[starts],
+        "open": bars["open"][starts],
+        "high": np.maximum.reduceat(bars["high"], starts),
+        "low": np.minimum.reduceat(bars["low"], starts),
+        "close": bars["close"][ends],
+        "volume": np.add.reduceat(bars["volume"], starts)
+    }
+
+def quote_from_bars(bars: Dict[str, np.ndarray]) -> Dict:
+    """Latest close, change vs. the previous close, volume and date from the newest bars"""
+    closes = bars["close"]
+    latest_close = float(closes[-1])
+    if len(closes) > 1:
+        previous_close = float(closes[-2])
+        change = latest_close - previous_close
+        change_percent = (change / previous_close) * 100
+    else:
+        change = 0
+        change_percent = 0
+    
+    return {
+        "current_price": round(latest_close, 2),
+        "change": round(change, 2),
+        "change_percent": round(change_percent, 2),
+        "volume": int(bars["volume"][-1]),
+        "last_updated": from_timestamp(int(bars["timestamp"][-1]))
+    }
+
+def chart_points_from_bars(bars: Dict[str, np.ndarray]) -> List[Dict]:
+    """Format columnar bars (oldest first) as chart points"""
+    return [
+        {
+            "timestamp": timestamp // 1000,  # Convert to milliseconds
+            "price": close_price,
+            "volume": volume,
+            "open": open_price,
+            "high": high_price,
+            "low": low_price
+        }
+        for timestamp, close_price, volume, open_price, high_price, low_price in zip(
+            bars["timestamp"].tolist(),
+            bars["close"].tolist(),
+            bars["volume"].tolist(),
+            bars["open"].tolist(),
+            bars["high"].tolist(),
+            bars["low"].tolist()
+        )
+    ]
+
+class PriceRingBuffer:
+    """
+    Fixed-size columnar ring buffer holding the most recent bars of one ticker.
+    Every bar is written twice, at slot i and i + capacity, so the newest n bars
+    are always one contiguous slice of each column and reads never copy.
+    """
+    
+    def __init__(self, capacity: int, columns: Optional[Dict[str, np.ndarray]] = None, meta: Optional[np.ndarray] = None):
+        self.capacity = capacity
+        # Column arrays and the [count, head] pair may be backed by any array-like storage
+        self.columns = columns if columns is not None else {
+            name: np.zeros(2 * capacity, dtype=COLUMN_DTYPES[name]) for name in BAR_COLUMNS
+        }
+        self.meta = meta if meta is not None else np.zeros(2, dtype=np.int64)
+        
+    def __len__(self) -> int:
+        return int(self.meta[0])
+        
+    def append(self, timestamp: int, open_price: float, high_price: float, low_price: float, close_price: float, volume: int):
+        """Append a single bar, overwriting the oldest one when full"""
+        head = int(self.meta[1])
+        for name, value in zip(BAR_COLUMNS, (timestamp, open_price, high_price, low_price, close_price, volume)):
+            column = self.columns[name]
+            column[head] = value
+            column[head + self.capacity] = value
+        self.meta[1] = (head + 1) % self.capacity
+        self.meta[0] = min(int(self.meta[0]) + 1, self.capacity)
+        
+    def replace(self, bars: Dict[str, np.ndarray]):
+        """Replace the contents with the given bars (oldest first), keeping the newest capacity bars"""
+        count = min(len(bars["close"]), self.capacity)
+        for name in BAR_COLUMNS:
+            values = np.asarray(bars[name])[-count:] if count else ()
+            column = self.columns[name]
+            column[:count] = values
+            column[self.capacity:self.capacity + count] = values
+        self.meta[0] = count
+        self.meta[1] = count % self.capacity
+        
+    def window(self, size: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Return views over the newest `size` bars (all bars if omitted), oldest first"""
+        count = len(self)
+        size = count if size is None else max(0, min(size, count))
+        end = int(self.meta[1]) + self.capacity
+        return {name: self.columns[name][end - size:end] for name in BAR_COLUMNS}
+
+class RollupBuffer(PriceRingBuffer):
+    """
+    Ring buffer of weekly or monthly bars whose newest bar is extended in place as daily bars
+    arrive, and whose oldest bar is rebuilt as daily bars age out, so it always matches
+    rollup_bars over the cached daily window.
+    """
+    
+    def __init__(self, capacity: int, resolution: str):
+        super().__init__(capacity)
+        self.resolution = resolution
+        
+    def add(self, day: date, open_price: float, high_price: float, low_price: float, close_price: float, volume: int):
+        """Fold one daily bar into the current period, or start a new period"""
+        key = period_start(day, self.resolution)
+        last = (int(self.meta[1]) - 1) % self.capacity
+        if len(self) == 0 or key > self.columns["timestamp"][last]:
+            self.append(key, open_price, high_price, low_price, close_price, volume)
+            return
+        
+        columns = self.columns
+        for slot in (last, last + self.capacity):
+            columns["high"][slot] = max(columns["high"][slot], high_price)
+            columns["low"][slot] = min(columns["low"][slot], low_price)
+            columns["close"][slot] = close_price
+            columns["volume"][slot] += volume
+            
+    def trim(self, daily: Dict[str, np.ndarray]):
+        """Drop periods older than the daily window (oldest first) and rebuild its first, partial one"""
+        if len(daily["close"]) == 0:
+            self.meta[0] = 0
+            return
+            
+        # A period holds at most 31 daily bars, so its run is within the window's first 32
+        leading = {name: column[:32] for name, column in daily.items()}
+        keys = np.array(
+            [period_start(from_timestamp(timestamp).date(), self.resolution) for timestamp in leading["timestamp"].tolist()],
+            dtype=np.int64
+        )
+        run = int(np.argmax(keys != keys[0])) or len(keys)
+        
+        columns = self.columns
+        while len(self) > 0 and columns["timestamp"][(int(self.meta[1]) - len(self)) % self.capacity] < keys[0]:
+            self.meta[0] -= 1
+        if len(self) == 0:
+            return
+            
+        first = (int(self.meta[1]) - len(self)) % self.capacity
+        values = {
+            "timestamp": keys[0],
+            "open": leading["open"][0],
+            "high": leading["high"][:run].max(),
+            "low": leading["low"][:run].min(),
+            "close": leading["close"][run - 1],
+            "volume": leading["volume"][:run].sum()
+        }
+        for name, value in values.items():
+            columns[name][first] = value
+            columns[name][first + self.capacity] = value
+
+class PriceCache:
+    """
+    Process-local cache of each ticker's most recent bars.
+    Filled from the database on startup and kept current by the data generator,
+    so quotes and charts for known tickers are answered without touching the DB.
+    """
+    
+    def __init__(self, capacity: int = 365):
+        self.capacity = capacity  # Matches the generator's per-instrument retention
+        self.buffers: Dict[str, PriceRingBuffer] = {}
+        # Weekly/monthly rollups per ticker, built on first use and then kept current by append_bars
+        self.rollups: Dict[str, Dict[str, RollupBuffer]] = {}
+        
+    def load_from_db(self, db: Session):
+        """Fill the cache with every instrument's stored history from the configured bar store"""
+        from services.bar_store import bar_store
+        
+        self.buffers.clear()
+        self.rollups.clear()
+        bar_count = 0
+        for ticker, bars in bar_store.iter_series(db):
+            self.set_series(ticker, bars)
+            bar_count += len(bars["close"])
+        
+        logger.info(f"Price cache loaded {bar_count} bars for {len(self.buffers)} tickers")
+    
+    def set_series(self, ticker: str, bars: Dict[str, np.ndarray]):
+        """Replace a ticker's cached history with the given bars (oldest first)"""
+        buffer = self.buffers.get(ticker)
+        if buffer is None:
+            buffer = self.buffers[ticker] = PriceRingBuffer(self.capacity)
+        buffer.replace(bars)
+        self.rollups.pop(ticker, None)
+        
+    def append_bars(self, tickers: List[str], dates: List[datetime], bars: Dict[str, np.ndarray]):
+        """Append one new bar per ticker, as produced by a generator tick"""
+        columns = zip(
+            tickers,
+            dates,
+            bars["open"].tolist(),
+            bars["high"].tolist(),
+            bars["low"].tolist(),
+            bars["close"].tolist(),
+            bars["volume"].tolist()
+        )
+        for ticker, date, open_price, high_price, low_price, close_price, volume in columns:
+            buffer = self.buffers.get(ticker)
+            if buffer is None:
+                buffer = self.buffers[ticker] = PriceRingBuffer(self.capacity)
+            evicted = len(buffer) == buffer.capacity
+            buffer.append(to_timestamp(date), open_price, high_price, low_price, close_price, volume)
+            for rollup in self.rollups.get(ticker, {}).values():
+                rollup.add(date.date(), open_price, high_price, low_price, close_price, volume)
+                if evicted:
+                    # The oldest daily bar just aged out, so the oldest period loses it too
+                    rollup.trim(buffer.window())
+            
+    def get_quote(self, ticker: str) -> Optional[Dict]:
+        """Latest close, change vs. the previous close, volume and date, or None on a miss"""
+        buffer = self.buffers.get(ticker)
+        if buffer is None or len(buffer) == 0:
+            return None
+        
+        return quote_from_bars(buffer.window(2))
+    
+    def get_chart(self, ticker: str, days: int, resolution: str = "day") -> Optional[List[Dict]]:
+        """Chart points covering the newest `days` daily bars (oldest first), or None on a miss"""
+        buffer = self.buffers.get(ticker)
+        if buffer is None or len(buffer) == 0:
+            return None
+        
+        bars = buffer.window(days)
+        if resolution == "day":
+            return chart_points_from_bars(bars)
+        
+        # Keep every period that overlaps the requested daily window
+        rollup = self._get_rollup(ticker, resolution).window()
+        first = period_start(from_timestamp(int(bars["timestamp"][0])).date(), resolution)
+        start = int(np.searchsorted(rollup["timestamp"], first))
+        return chart_points_from_bars({name: column[start:] for name, column in rollup.items()})
+    
+    def _get_rollup(self, ticker: str, resolution: str) -> RollupBuffer:
+        """A ticker's rollup at the given resolution, aggregating its cached bars on first use"""
+        if resolution not in RESOLUTION_DAYS:
+            raise ValueError(f"Unknown resolution '{resolution}', expected one of {', '.join(RESOLUTIONS)}")
+        
+        rollups = self.rollups.setdefault(ticker, {})
+        rollup = rollups.get(resolution)
+        if rollup is None:
+            # Room for every period the daily buffer can span, including partial ones at both ends
+            rollup = rollups[resolution] = RollupBuffer(self.capacity // RESOLUTION_DAYS[resolution] + 2, resolution)
+            rollup.replace(rollup_bars(self.buffers[ticker].window(), resolution))
+        return rollup
+
+# Global instance
+price_cache = PriceCache()
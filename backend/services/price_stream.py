@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+from services.price_cache import price_cache
+from services.stock_service import stock_service
+
+logger = logging.getLogger(__name__)
+
+class PriceSubscription:
+    """
+    One connected client: the tickers it follows and a bounded queue of pending updates.
+    When the client falls behind, the oldest pending update is discarded, since a newer
+    one for the same tickers supersedes it anyway.
+    """
+    
+    def __init__(self, queue_size: int):
+        self.tickers: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        
+    def offer(self, message: Dict):
+        """Queue a message without ever blocking the publisher"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+        
+    async def next_message(self) -> Dict:
+        """Wait for the next pending update"""
+        return await self.queue.get()
+
+class PriceStreamHub:
+    """
+    In-process fan-out of generator ticks to WebSocket subscribers.
+    Publishing only touches in-memory queues, so the tick loop never waits on a socket.
+    """
+    
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[PriceSubscription]] = {}
+        
+    def connect(self) -> PriceSubscription:
+        """Register a new connection with no tickers yet"""
+        return PriceSubscription(self.queue_size)
+        
+    def disconnect(self, subscription: PriceSubscription):
+        """Drop a connection and all of its ticker subscriptions"""
+        self.unsubscribe(subscription, list(subscription.tickers))
+        if subscription.dropped:
+            logger.info(f"Price stream client disconnected after dropping {subscription.dropped} slow updates")
+            
+    def subscribe(self, subscription: PriceSubscription, tickers: Iterable[str]) -> List[Dict]:
+        """Follow the given tickers; returns their current quotes as a snapshot"""
+        snapshot = []
+        for ticker in tickers:
+            ticker = ticker.upper()
+            subscription.tickers.add(ticker)
+            self.subscribers.setdefault(ticker, set()).add(subscription)
+            quote = self._quote(ticker)
+            if quote is not None:
+                snapshot.append(quote)
+        return snapshot
+        
+    def unsubscribe(self, subscription: PriceSubscription, tickers: Iterable[str]):
+        """Stop following the given tickers"""
+        for ticker in tickers:
+            ticker = ticker.upper()
+            subscription.tickers.discard(ticker)
+            followers = self.subscribers.get(ticker)
+            if followers is not None:
+                followers.discard(subscription)
+                if not followers:
+                    del self.subscribers[ticker]
+                    
+    def publish(self, tickers: Iterable[str]):
+        """Push the latest quote of every updated ticker to its subscribers, one message per connection"""
+        if not self.subscribers:
+            return
+            
+        updates: Dict[PriceSubscription, List[Dict]] = {}
+        for ticker in tickers:
+            followers = self.subscribers.get(ticker)
+            if not followers:
+                continue
+            quote = self._quote(ticker)
+            if quote is None:
+                continue
+            for subscription in followers:
+                updates.setdefault(subscription, []).append(quote)
+                
+        for subscription, quotes in updates.items():
+            subscription.offer({"type": "prices", "data": quotes})
+            
+    def _quote(self, ticker: str) -> Optional[Dict]:
+        """Cached quote for a ticker in the same shape as /api/stocks/{ticker}/data"""
+        quote = price_cache.get_quote(ticker)
+        if quote is None:
+            return None
+            
+        return {
+            "ticker": ticker,
+            "company_name": stock_service._get_company_name(ticker),
+            **quote,
+            "last_updated": quote["last_updated"].isoformat()
+        }
+
+# Global instance
+price_stream = PriceStreamHub()
@@ -0,0 +1,83 @@
+import logging
+import numpy as np
+from typing import Dict
+from sqlalchemy.orm import Session
+from services.covariance_cache import covariance_cache
+from services.paper_trading_service import paper_trading_service
+from services.portfolio_valuation import position_contribution
+
+logger = logging.getLogger(__name__)
+
+# Generated history has one bar per calendar day
+BARS_PER_YEAR = 365
+
+class RiskService:
+    """
+    Portfolio risk of a paper account from its current weights and the cached return window.
+    Volatility and beta come from the covariance matrix; VaR, CVaR and max drawdown from
+    replaying the window's returns against today's weights.
+    """
+    
+    async def get_portfolio_risk(self, user_id: int, db: Session, confidence: float = 0.95) -> Dict:
+        """One-day historical VaR/CVaR, volatility, beta and max drawdown of a paper portfolio"""
+        if not 0.5 <= confidence < 1:
+            return {"success": False, "message": "confidence must be at least 0.5 and below 1"}
+            
+        valuation = await paper_trading_service.get_valuation(user_id, db)
+        tickers = list(valuation.positions)
+        values = np.array([position_contribution(position)[0] for position in valuation.positions.values()])
+        total_value = valuation.cash_balance + float(values.sum())
+        weights = values / total_value if total_value > 0 else np.zeros(len(values))
+        
+        covariance_cache.track(tickers)
+        snapshot = covariance_cache.snapshot(tickers)
+        if snapshot is None:
+            return {"success": False, "message": "Not enough price history to estimate risk"}
+        covariance, returns = snapshot
+        
+        # Column 0 is the market; the cash weight carries no risk
+        market_variance = covariance[0, 0]
+        asset_covariance = covariance[1:, 1:]
+        betas = covariance[1:, 0] / market_variance if market_variance > 0 else np.zeros(len(tickers))
+        marginal = asset_covariance @ weights
+        variance = float(weights @ marginal)
+        daily_volatility = np.sqrt(max(variance, 0.0))
+        
+        portfolio_returns = returns[:, 1:] @ weights
+        cutoff = float(np.quantile(portfolio_returns, 1 - confidence))
+        tail = portfolio_returns[portfolio_returns <= cutoff]
+        growth = np.concatenate(([1.0], np.cumprod(1 + portfolio_returns)))
+        drawdowns = growth / np.maximum.accumulate(growth) - 1
+        
+        ticker_volatility = np.sqrt(np.clip(np.diag(asset_covariance), 0, None) * BARS_PER_YEAR)
+        contributions = weights * marginal / variance if variance > 0 else np.zeros(len(tickers))
+        return {
+            "success": True,
+            "total_value": round(total_value, 2),
+            "cash_weight_percent": round((valuation.cash_balance / total_value) * 100, 2) if total_value > 0 else 0,
+            "confidence": confidence,
+            "window_bars": int(len(returns)),
+            "daily_volatility_percent": round(daily_volatility * 100, 4),
+            "volatility_percent": round(daily_volatility * np.sqrt(BARS_PER_YEAR) * 100, 2),
+            "beta": round(float(weights @ betas), 4),
+            "value_at_risk": round(max(-cutoff, 0.0) * total_value, 2),
+            "value_at_risk_percent": round(max(-cutoff, 0.0) * 100, 4),
+            "conditional_value_at_risk": round(max(-float(tail.mean()), 0.0) * total_value, 2),
+            "conditional_value_at_risk_percent": round(max(-float(tail.mean()), 0.0) * 100, 4),
+            "max_drawdown_percent": round(float(drawdowns.min()) * 100, 2),
+            "positions": [
+                {
+                    "stock_ticker": ticker,
+                    "weight_percent": round(float(weight) * 100, 2),
+                    "volatility_percent": round(float(volatility) * 100, 2),
+                    "beta": round(float(beta), 4),
+                    "risk_contribution_percent": round(float(contribution) * 100, 2)
+                }
+                for ticker, weight, volatility, beta, contribution in zip(
+                    tickers, weights.tolist(), ticker_volatility.tolist(), betas.tolist(), contributions.tolist()
+                )
+            ]
+        }
+
+# Create service instance
+risk_service = RiskService()
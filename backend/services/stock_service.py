@@ -4,7 +4,9 @@ from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
+from services.price_cache import price_cache, quote_from_bars, chart_points_from_bars, rollup_bars, RESOLUTIONS
+from services.bar_store import bar_store
 
 load_dotenv()
 
@@ -47,62 +49,68 @@ class StockService:
             # Return mock data if API fails
             return self._get_mock_stock_data(ticker)
     
-    async def get_stock_chart(self, ticker: str, period: str = "1M", db: Session = None) -> Dict:
-        """Get stock chart data for a ticker from database"""
+    def get_or_create_instrument(self, ticker: str, company_name: Optional[str], db: Session):
+        """Get the shared instrument for a ticker, creating it on first use"""
+        from models import Instrument
+        
+        ticker = ticker.upper()
+        instrument = db.query(Instrument).filter(Instrument.ticker == ticker).first()
+        if instrument:
+            return instrument
+        
+        try:
+            instrument = Instrument(ticker=ticker, company_name=company_name)
+            db.add(instrument)
+            db.commit()
+            db.refresh(instrument)
+            return instrument
+        except IntegrityError:
+            # Another request created the same ticker concurrently
+            db.rollback()
+            return db.query(Instrument).filter(Instrument.ticker == ticker).one()
+    
+    async def get_stock_chart(self, ticker: str, period: str = "1M", db: Session = None, resolution: str = "day") -> Dict:
+        """Get stock chart data for a ticker from database, as daily, weekly or monthly bars"""
+        # Map period to days
+        period_days = {
+            "1W": 7,
+            "1M": 30,
+            "3M": 90,
+            "1Y": 365
+        }
+        
+        days = period_days.get(period, 30)
+        
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{resolution}', expected one of {', '.join(RESOLUTIONS)}")
+        
+        # Serve straight from the in-memory price cache when the ticker is loaded
+        cached_points = price_cache.get_chart(ticker.upper(), days, resolution)
+        if cached_points is not None:
+            return {
+                "ticker": ticker,
+                "period": period,
+                "resolution": resolution,
+                "data": cached_points
+            }
+        
         if db is None:
             # Fallback to mock data if no database session provided
             return self._get_mock_chart_data(ticker, period)
         
         try:
-            from models import Stock, StockDataPoint
-            
-            # Find the stock in database
-            stock = db.query(Stock).filter(Stock.ticker == ticker.upper()).first()
-            
-            if not stock:
-                # Stock not found in database, return mock data
-                return self._get_mock_chart_data(ticker, period)
-            
-            # Map period to days
-            period_days = {
-                "1W": 7,
-                "1M": 30,
-                "3M": 90,
-                "1Y": 365
-            }
-            
-            days = period_days.get(period, 30)
-            
-            # Get the last N data points
-            data_points = db.query(StockDataPoint)\
-                .filter(StockDataPoint.stock_id == stock.id)\
-                .order_by(desc(StockDataPoint.date))\
-                .limit(days)\
-                .all()
+            # Get the last N bars from the configured bar store
+            bars = bar_store.get_bars(db, ticker.upper(), days)
             
-            if not data_points:
-                # No data points found, return mock data
+            if bars is None:
+                # Ticker not found in the store, return mock data
                 return self._get_mock_chart_data(ticker, period)
             
-            # Reverse to get chronological order (oldest to newest)
-            data_points.reverse()
-            
-            # Format data for chart
-            chart_data = []
-            for point in data_points:
-                chart_data.append({
-                    "timestamp": int(point.date.timestamp() * 1000),  # Convert to milliseconds
-                    "price": point.close,
-                    "volume": point.volume,
-                    "open": point.open,
-                    "high": point.high,
-                    "low": point.low
-                })
-            
             return {
                 "ticker": ticker,
                 "period": period,
-                "data": chart_data
+                "resolution": resolution,
+                "data": chart_points_from_bars(rollup_bars(bars, resolution))
             }
             
         except Exception as e:
@@ -111,52 +119,69 @@ class StockService:
     
     async def get_stock_data_from_db(self, ticker: str, db: Session) -> Dict:
         """Get current stock data from database"""
+        # Serve straight from the in-memory price cache when the ticker is loaded
+        cached_quote = price_cache.get_quote(ticker.upper())
+        if cached_quote is not None:
+            return {
+                "ticker": ticker.upper(),
+                "company_name": self._get_company_name(ticker),
+                **cached_quote
+            }
+        
         try:
-            from models import Stock, StockDataPoint
-            
-            # Find the stock in database
-            stock = db.query(Stock).filter(Stock.ticker == ticker.upper()).first()
+            # Get the latest two bars for change calculation
+            bars = bar_store.get_bars(db, ticker.upper(), 2)
             
-            if not stock:
+            if bars is None:
                 return self._get_mock_stock_data(ticker)
             
-            # Get the latest data point
-            latest_point = db.query(StockDataPoint)\
-                .filter(StockDataPoint.stock_id == stock.id)\
-                .order_by(desc(StockDataPoint.date))\
-                .first()
-            
-            if not latest_point:
-                return self._get_mock_stock_data(ticker)
-            
-            # Get the previous data point for change calculation
-            previous_point = db.query(StockDataPoint)\
-                .filter(StockDataPoint.stock_id == stock.id)\
-                .order_by(desc(StockDataPoint.date))\
-                .offset(1)\
-                .first()
-            
-            if previous_point:
-                change = latest_point.close - previous_point.close
-                change_percent = (change / previous_point.close) * 100
-            else:
-                change = 0
-                change_percent = 0
-            
             return {
                 "ticker": ticker.upper(),
                 "company_name": self._get_company_name(ticker),
-                "current_price": round(latest_point.close, 2),
-                "change": round(change, 2),
-                "change_percent": round(change_percent, 2),
-                "volume": latest_point.volume,
-                "last_updated": latest_point.date
+                **quote_from_bars(bars)
             }
             
         except Exception as e:
             print(f"Error fetching stock data from database: {e}")
             return self._get_mock_stock_data(ticker)
     
+    async def get_quotes(self, tickers: List[str], db: Session) -> List[Dict]:
+        """Current stock data for many tickers, with every cache miss answered by one bar store read"""
+        tickers = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers if ticker.strip()))
+        quotes = await self.get_stored_quotes(tickers, db)
+        
+        return [
+            {
+                "ticker": ticker,
+                "company_name": self._get_company_name(ticker),
+                **quotes[ticker]
+            } if ticker in quotes else self._get_mock_stock_data(ticker)
+            for ticker in tickers
+        ]
+        
+    async def get_stored_quotes(self, tickers: List[str], db: Session) -> Dict[str, Dict]:
+        """
+        Quotes keyed by ticker from the price cache and the bar store only. Tickers with no
+        stored bars are left out rather than given mock data, so callers can price trades safely.
+        """
+        tickers = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers if ticker.strip()))
+        
+        quotes = {}
+        for ticker in tickers:
+            cached_quote = price_cache.get_quote(ticker)
+            if cached_quote is not None:
+                quotes[ticker] = cached_quote
+                
+        misses = [ticker for ticker in tickers if ticker not in quotes]
+        if misses:
+            try:
+                for ticker, bars in bar_store.get_latest_bars(db, misses, 2).items():
+                    quotes[ticker] = quote_from_bars(bars)
+            except Exception as e:
+                print(f"Error fetching stock quotes from database: {e}")
+                
+        return quotes
+    
     def _get_mock_stock_data(self, ticker: str) -> Dict:
         """Generate mock stock data for demo purposes"""
         import random
@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway SQLite database before any app module is imported
+_db_dir = tempfile.mkdtemp(prefix="marketpulse-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["BAR_STORE_BACKEND"] = "sql"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal, engine, Base
+from services.portfolio_valuation import portfolio_valuations
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables, with the in-memory valuation book emptied"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    for user_id in list(portfolio_valuations.user_accounts):
+        portfolio_valuations.invalidate(user_id)
+    portfolio_valuations.changed.clear()
+    
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def user_ids(db):
+    """Ids of two registered users"""
+    from models import User
+    
+    users = [User(email=f"trader{i}@example.com", hashed_password="x", full_name=f"Trader {i}") for i in range(2)]
+    db.add_all(users)
+    db.commit()
+    return [user.id for user in users]
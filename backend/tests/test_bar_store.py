@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+
+from models import Instrument, StockDataPoint
+from services.bar_store import SqlBarStore, MAX_DATA_POINTS
+
+START = datetime(2024, 1, 1)
+
+def add_instrument(db, ticker: str, bar_count: int) -> int:
+    """Store `bar_count` daily bars (closes 0, 1, 2, ...) for a new instrument; returns its id"""
+    instrument = Instrument(ticker=ticker, company_name=ticker)
+    db.add(instrument)
+    db.flush()
+    if bar_count:
+        db.execute(insert(StockDataPoint.__table__), [
+            {
+                "instrument_id": instrument.id,
+                "date": START + timedelta(days=day),
+                "open": day, "high": day, "low": day, "close": day, "volume": 1
+            }
+            for day in range(bar_count)
+        ])
+    db.commit()
+    return instrument.id
+
+def closes(db, instrument_id: int):
+    return sorted(
+        close for (close,) in db.query(StockDataPoint.close).filter(StockDataPoint.instrument_id == instrument_id)
+    )
+
+def test_prune_trims_every_instrument_to_the_newest_bars(db):
+    over_by_one = add_instrument(db, "ONE", MAX_DATA_POINTS + 1)
+    over_by_many = add_instrument(db, "MANY", MAX_DATA_POINTS + 40)
+    full = add_instrument(db, "FULL", MAX_DATA_POINTS)
+    short = add_instrument(db, "SHORT", 10)
+    
+    SqlBarStore().prune(db)
+    db.commit()
+    
+    assert closes(db, over_by_one) == list(range(1, MAX_DATA_POINTS + 1))
+    assert closes(db, over_by_many) == list(range(40, MAX_DATA_POINTS + 40))
+    assert closes(db, full) == list(range(MAX_DATA_POINTS))
+    assert closes(db, short) == list(range(10))
+
+def test_prune_breaks_date_ties_by_id(db):
+    instrument_id = add_instrument(db, "TIE", MAX_DATA_POINTS)
+    # A second bar on the oldest date, written later, ranks newer than the first one
+    db.execute(insert(StockDataPoint.__table__), [{
+        "instrument_id": instrument_id, "date": START,
+        "open": -1, "high": -1, "low": -1, "close": -1, "volume": 1
+    }])
+    db.commit()
+    
+    SqlBarStore().prune(db)
+    db.commit()
+    
+    assert closes(db, instrument_id) == [-1] + list(range(1, MAX_DATA_POINTS))
+
+def test_prune_without_overflow_deletes_nothing(db):
+    add_instrument(db, "A", MAX_DATA_POINTS)
+    add_instrument(db, "B", 3)
+    
+    SqlBarStore().prune(db)
+    db.commit()
+    
+    assert db.query(func.count(StockDataPoint.id)).scalar() == MAX_DATA_POINTS + 3
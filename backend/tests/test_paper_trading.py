@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from database import SessionLocal
+from models import PaperAccount, PaperTrade
+from services.paper_trading_service import paper_trading_service
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(paper_trading_service, "fill_retry_delay", 0)
+    return paper_trading_service
+
+def open_account(service, db, user_id: int) -> int:
+    return asyncio.run(service.get_or_create_paper_account(user_id, db)).id
+
+def withdraw_elsewhere(account_id: int, amount: float):
+    """Change the account from another session, as a concurrent order would"""
+    other = SessionLocal()
+    try:
+        account = other.get(PaperAccount, account_id)
+        account.virtual_cash_balance -= amount
+        other.commit()
+    finally:
+        other.close()
+
+def test_fill_retries_after_a_conflicting_write(service, db, user_ids, monkeypatch):
+    account_id = open_account(service, db, user_ids[0])
+    apply_fill = service._apply_fill
+    calls = []
+    
+    def conflicting_apply_fill(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            # Lands between this fill's read and its commit, so the commit is stale
+            withdraw_elsewhere(account_id, 1000.0)
+        return apply_fill(*args, **kwargs)
+        
+    monkeypatch.setattr(service, "_apply_fill", conflicting_apply_fill)
+    result = asyncio.run(service._execute_fill(db, account_id, "buy", "AAPL", 10, 50.0))
+    
+    assert result["success"] is True
+    assert len(calls) == 2
+    assert result["remaining_cash"] == service.initial_cash_balance - 1000.0 - 500.0
+    assert db.query(PaperTrade).filter(PaperTrade.account_id == account_id).count() == 1
+
+def test_fill_gives_up_after_max_attempts(service, db, user_ids, monkeypatch):
+    account_id = open_account(service, db, user_ids[0])
+    apply_fill = service._apply_fill
+    calls = []
+    
+    def always_conflicting_apply_fill(*args, **kwargs):
+        calls.append(1)
+        withdraw_elsewhere(account_id, 1.0)
+        return apply_fill(*args, **kwargs)
+        
+    monkeypatch.setattr(service, "_apply_fill", always_conflicting_apply_fill)
+    monkeypatch.setattr(service, "max_fill_attempts", 3)
+    result = asyncio.run(service._execute_fill(db, account_id, "buy", "AAPL", 10, 50.0))
+    
+    assert result["success"] is False
+    assert len(calls) == 3
+    assert db.query(PaperTrade).filter(PaperTrade.account_id == account_id).count() == 0
+    assert db.get(PaperAccount, account_id).virtual_cash_balance == service.initial_cash_balance - 3.0
+
+def add_trades(db, account_id: int, count: int, created_at: datetime):
+    db.add_all([
+        PaperTrade(account_id=account_id, stock_ticker="AAPL", trade_type="buy",
+                   quantity=1, price=10.0, total_amount=10.0, created_at=created_at)
+        for _ in range(count)
+    ])
+    db.commit()
+
+def test_trade_history_pages_through_identical_timestamps(service, db, user_ids):
+    account_id = open_account(service, db, user_ids[0])
+    add_trades(db, account_id, 3, datetime(2024, 1, 1))
+    add_trades(db, account_id, 4, datetime(2024, 1, 2))
+    expected = [
+        trade.id for trade in db.query(PaperTrade)
+            .filter(PaperTrade.account_id == account_id)
+            .order_by(PaperTrade.created_at.desc(), PaperTrade.id.desc())
+    ]
+    
+    seen = []
+    cursor = None
+    while True:
+        trades, cursor = asyncio.run(service.get_trade_history(user_ids[0], db, limit=2, cursor=cursor))
+        seen.extend(trade.id for trade in trades)
+        if cursor is None:
+            break
+            
+    assert seen == expected
+
+def test_trade_history_rejects_a_cursor_from_another_account(service, db, user_ids):
+    account_id = open_account(service, db, user_ids[0])
+    open_account(service, db, user_ids[1])
+    add_trades(db, account_id, 2, datetime(2024, 1, 1))
+    foreign_cursor = db.query(PaperTrade.id).filter(PaperTrade.account_id == account_id).first()[0]
+    
+    with pytest.raises(ValueError):
+        asyncio.run(service.get_trade_history(user_ids[1], db, cursor=foreign_cursor))
+    with pytest.raises(ValueError):
+        asyncio.run(service.get_trade_history(user_ids[0], db, cursor=foreign_cursor + 1000))
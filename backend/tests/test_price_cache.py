@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from services.price_cache import PriceCache, PriceRingBuffer, rollup_bars, to_timestamp
+
+def bar(day: int):
+    """Bar for day `day` whose prices are derived from the day, so every bar is distinct"""
+    return day, 100.0 + day, 101.0 + day + day % 3, 99.0 + day - day % 5, 100.5 + day, 1000 + day
+
+def test_ring_buffer_wraps_around_keeping_the_newest_bars():
+    buffer = PriceRingBuffer(5)
+    for day in range(12):
+        buffer.append(*bar(day))
+        
+    assert len(buffer) == 5
+    assert buffer.window()["timestamp"].tolist() == [7, 8, 9, 10, 11]
+    assert buffer.window(2)["close"].tolist() == [110.5, 111.5]
+    assert buffer.window(0)["close"].tolist() == []
+    assert buffer.window(50)["timestamp"].tolist() == [7, 8, 9, 10, 11]
+
+def test_ring_buffer_partial_fill():
+    buffer = PriceRingBuffer(5)
+    for day in range(3):
+        buffer.append(*bar(day))
+        
+    assert len(buffer) == 3
+    assert buffer.window()["timestamp"].tolist() == [0, 1, 2]
+
+def test_ring_buffer_replace_keeps_the_newest_bars_and_appends_after_them():
+    buffer = PriceRingBuffer(5)
+    buffer.append(*bar(99))
+    rows = [bar(day) for day in range(8)]
+    buffer.replace({
+        name: np.array([row[i] for row in rows])
+        for i, name in enumerate(("timestamp", "open", "high", "low", "close", "volume"))
+    })
+    
+    assert buffer.window()["timestamp"].tolist() == [3, 4, 5, 6, 7]
+    buffer.append(*bar(8))
+    assert buffer.window()["timestamp"].tolist() == [4, 5, 6, 7, 8]
+
+@pytest.mark.parametrize("resolution", ["week", "month"])
+def test_rollups_match_a_fresh_rollup_after_the_daily_window_wraps(resolution):
+    cache = PriceCache(capacity=40)
+    start = datetime(2024, 1, 1)
+    dates = [start + timedelta(days=day) for day in range(200)]
+    
+    cache.append_bars(["AAA"], dates[:1], {name: np.array([value]) for name, value in zip(
+        ("open", "high", "low", "close", "volume"), bar(0)[1:]
+    )})
+    # Build the rollup early so it is maintained incrementally from here on
+    cache._get_rollup("AAA", resolution)
+    
+    for day, date in enumerate(dates[1:], start=1):
+        cache.append_bars(["AAA"], [date], {name: np.array([value]) for name, value in zip(
+            ("open", "high", "low", "close", "volume"), bar(day)[1:]
+        )})
+        
+        expected = rollup_bars(cache.buffers["AAA"].window(), resolution)
+        actual = cache._get_rollup("AAA", resolution).window()
+        for name, column in expected.items():
+            assert actual[name].tolist() == column.tolist(), f"{name} differs after {date:%Y-%m-%d}"
+            
+    assert cache.buffers["AAA"].window()["timestamp"][0] == to_timestamp(dates[-40])
@@ -53,13 +53,14 @@ export const PaperTradingProvider = ({ children }) => {
   };
 
   // Execute buy order
-  const executeBuyOrder = async (stockTicker, quantity, orderType = 'market', limitPrice = null) => {
+  const executeBuyOrder = async (stockTicker, quantity, orderType = 'market', limitPrice = null, stopPrice = null) => {
     try {
       const orderData = {
         stock_ticker: stockTicker,
         quantity: quantity,
         order_type: orderType,
-        limit_price: limitPrice
+        limit_price: limitPrice,
+        stop_price: stopPrice
       };
 
       const response = await axios.post('/api/v1/paper/buy', orderData);
@@ -80,13 +81,14 @@ export const PaperTradingProvider = ({ children }) => {
   };
 
   // Execute sell order
-  const executeSellOrder = async (stockTicker, quantity, orderType = 'market', limitPrice = null) => {
+  const executeSellOrder = async (stockTicker, quantity, orderType = 'market', limitPrice = null, stopPrice = null) => {
     try {
       const orderData = {
         stock_ticker: stockTicker,
         quantity: quantity,
         order_type: orderType,
-        limit_price: limitPrice
+        limit_price: limitPrice,
+        stop_price: stopPrice
       };
 
       const response = await axios.post('/api/v1/paper/sell', orderData);
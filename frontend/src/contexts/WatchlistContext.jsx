@@ -20,7 +20,28 @@ export const WatchlistProvider = ({ children }) => {
   
   // Store stock data fetched from backend
   const [stockData, setStockData] = useState({});
+  // True while the live price WebSocket is connected (polling is only a fallback then)
+  const [streaming, setStreaming] = useState(false);
   
+  // Fetch quotes for many tickers with one batch request, keyed by ticker
+  const fetchQuotes = async (tickers) => {
+    const newDataCache = {};
+    if (tickers.length === 0) return newDataCache;
+    try {
+      const response = await axios.get('/api/stocks/quotes', { params: { tickers: tickers.join(',') } });
+      for (const quote of response.data) {
+        newDataCache[quote.ticker] = quote;
+      }
+    } catch (error) {
+      console.warn('Failed to fetch stock quotes:', error);
+      // Keep existing data if available, or set to null
+      for (const ticker of tickers) {
+        newDataCache[ticker] = stockData[ticker] || null;
+      }
+    }
+    return newDataCache;
+  };
+
   const fetchWatchlists = async () => {
     setLoading(true);
     try {
@@ -35,20 +56,8 @@ export const WatchlistProvider = ({ children }) => {
       const allStocks = fetchedWatchlists.flatMap(wl => wl.stocks || []);
       const uniqueTickers = [...new Set(allStocks.map(stock => stock.ticker))];
       
-      // Fetch stock data from backend for each ticker
-      const newDataCache = {};
-      for (const ticker of uniqueTickers) {
-        try {
-          const stockResponse = await axios.get(`/api/stocks/${ticker}/data`);
-          newDataCache[ticker] = stockResponse.data;
-        } catch (error) {
-          console.warn(`Failed to fetch data for ${ticker}:`, error);
-          // Keep existing data if available, or set to null
-          newDataCache[ticker] = stockData[ticker] || null;
-        }
-      }
-      
-      setStockData(newDataCache);
+      // Fetch stock data for all tickers in one request
+      setStockData(await fetchQuotes(uniqueTickers));
       console.log("Stock data cache populated from backend.");
 
     } catch (error) {
@@ -202,9 +211,10 @@ export const WatchlistProvider = ({ children }) => {
   };
   
   // Get stock chart data from backend API
-  const getStockChart = async (ticker, period = '1M') => {
+  // resolution: 'day', 'week' or 'month' bars
+  const getStockChart = async (ticker, period = '1M', resolution = 'day') => {
     try {
-      const response = await axios.get(`/api/stocks/${ticker}/chart?period=${period}`);
+      const response = await axios.get(`/api/stocks/${ticker}/chart?period=${period}&resolution=${resolution}`);
       return { success: true, data: response.data };
     } catch (error) {
       return { 
@@ -219,19 +229,7 @@ export const WatchlistProvider = ({ children }) => {
     const allStocks = watchlists.flatMap(wl => wl.stocks || []);
     const uniqueTickers = [...new Set(allStocks.map(stock => stock.ticker))];
     
-    const newDataCache = {};
-    for (const ticker of uniqueTickers) {
-      try {
-        const stockResponse = await axios.get(`/api/stocks/${ticker}/data`);
-        newDataCache[ticker] = stockResponse.data;
-      } catch (error) {
-        console.warn(`Failed to refresh data for ${ticker}:`, error);
-        // Keep existing data if available
-        newDataCache[ticker] = stockData[ticker] || null;
-      }
-    }
-    
-    setStockData(newDataCache);
+    setStockData(await fetchQuotes(uniqueTickers));
   };
 
   useEffect(() => {
@@ -240,11 +238,39 @@ export const WatchlistProvider = ({ children }) => {
     }
   }, [authLoading, user]);
 
+  // Live quotes: the backend pushes every tick for the subscribed tickers
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    const tickers = [...new Set(watchlists.flatMap(wl => wl.stocks || []).map(stock => stock.ticker))];
+    if (!user || !token || tickers.length === 0) return;
+
+    const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(
+      `${protocol}://${window.location.host}/ws/prices?token=${encodeURIComponent(token)}&tickers=${tickers.join(',')}`
+    );
+    socket.onopen = () => setStreaming(true);
+    socket.onclose = () => setStreaming(false);
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type !== 'prices' && message.type !== 'snapshot') return;
+      setStockData(prev => {
+        const next = { ...prev };
+        for (const quote of message.data) {
+          next[quote.ticker] = { ...prev[quote.ticker], ...quote };
+        }
+        return next;
+      });
+    };
+
+    return () => socket.close();
+  }, [user, watchlists]);
+
   const value = {
     watchlists,
     loading,
     aiBriefing,
     stockData, // Expose the cached stock data
+    streaming,
     fetchWatchlists,
     createWatchlist,
     updateWatchlist,
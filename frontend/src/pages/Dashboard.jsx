@@ -25,7 +25,8 @@ const Dashboard = () => {
     stockData,
     fetchAiBriefing, 
     deleteWatchlist,
-    refreshStockData
+    refreshStockData,
+    streaming
   } = useWatchlist();
   const { user } = useAuth();
   const [showCreateModal, setShowCreateModal] = useState(false);
@@ -37,16 +38,16 @@ const Dashboard = () => {
     }
   }, [watchlists, aiBriefing, fetchAiBriefing]);
 
-  // Real-time polling: refresh stock data every 3 seconds
+  // Real-time polling fallback: refresh stock data every 3 seconds when the live stream is down
   useEffect(() => {
-    if (watchlists.length === 0) return;
+    if (watchlists.length === 0 || streaming) return;
 
     const interval = setInterval(() => {
       refreshStockData();
     }, 3000); // 3 seconds
 
     return () => clearInterval(interval);
-  }, [watchlists, refreshStockData]);
+  }, [watchlists, refreshStockData, streaming]);
 
   const handleDeleteWatchlist = async (id) => {
     setDeletingId(id);
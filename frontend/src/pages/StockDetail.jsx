@@ -89,7 +89,9 @@ const StockDetail = () => {
     if (isInitialLoad) {
       setLoadingChart(true);
     }
-    const result = await getStockChart(ticker, selectedPeriod);
+    // A year of daily bars is more points than the chart can show; use weekly bars instead
+    const resolution = selectedPeriod === '1Y' ? 'week' : 'day';
+    const result = await getStockChart(ticker, selectedPeriod, resolution);
     if (result.success) {
       setChartData(result.data);
     } else {
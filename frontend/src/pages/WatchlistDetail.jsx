@@ -21,7 +21,8 @@ const WatchlistDetail = () => {
     // 1. GET THE GLOBAL stockData CACHE FROM CONTEXT
     stockData: globalStockData, 
     removeStockFromWatchlist,
-    refreshStockData
+    refreshStockData,
+    streaming
   } = useWatchlist(); 
   
   const [watchlist, setWatchlist] = useState(null);
@@ -39,16 +40,16 @@ const WatchlistDetail = () => {
     setLoading(false); 
   }, [watchlists, id]);
 
-  // Real-time polling: refresh stock data every 3 seconds
+  // Real-time polling fallback: refresh stock data every 3 seconds when the live stream is down
   useEffect(() => {
-    if (!watchlist || !watchlist.stocks || watchlist.stocks.length === 0) return;
+    if (!watchlist || !watchlist.stocks || watchlist.stocks.length === 0 || streaming) return;
 
     const interval = setInterval(() => {
       refreshStockData();
     }, 3000); // 3 seconds
 
     return () => clearInterval(interval);
-  }, [watchlist, refreshStockData]);
+  }, [watchlist, refreshStockData, streaming]);
 
   // 3. REMOVE useEffect THAT FETCHED DATA LOCALLY - Context already handles it
   // useEffect(() => {